@@ -1,32 +1,149 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
+import time
+started_at = time.monotonic()  # /ready reports startup from here
+import eventlet
+eventlet.monkey_patch()  # Make requests/socket calls cooperative so green threads can overlap
+
+from flask import Flask, render_template, request, jsonify, send_file, redirect
+from flask_socketio import SocketIO, emit, join_room
 from flask_cors import CORS
 import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from bs4 import BeautifulSoup
-import time
-import re
 import os
-
-import json
+from urllib.parse import urlparse, urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
+
+import itertools
+import functools
+import atexit
+from collections import deque
+import http_client
+import shopify_json
+from change_tracker import ChangeTracker
+from product_store import ProductStore
+import shopify_bulk
+from shopify_bulk import ShopifyBulkClient
+from upload_scheduler import UploadScheduler, LeakyBucket, rest_call_limit
+from crawl_limiter import AdaptiveLimiter
+from catalog_mirror import CatalogMirror, numeric_id
+from scrape_jobs import JobManager
+from product_page import HTML_PARSER, ParsePool, ParseError, load_parser
+import site_adapters
+import sitemap
+from browser_pool import BrowserPool, BrowserUnavailable
+from socket_emitter import BatchEmitter, ThrottledEmitter, compact
+import socket_queue
+from image_store import ImageStore, ImageStoreError, pillow
+from image_proxy import ImageProxy
 
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-time.sleep(4)
-
-# Global variable to store scraped data
-scraped_data = []
+# Several workers can run behind a load balancer with sticky sessions (Engine.IO long-polling needs every request
+# of a session on the same worker). They share emits, rooms and broadcasts through SOCKETIO_MESSAGE_QUEUE:
+# redis://, kafka://, zmq+tcp:// or a kombu URL (amqp://...), or memory:// / local://host:port (see socket_queue)
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    **socket_queue.socketio_options(app.config['SOCKETIO_MESSAGE_QUEUE']))
+# Names this worker's scrape jobs in the shared database, keep it stable across restarts so they resume here
+app.config['WORKER_ID'] = os.environ.get('WORKER_ID', 'default')
 
 
 # When user click scraped product's image, user can change product image
-UPLOAD_FOLDER = 'static/uploads/'  # Folder where uploaded images are saved
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'static/uploads/')  # Folder where uploaded images are saved
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Uploaded images are content-addressed, THUMBNAIL_SIZE is the box thumbnails are fitted into (needs Pillow)
+app.config['THUMBNAIL_SIZE'] = int(os.environ.get('THUMBNAIL_SIZE', 96))
+image_store = ImageStore(app.config['UPLOAD_FOLDER'], (app.config['THUMBNAIL_SIZE'], app.config['THUMBNAIL_SIZE']))
+
+# Requests a store gets at once when a scrape starts. From there it adapts (see crawl_limiter): up while the
+# store answers quickly, halved on 429s, 5xx or slow responses, never past SCRAPE_MAX_CONCURRENCY (or the
+# concurrency in the store's site adapter). SCRAPE_ADAPTIVE=0 keeps it fixed, Retry-After is honoured either way
+# It is never halved below SCRAPE_MIN_CONCURRENCY, by default the starting value: the Retry-After pause already
+# backs off from a store that throttles, set it lower for stores that can't take SCRAPE_CONCURRENCY at all
+app.config['SCRAPE_CONCURRENCY'] = int(os.environ.get('SCRAPE_CONCURRENCY', 8))
+app.config['SCRAPE_MIN_CONCURRENCY'] = int(os.environ.get('SCRAPE_MIN_CONCURRENCY', app.config['SCRAPE_CONCURRENCY']))
+app.config['SCRAPE_MAX_CONCURRENCY'] = int(os.environ.get('SCRAPE_MAX_CONCURRENCY', 32))
+app.config['SCRAPE_ADAPTIVE'] = os.environ.get('SCRAPE_ADAPTIVE', '1') == '1'
+app.config['SCRAPE_RETRIES'] = int(os.environ.get('SCRAPE_RETRIES', 3))  # Per request, for 429, 5xx and network errors
+
+# Extra site adapters (selectors, field map, limits per store), a JSON list, see site_adapters.py
+app.config['SITE_ADAPTERS'] = os.environ.get('SITE_ADAPTERS')
+if app.config['SITE_ADAPTERS']:
+    site_adapters.load(app.config['SITE_ADAPTERS'])
+
+# One adaptive concurrency (and optional rate) limit per site, shared by every job crawling it, so a slow
+# store only ever holds up its own requests
+site_limiters = {}
+
+# Read products from Shopify's products.json / .js endpoints instead of scraping HTML (set to 0 to disable)
+app.config['SHOPIFY_JSON'] = os.environ.get('SHOPIFY_JSON', '1') == '1'
+# Also fetch /products/<handle>.js per product: one extra request each, but products.json has no barcodes
+# (SHOPIFY_JSON_DETAILS=0 skips it, products then come without them)
+app.config['SHOPIFY_JSON_DETAILS'] = os.environ.get('SHOPIFY_JSON_DETAILS', '1') == '1'
+
+# Re-scrapes only emit new, changed and removed products (INCREMENTAL_SCRAPE=0 to always send everything)
+app.config['INCREMENTAL_SCRAPE'] = os.environ.get('INCREMENTAL_SCRAPE', '1') == '1'
+app.config['FINGERPRINTS_PATH'] = os.environ.get('FINGERPRINTS_PATH', 'fingerprints.json')
+change_tracker = ChangeTracker(app.config['FINGERPRINTS_PATH'])
+
+# Scraped products are kept in SQLite so they survive restarts and can be looked up by id, SKU, barcode, brand or store
+app.config['PRODUCT_DB'] = os.environ.get('PRODUCT_DB', 'products.db')
+product_store = ProductStore(app.config['PRODUCT_DB'])
+
+# Shopify Admin API used by /upload-bulk, SHOPIFY_ADMIN_URL is https://<store>.myshopify.com (or a local mock)
+app.config['SHOPIFY_ADMIN_URL'] = os.environ.get('SHOPIFY_ADMIN_URL')
+app.config['SHOPIFY_ACCESS_TOKEN'] = os.environ.get('SHOPIFY_ACCESS_TOKEN')
+app.config['SHOPIFY_LOCATION_ID'] = os.environ.get('SHOPIFY_LOCATION_ID')  # Needed to set inventory quantities
+
+# Local mirror of the destination store's catalog, lets uploads create/update/skip without a remote lookup
+app.config['CATALOG_MIRROR_DB'] = os.environ.get('CATALOG_MIRROR_DB', app.config['PRODUCT_DB'])
+catalog_mirror = CatalogMirror(app.config['CATALOG_MIRROR_DB'])
+
+# Size the shared connection pool to match how many pages we may fetch at once
+http_client.configure(pool_size=max(app.config['SCRAPE_CONCURRENCY'], app.config['SCRAPE_MAX_CONCURRENCY']))
+
+# Keep fetched pages on disk and revalidate them with ETag / Last-Modified on the next scrape (HTTP_CACHE=0 to disable)
+app.config['HTTP_CACHE_DIR'] = os.environ.get('HTTP_CACHE_DIR', 'http_cache')
+app.config['HTTP_CACHE_MAX_MB'] = int(os.environ.get('HTTP_CACHE_MAX_MB', 500))
+if os.environ.get('HTTP_CACHE', '1') == '1':
+    http_client.enable_cache(app.config['HTTP_CACHE_DIR'], app.config['HTTP_CACHE_MAX_MB'] * 1024 * 1024)
+
+# Serve scraped product images from a local cache instead of hotlinking the source CDN (IMAGE_PROXY=0 to disable)
+# Images are prefetched as products are scraped, IMAGE_PROXY_CONCURRENCY downloads at a time
+app.config['IMAGE_PROXY'] = os.environ.get('IMAGE_PROXY', '1') == '1'
+app.config['IMAGE_PROXY_DIR'] = os.environ.get('IMAGE_PROXY_DIR', 'image_cache')
+app.config['IMAGE_PROXY_MAX_MB'] = int(os.environ.get('IMAGE_PROXY_MAX_MB', 200))
+app.config['IMAGE_PROXY_CONCURRENCY'] = int(os.environ.get('IMAGE_PROXY_CONCURRENCY', 4))
+app.config['IMAGE_PROXY_TTL'] = int(os.environ.get('IMAGE_PROXY_TTL', 24 * 3600))
+image_proxy = ImageProxy(app.config['IMAGE_PROXY_DIR'], app.config['IMAGE_PROXY_MAX_MB'] * 1024 * 1024,
+                         app.config['IMAGE_PROXY_CONCURRENCY'], app.config['IMAGE_PROXY_TTL']) if app.config['IMAGE_PROXY'] else None
+
+def site_limiter(adapter):
+    if adapter.name not in site_limiters:
+        if app.config['SCRAPE_ADAPTIVE']:
+            maximum = adapter.concurrency or app.config['SCRAPE_MAX_CONCURRENCY']
+            initial = min(app.config['SCRAPE_CONCURRENCY'], maximum)
+            minimum = min(app.config['SCRAPE_MIN_CONCURRENCY'], initial)
+        else:
+            minimum = initial = maximum = adapter.concurrency or app.config['SCRAPE_CONCURRENCY']
+        site_limiters[adapter.name] = AdaptiveLimiter(initial, minimum, maximum, adapter.rate, app.config['SCRAPE_RETRIES'])
+    return site_limiters[adapter.name]
+
+# Green threads a scrape of the site keeps busy, enough for the most its limiter will allow
+def site_concurrency(adapter):
+    return site_limiter(adapter).maximum
+
+# Make one request to the site, fn(*args) in one of its slots, retried when the site throttles or fails
+def site_call(adapter, fn, *args, **kwargs):
+    return site_limiter(adapter).call(fn, *args, **kwargs)
+
+# Every browser sends a stable operator id, its room gets that operator's scrape output whichever worker runs the job
+def operator_room(operator_id):
+    return f'operator:{operator_id}' if operator_id else None
 
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
+    room = operator_room(request.args.get('operator'))
+    if room:
+        join_room(room)
     emit('message', {'message': 'Welcome to the chat!'}, broadcast=True)
 
 @socketio.on('disconnect')
@@ -38,29 +155,6 @@ def handle_message(data):
     print(f'Message received: {data}')
     emit('message', {'message': data}, broadcast=True)
 
-# Configure retries and timeout
-def requests_retry_session(
-    retries=3,
-    backoff_factor=0.3,
-    status_forcelist=(500, 502, 504),
-    session=None,
-):
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
-}
-
 @app.route('/upload-image', methods=['POST'])
 def upload_image():
     if 'image' not in request.files:
@@ -71,119 +165,121 @@ def upload_image():
         return jsonify({"success": False, "message": "No selected file"})
 
     if file:
-        filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Stored under its content hash, an image uploaded before is not written again
+        try:
+            name, deduplicated = image_store.save(file.stream)
+        except ImageStoreError as e:
+            return jsonify({"success": False, "message": str(e)})
 
-        image_url = f"/{UPLOAD_FOLDER}/{filename}"  # Assuming you serve static files from this folder
-        return jsonify({"success": True, "imageUrl": image_url})
+        return jsonify({"success": True, "imageUrl": f"/images/{name}", "thumbnailUrl": f"/images/thumb/{name}",
+                        "deduplicated": deduplicated})
 
     return jsonify({"success": False, "message": "Upload failed"})
 
-# Function to scrape product data from USG Store
-def scrape_product(url, brand):
-    session = requests.Session()
-    retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504])
-    session.mount('https://', HTTPAdapter(max_retries=retries))
 
+# Stored images never change (the name is the content hash), so browsers can keep them forever
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def send_immutable(path):
+    response = send_file(path, conditional=True, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/images/<name>')
+def stored_image(name):
+    if not image_store.exists(name):
+        return jsonify({'error': 'Image not found'}), 404
+    return send_immutable(image_store.path(name))
+
+@app.route('/images/thumb/<name>')
+def stored_thumbnail(name):
+    if not image_store.exists(name):
+        return jsonify({'error': 'Image not found'}), 404
+    if not image_store.has_thumbnail(name):
+        # Still being made (or no Pillow): send the original but don't let it be cached as the thumbnail
+        image_store.make_thumbnail(name)
+        response = send_file(image_store.path(name), conditional=True)
+        response.cache_control.no_cache = True
+        return response
+    return send_immutable(image_store.thumbnail_path(name))
+
+# A scraped image from the local cache, ?w= resizes it (rounded up to one of the cached widths)
+@app.route('/image-proxy/<key>')
+def proxied_image(key):
+    if image_proxy is None or not image_proxy.known(key):
+        return jsonify({'error': 'Image not found'}), 404
+    try:
+        width = int(request.args['w']) if request.args.get('w') else None
+    except ValueError:
+        return jsonify({'error': 'w must be a number'}), 400
+    path = image_proxy.path(key, width)
+    if path is None:
+        # The origin couldn't be reached (or refused), let the browser try it directly
+        return redirect(image_proxy.url(key))
+    return send_file(path, mimetype=image_proxy.mimetype(key), conditional=True, max_age=image_proxy.max_age(key))
+
+# Table thumbnail for a scraped image URL, the URL itself when the proxy is off or it isn't a remote image
+def proxied_thumbnail(url):
+    key = image_proxy.register(url) if image_proxy else None
+    if key is None:
+        return url
+    return f"/image-proxy/{key}?w={app.config['THUMBNAIL_SIZE']}"
+
+# Download a product page, returns the response so the body can be parsed without fetching it again
+def fetch_product_page(url):
+    return http_client.get(url)
+
+# Build only the title (h3), color (h4) and thumbnail slider out of a product page (set FAST_PARSE=0 for the full tree)
+app.config['FAST_PARSE'] = os.environ.get('FAST_PARSE', '1') == '1'
+
+# Product pages are parsed in a process pool (one worker per core by default, 0 parses in-process)
+# so BeautifulSoup doesn't block the eventlet loop and parsing scales with the cores
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1))
+parse_pool = ParsePool(app.config['PARSE_WORKERS'])
+
+# Last parse timings (seconds) per product page, exposed through /stats
+parse_timings = deque(maxlen=1000)
+
+def record_parse_time(title, seconds):
+    parse_timings.append({'title': title, 'seconds': round(seconds, 4)})
+
+# Function to scrape product data from USG Store
+# `page` can be an already fetched response, the raw page bytes/text, or a URL (fetched here)
+def scrape_product(page, brand, adapter=None):
     # Initialize an empty product dictionary to avoid UnboundLocalError
     product = {}
-    variants = []  # To store variants/sub-products
 
     try:
-        response = session.get(url)
-        response.raise_for_status()  # Raise an error for invalid responses
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Scraping product details
-        product['Title'] = soup.find('h3').get_text(strip=True)  # Assuming h3 is for product title
-        product['Brand'] = brand  
-        product['Color'] = soup.find('h4').get_text(strip=True)  # Assuming color is in h4
-        
-        product['Material'] = 'Leather'
-        product['Age group'] = 'Adult'
-
-        # Check if there is embedded JavaScript containing product data
-        script_tag = soup.find('script', text=re.compile('new Shopify\\.OptionSelectors'))
-        
-        if script_tag:
-            # Extract the text of the script tag
-            script_content = script_tag.string
-
-            # Use regex to find specific product fields like 'SKU', 'Size', etc.
-            size_match = re.search(r'"Size":"(.*?)"', script_content)
-            sku_match = re.search(r'"sku":"(.*?)"', script_content)
-            barcode_match = re.search(r'"barcode":"(.*?)"', script_content)
-            weight_match = re.search(r'"weight":(\d+)', script_content)
-            quantity_match = re.search(r'"inventory_quantity":(\d+)', script_content)
-            id_match = re.search(r'"id":(\d+)', script_content)
-            gender_match = re.search(r'"type":"(.*?)"', script_content)
-
-            # Extract and store the found values
-            product['Size'] = size_match.group(1) if size_match else 'Size not found'
-            product['SKU'] = sku_match.group(1) if sku_match else 'SKU not found'
-            product['Barcode'] = barcode_match.group(1) if barcode_match else 'Barcode not found'
-            product['Weight'] = weight_match.group(1) if weight_match else 'Weight not found'
-            product['Quantity'] = quantity_match.group(1) if quantity_match else 'Quantity not found'
-            product['id'] = id_match.group(1) if id_match else 'ID not found'
-            product['Gender'] = gender_match.group(1) if gender_match else 'gender not found'
-
-            # Add variants logic
-            product_data_match = re.search(r'product:\s*(\{.*\})', script_content)
-            if product_data_match:
-                product_data_json = product_data_match.group(1)
-                product_data = json.loads(product_data_json)
-
-                # Add the original product details
-                product['id'] = product_data.get('id', 'ID not found')
-                
-                # Loop through each variant to extract its specific details
-                for variant in product_data['variants']:
-                    variant_data = {
-
-                        'Size': variant.get('option2', 'Size not found'),
-                        'ID': variant.get('id', 'ID not found'),
-                        'SKU': variant.get('sku', 'SKU not found'),
-                        'Barcode': variant.get('barcode', 'Barcode not found'),
-                        'Quantity': variant.get('inventory_quantity', 'Quantity not found'),
-                        'Weight': variant.get('weight', 'Weight not found')
-                        
-                    }
-                    variants.append(variant_data)
-
+        url = None
+        if isinstance(page, requests.Response):
+            page.raise_for_status()  # Raise an error for invalid responses
+            content = page.content
+            url = page.url
+        elif isinstance(page, str) and page.startswith(('http://', 'https://')):
+            response = fetch_product_page(page)
+            response.raise_for_status()  # Raise an error for invalid responses
+            content = response.content
+            url = page
         else:
-            print('No JavaScript object found containing product details')
-
-        # Add variants to the main product dictionary
-        product['Variants'] = variants
-
-        # Find the main div containing the thumbnail images
-        thumbnail_slider = soup.find('div', class_='product-thumbnail-slider')
-
-        if thumbnail_slider:
-            # Get all the divs with class 'thumbnail-slide'
-            thumbnail_slides = thumbnail_slider.find_all('div', class_='thumbnail-slide')
-
-            # Check if there are at least two images
-            if len(thumbnail_slides) >= 2:
-                # Get the second image
-                second_image = thumbnail_slides[1].find('img')
-
-                if second_image and 'src' in second_image.attrs:
-                    img_src = second_image['src']
-
-                    # If the src starts with '//', add the https: prefix
-                    if img_src.startswith('//'):
-                        img_src = 'https:' + img_src
-                    product['Image'] = img_src
-                    
-                    print(f'Second image URL: {img_src}')
-                else:
-                    print('Second image not found')
-            else:
-                print('Less than two images found')
-        else:
-            print('No thumbnail slider found')
+            content = page
+
+        adapter = adapter or site_adapters.adapter_for(url)
+        try:
+            product, parse_seconds = parse_pool.parse(content, brand, app.config['FAST_PARSE'], adapter)
+        except ParseError as e:
+            if not (url and browser_pool):
+                raise
+            print(f"Static parse failed for {url}: {e}")
+            product = None
+        if needs_rendering(product) and url and browser_pool:
+            try:
+                product, parse_seconds = render_product_page(url, brand, adapter)
+            except Exception as e:
+                if product is None:
+                    raise
+                # No browser, or the render failed: what the static page had beats nothing
+                print(f"Could not render {url}, keeping the static page's data: {e}")
+        record_parse_time(product.get('Title'), parse_seconds)
 
         # Return the complete product dictionary
         print(f"Scraped product: {product}")
@@ -194,22 +290,54 @@ def scrape_product(url, brand):
         return None
 
 
-        
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching URL: {e}")
-        # Store the error message in the product dictionary
-        product['Error'] = str(e)
-
-    return product
+# Pages whose product data only appears once their JavaScript runs are rendered in a pooled headless Chrome,
+# only when the static parse comes back without it (BROWSER_FALLBACK=0 to disable)
+app.config['BROWSER_FALLBACK'] = os.environ.get('BROWSER_FALLBACK', '1') == '1'
+app.config['BROWSER_POOL_SIZE'] = int(os.environ.get('BROWSER_POOL_SIZE', 2))
+app.config['CHROMEDRIVER_PATH'] = os.environ.get('CHROMEDRIVER_PATH')  # Default: let Selenium find one
+app.config['BROWSER_PAGE_TIMEOUT'] = int(os.environ.get('BROWSER_PAGE_TIMEOUT', 20))
+browser_pool = BrowserPool(app.config['BROWSER_POOL_SIZE'], app.config['CHROMEDRIVER_PATH'],
+                           app.config['BROWSER_PAGE_TIMEOUT']) if app.config['BROWSER_FALLBACK'] else None
+if browser_pool:
+    atexit.register(browser_pool.close)
+
+# The inline product script sets SKU, without it the page is missing the product data
+def needs_rendering(product):
+    return product is None or 'SKU' not in product
+
+# Render `url` in the browser pool and parse the result like a static page
+# The render takes one of the site's slots like any other request (and waits out its pauses and rate limit),
+# but says nothing about the store's latency: most of its time goes on Chrome running the page's scripts
+def render_product_page(url, brand, adapter):
+    limiter = site_limiter(adapter)
+    limiter.acquire()
+    try:
+        content = browser_pool.render(url, wait_for=adapter.wait_for)
+    except BrowserUnavailable as e:
+        raise ParseError(f'No product data in the static page and no browser to render it: {e}')
+    finally:
+        limiter.release()
+    print(f"Rendered {url} in a headless browser")
+    return parse_pool.parse(content, brand, app.config['FAST_PARSE'], adapter)
 
 
 # Shopify API integration (assuming shopify package is already installed and configured)
+# The Shopify SDK is imported on first upload (or by warm_up) so it isn't in the way of startup
 def connect_to_shopify(api_key, password, store_url):
+    import shopify
     shop_url = f"https://{api_key}:{password}@{store_url}.myshopify.com/admin"
     shopify.ShopifyResource.set_site(shop_url)
 
 def upload_to_shopify(product_data, sku, shipping_info):
+    import shopify
+    # Check the local mirror of the store first so re-uploading a SKU updates or skips instead of duplicating it
+    action, existing_id, changes = catalog_mirror.plan(product_data, sku)
+    if action == 'skip':
+        print(f"{product_data['Title']} is already up to date in Shopify")
+        return shopify.Product({'id': numeric_id(existing_id)})
+    if action == 'update':
+        return update_in_shopify(existing_id, changes, product_data, sku)
+
     new_product = shopify.Product()
     new_product.title = product_data['Title']
     new_product.body_html = product_data['Product detail']
@@ -223,12 +351,17 @@ def upload_to_shopify(product_data, sku, shipping_info):
     new_product.variants = [{
         'price': '199.99',  # Example price
         'sku': product_sku,
-        'barcode': product_data['GTIN/UPC/barcode'],
+        'barcode': product_data.get('GTIN/UPC/barcode', product_data.get('Barcode')),
         'weight': product_data['Weight'],
         'inventory_quantity': product_data['Quantity'],
         'size': product_data['Size']
     }]
-    new_product.save()
+    shopify_call(new_product.save)
+    catalog_mirror.record(
+        f'gid://shopify/Product/{new_product.id}', product_data, sku,
+        variant_ids={v.sku: f'gid://shopify/ProductVariant/{v.id}' for v in new_product.variants if getattr(v, 'sku', None)},
+        handle=getattr(new_product, 'handle', None),
+    )
 
     # Set shipping and return policies as metafields
     metafields = [
@@ -253,17 +386,85 @@ def upload_to_shopify(product_data, sku, shipping_info):
     ]
 
     for metafield in metafields:
-        new_product.add_metafield(metafield)
+        shopify_call(new_product.add_metafield, metafield)
 
     return new_product
 
 
+# Send only what the catalog mirror says changed for a product that already exists in Shopify
+def update_in_shopify(existing_id, changes, product_data, sku):
+    import shopify
+    product = shopify.Product({'id': numeric_id(existing_id)})
+    if any(field in changes for field in ('title', 'body_html', 'vendor')):
+        for field in ('title', 'body_html', 'vendor'):
+            if field in changes:
+                setattr(product, field, changes[field])
+        shopify_call(product.save)
+
+    variant_ids = {}
+    store_variants = None
+    for variant_sku, fields in changes.get('variants', {}).items():
+        variant_id = fields.get('id') or ''
+        if not variant_id.startswith('gid://'):
+            # A new size, or one the mirror only has a placeholder id for: look for it by SKU before creating it
+            if store_variants is None:
+                found = shopify_call(shopify.Variant.find, product_id=product.id)
+                store_variants = {v.sku: v.id for v in found if getattr(v, 'sku', None)}
+            if variant_sku in store_variants:
+                variant_id = f'gid://shopify/ProductVariant/{store_variants[variant_sku]}'
+        if variant_id.startswith('gid://'):
+            variant = shopify.Variant({'id': numeric_id(variant_id), 'product_id': product.id})
+        else:
+            variant = shopify.Variant({'product_id': product.id, 'sku': variant_sku, 'option1': variant_sku, 'price': '199.99'})
+        if fields.get('barcode'):
+            variant.barcode = fields['barcode']
+        if fields.get('weight_grams') is not None:
+            variant.weight = fields['weight_grams']
+            variant.weight_unit = 'g'
+        shopify_call(variant.save)
+        variant_ids[variant_sku] = f'gid://shopify/ProductVariant/{variant.id}'
+
+    catalog_mirror.record(existing_id, product_data, sku, variant_ids=variant_ids)
+    return product
+
+
+def upload_finished(args, uploaded_product, error):
+    product_data = args[0]
+    if error or not uploaded_product:
+        socketio.emit('update', {'message': f"Upload failed for {product_data.get('Title')}: {error}"})
+    else:
+        socketio.emit('update', {'message': 'Upload completed!'})
+
+
+# Uploads run on a worker pool paced by Shopify's call limit header, every REST call goes through shopify_call
+upload_queue = UploadScheduler(
+    upload_to_shopify,
+    workers=int(os.environ.get('UPLOAD_WORKERS', 4)),
+    after_call=lambda bucket: bucket.update_from_call_limit(rest_call_limit()),
+    on_done=upload_finished,
+)
+
+# One REST call of an upload, paced by the bucket and retried on its own when Shopify answers 429
+def shopify_call(fn, *args, **kwargs):
+    return upload_queue.call(fn, *args, **kwargs)
+
+
 @app.route('/upload', methods=['POST'])
 def upload_product():
     data = request.json
     product_data = data.get('product')  # Get the specific product data
     sku = data.get('sku')
 
+    # Without the product itself, look it up in the product store by id or SKU
+    if product_data is None:
+        if data.get('product_id'):
+            product_data = product_store.get(data['product_id'], data.get('store'))
+        elif sku:
+            matches = product_store.find_by_sku(sku)
+            product_data = matches[0] if matches else None
+        if product_data is None:
+            return jsonify({'status': 'failed', 'message': 'Product not found'}), 404
+
     # Emit real-time updates
     socketio.emit('update', {'message': 'Uploading to Shopify...'})
 
@@ -280,13 +481,173 @@ def upload_product():
         'Returns and refunds policy': 'Returns accepted within 30 days.'
     }
 
-    # Upload product to Shopify
-    uploaded_product = upload_to_shopify(product_data, sku, shipping_info)
-    if uploaded_product:
-        socketio.emit('update', {'message': 'Upload completed!'})
-        return jsonify({'status': 'success'})
+    # Queue the upload, workers send it as soon as Shopify's call limit allows
+    upload_id = upload_queue.submit(product_data, sku, shipping_info)
+    return jsonify({'status': 'queued', 'upload_id': upload_id, 'queue_depth': upload_queue.queue.qsize()}), 202
+
+
+# Where a queued upload is: queued, running, done (with the Shopify product id) or failed (with the error)
+@app.route('/upload/<upload_id>')
+def upload_status(upload_id):
+    upload = upload_queue.status(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    product = upload['result']
+    return jsonify({'upload_id': upload_id, 'status': upload['status'], 'error': upload['error'],
+                    'product_id': getattr(product, 'id', None) if product is not None else None})
+
+
+# Scraper statistics for operators
+@app.route('/stats')
+def stats():
+    timings = sorted(t['seconds'] for t in parse_timings)
+    parse = {'pages': len(timings), 'pool': parse_pool.stats()}
+    if timings:
+        parse.update({
+            'mean': round(sum(timings) / len(timings), 4),
+            'p50': timings[len(timings) // 2],
+            'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'max': timings[-1],
+            'parser': HTML_PARSER if app.config['FAST_PARSE'] else 'html.parser',
+            'recent': list(parse_timings)[-20:],
+        })
+    return jsonify({'parse': parse, 'http_cache': http_client.cache_stats(), 'uploads': upload_queue.stats(),
+                    'catalog_mirror': catalog_mirror.stats(), 'scrape_jobs': scrape_jobs.stats(),
+                    'emits': {'products': product_emitter.stats(), 'progress': progress_emitter.stats()},
+                    'images': image_store.stats(), 'image_proxy': image_proxy.stats() if image_proxy else None,
+                    'browser': browser_pool.stats() if browser_pool else None,
+                    'crawl': {name: limiter.stats() for name, limiter in site_limiters.items()}})
+
+
+# Stores with a site adapter, the frontend fills in each store's URL from base_url
+@app.route('/sites')
+def list_sites():
+    return jsonify({'sites': [dict(adapter.to_dict(), concurrency=site_concurrency(adapter))
+                              for adapter in site_adapters.registry.values()]})
+
+
+# Look up stored products: /products/<id>, or /products?sku=..., ?barcode=..., ?brand=...&store=...
+@app.route('/products/<product_id>')
+def get_product(product_id):
+    product = product_store.get(product_id, request.args.get('store'))
+    if product is None:
+        return jsonify({'error': 'Product not found'}), 404
+    return jsonify(product)
+
+
+# Without sku/barcode this is the product table's paged listing: ?brand=&store=&in_stock=1&sort=updated|title|brand
+# &order=desc|asc&limit=&cursor=<next_cursor of the previous page>. Rows leave out variants, get them from /products/<id>
+@app.route('/products')
+def list_products():
+    if request.args.get('sku'):
+        return jsonify({'products': product_store.find_by_sku(request.args['sku'])})
+    if request.args.get('barcode'):
+        return jsonify({'products': product_store.find_by_barcode(request.args['barcode'])})
+
+    filters = {
+        'brand': request.args.get('brand'),
+        'source_store': request.args.get('store'),
+        'in_stock': request.args.get('in_stock') in ('1', 'true'),
+    }
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        products, next_cursor = product_store.page(
+            sort=request.args.get('sort', 'updated'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            **filters,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = [compact(product, PRODUCT_FIELDS + ('store', 'variant_count')) for product in products]
+    for row in rows:
+        if row.get('Image'):
+            row['Thumbnail'] = proxied_thumbnail(row['Image'])
+    result = {'products': rows, 'next_cursor': next_cursor}
+    # The total is only needed once per listing, to size the table's scrollbar
+    if not request.args.get('cursor'):
+        result['total'] = product_store.count_matching(**filters)
+    return jsonify(result)
+
+
+# GraphQL cost budget, resynced from every response's throttleStatus
+graphql_bucket = LeakyBucket(capacity=1000, leak_rate=50.0, headroom=50)
+
+
+# Upload many stored products at once through a Shopify bulk mutation
+# Body: {"product_ids": [...], "store": ...} or {"brand": ..., "store": ..., "limit": ...}
+@app.route('/upload-bulk', methods=['POST'])
+def upload_bulk():
+    data = request.json or {}
+    if not app.config['SHOPIFY_ADMIN_URL'] or not app.config['SHOPIFY_ACCESS_TOKEN']:
+        return jsonify({'status': 'failed', 'message': 'SHOPIFY_ADMIN_URL and SHOPIFY_ACCESS_TOKEN must be set'}), 400
+
+    try:
+        limit = max(1, int(data.get('limit', 500)))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'failed', 'message': 'limit must be an integer'}), 400
+
+    if data.get('product_ids'):
+        products = [product_store.get(product_id, data.get('store')) for product_id in data['product_ids']]
+        products = [product for product in products if product]
     else:
-        return jsonify({'status': 'failed'}), 400
+        products = product_store.find(brand=data.get('brand'), source_store=data.get('store'), limit=limit)
+    if not products:
+        return jsonify({'status': 'failed', 'message': 'No products to upload'}), 404
+
+    # Define shipping and return policy
+    shipping_info = {
+        'Shipping weight': '1 kg',
+        'Shipping policy': 'Standard shipping in 5-7 business days.',
+        'Returns and refunds policy': 'Returns accepted within 30 days.'
+    }
+    client = ShopifyBulkClient(app.config['SHOPIFY_ADMIN_URL'], app.config['SHOPIFY_ACCESS_TOKEN'], bucket=graphql_bucket)
+
+    def report(operation):
+        socketio.emit('update', {'message': f"Bulk upload {operation['status'].lower()}: {operation.get('objectCount') or 0} of {len(products)} products"})
+
+    def run_bulk_upload():
+        try:
+            result = shopify_bulk.bulk_upload(client, products, shipping_info, progress=report, mirror=catalog_mirror,
+                                              location_id=app.config['SHOPIFY_LOCATION_ID'])
+        except (requests.exceptions.RequestException, shopify_bulk.ShopifyBulkError) as e:
+            print(f"Bulk upload failed: {e}")
+            socketio.emit('update', {'message': f'Bulk upload failed: {e}'})
+            return
+        counts = {status: sum(1 for r in result['results'] if r['status'] == status) for status in ('uploaded', 'updated', 'skipped', 'failed')}
+        socketio.emit('update', {
+            'message': f"Bulk upload finished: {counts['uploaded']} created, {counts['updated']} updated, "
+                       f"{counts['skipped']} unchanged, {counts['failed']} failed",
+            'bulk_upload': result['results'],
+        })
+
+    socketio.emit('update', {'message': f'Uploading {len(products)} products to Shopify...'})
+    socketio.start_background_task(run_bulk_upload)
+    return jsonify({'status': 'started', 'products': len(products)}), 202
+
+
+# Reload the local mirror of the destination store's catalog with one bulk query
+@app.route('/catalog-mirror/refresh', methods=['POST'])
+def refresh_catalog_mirror():
+    if not app.config['SHOPIFY_ADMIN_URL'] or not app.config['SHOPIFY_ACCESS_TOKEN']:
+        return jsonify({'status': 'failed', 'message': 'SHOPIFY_ADMIN_URL and SHOPIFY_ACCESS_TOKEN must be set'}), 400
+    client = ShopifyBulkClient(app.config['SHOPIFY_ADMIN_URL'], app.config['SHOPIFY_ACCESS_TOKEN'], bucket=graphql_bucket)
+
+    def run_refresh():
+        try:
+            count = catalog_mirror.refresh(client)
+        except (requests.exceptions.RequestException, shopify_bulk.ShopifyBulkError) as e:
+            print(f"Catalog mirror refresh failed: {e}")
+            socketio.emit('update', {'message': f'Catalog mirror refresh failed: {e}'})
+            return
+        socketio.emit('update', {'message': f'Catalog mirror refreshed: {count} products in the store'})
+
+    socketio.start_background_task(run_refresh)
+    return jsonify({'status': 'started'}), 202
 
 
 # Route to serve frontend
@@ -302,129 +663,393 @@ def index():
     return render_template('frontend.html', product=product)
 
 
-# Route for scraping and storing data
-@socketio.on('scrape')
-def scrape(data):
-    global scraped_data
-    print("Received scraping request: ", data)  # Add print statement for debugging
+# Find all product links on a collection page, plus the href of the next page if the page has one
+# Which links are products and where the next page link is comes from the site adapter (default: USG Store)
+def parse_collection_page(content, adapter=None):
+    from bs4 import BeautifulSoup
+    plan = (adapter or site_adapters.adapter_for()).plan()
+    soup = BeautifulSoup(content, 'html.parser')
+    products = {}
+    for item in plan.collection_links.select(soup):
+        product_url = item.get('href')
+        product_name = item.text.strip()
+        if not product_url:
+            continue
+        # Themes often link a product twice (image and title), keep one entry with whichever has the name
+        if product_url not in products or not products[product_url]['name']:
+            products[product_url] = {
+                'name': product_name,
+                'link': product_url
+            }
+    next_link = plan.next_page.select_one(soup)
+    return list(products.values()), next_link.get('href') if next_link else None
+
+def collection_links(content, adapter=None):
+    return parse_collection_page(content, adapter)[0]
+
+# Same URL with ?page=N set, used when a collection page has no explicit next link
+def with_page(url, page):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != 'page'] + [('page', str(page))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+# Lazily walk a collection page by page and yield each product link as soon as its page is read,
+# following the next link (or ?page=N) until a page brings no new products
+def iter_collection_links(collection_url, max_pages=200, adapter=None):
+    adapter = adapter or site_adapters.adapter_for(collection_url)
+    seen = set()
+    page_url = collection_url
+    for page in range(1, max_pages + 1):
+        response = site_call(adapter, http_client.get, page_url)
+        if response.status_code != 200:
+            if page == 1:
+                response.raise_for_status()
+            print(f"Stopped paginating at {page_url}: HTTP {response.status_code}")
+            return
+
+        products, next_href = parse_collection_page(response.content, adapter)
+        new_products = [p for p in products if p['link'] not in seen]
+        for product in new_products:
+            seen.add(product['link'])
+            yield product
+
+        if next_href:
+            page_url = urljoin(page_url, next_href)
+        elif new_products:
+            page_url = with_page(collection_url, page + 1)
+        else:
+            return
+
+# Walk a store's sitemap and yield its product links. With a change tracker run that has crawled this sitemap
+# completely before, products whose lastmod is older than that crawl are carried over instead of fetched
+# (products the run doesn't know yet, or listed without a lastmod, are always fetched)
+def iter_sitemap_links(sitemap_url, run=None, room=None, adapter=None):
+    adapter = adapter or site_adapters.adapter_for(sitemap_url)
+    since = run.since - sitemap.CLOCK_SLACK if run and run.since else None
+    seen = set()
+    scheduled = 0
+    for link, lastmod, title in sitemap.products(sitemap_url, functools.partial(site_call, adapter)):
+        if link in seen:
+            continue
+        seen.add(link)
+        if since and lastmod and lastmod < since and run.keep(link):
+            continue
+        scheduled += 1
+        yield {'name': title or link.rstrip('/').rsplit('/', 1)[-1], 'link': link}
+    if since:
+        message = f'{scheduled} of {len(seen)} products in the sitemap changed since the last crawl'
+    else:
+        message = f'{len(seen)} products in the sitemap'
+    print(message)
+    socketio.emit('update', {'message': message}, to=room)
+
+
+# Save a scraped product and send it to the frontend
+# With a change tracker run, unchanged products are skipped and changed ones carry a variant diff
+# `link` is the page the product came from, the tracker remembers it for sitemap crawls
+def process_product(product_data, source_store, run=None, room=None, link=None):
+    change, diff = run.check(product_data, link) if run else ('new', [])
+    if change == 'unchanged':
+        return
+    product_store.add(product_data, source_store)
+    if image_proxy:
+        image_proxy.prefetch(product_data.get('Image'))
+    emit_product(product_data, change, diff, room, source_store)
+
+
+# Fields of a product the frontend table shows
+PRODUCT_FIELDS = ('id', 'Image', 'Title', 'Brand', 'Color', 'Gender', 'Material', 'Age group', 'Size', 'SKU',
+                  'Barcode', 'Weight', 'Product detail', 'Quantity', 'Variants')
+
+# Queue one scraped product for the frontend, products go out in batches (see socket_emitter)
+def emit_product(product_data, change='new', diff=None, room=None, source_store=None):
+    print(f"Emitting data for product: {product_data['Title']} ({change})")
+    product = compact(product_data, PRODUCT_FIELDS)
+    product['Variants'] = [compact(variant) for variant in product_data.get('Variants', [])]
+    product['change'] = change
+    product['store'] = source_store
+    if product.get('Image'):
+        product['Thumbnail'] = proxied_thumbnail(product['Image'])
+    if diff:
+        product['diff'] = diff
+    product_emitter.add(product, room)
+
+
+# Tell the frontend which products disappeared since the last scrape, then that we're done
+def finish_scrape(run, source_store, room=None):
+    product_store.flush()
+    product_emitter.flush(room)
+    if run:
+        removed = run.finish()
+        if removed:
+            product_store.remove(source_store, removed)
+            socketio.emit('update', {'message': f'{len(removed)} products were removed', 'removed': removed}, to=room)
+    socketio.emit('update', {'message': 'All products have been processed.'}, to=room)
+
+
+# Scrape a collection through Shopify's products.json / .js endpoints
+# Returns False when the store doesn't serve them so the caller can fall back to HTML scraping
+def scrape_collection_json(collection_url, brand, run=None, job=None, adapter=None):
+    adapter = adapter or site_adapters.adapter_for(collection_url)
+    listing = shopify_json.collection_products(collection_url, call=functools.partial(site_call, adapter))
+    try:
+        first = next(listing, None)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"JSON endpoints not available, falling back to HTML scraping: {e}")
+        return False
+    if first is None:
+        return False
+    source_store = urlparse(collection_url).netloc
+    room = job_room(job) if job else None
+
+    # products.json has no barcodes, fetch /products/<handle>.js for each product to fill them in (SHOPIFY_JSON_DETAILS)
+    def fetch_details_and_emit(data):
+        try:
+            data = site_call(adapter, shopify_json.product_js, collection_url, data['handle'])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error fetching {data.get('handle')}.js, using listing data: {e}")
+        process_product(shopify_json.to_product(data, brand, adapter.constants), source_store, run, room)
+        if job:
+            job.mark_done(data.get('handle'))
+
+    pool = eventlet.GreenPool(site_concurrency(adapter))
+    try:
+        for data in itertools.chain([first], listing):
+            if job:
+                job.check_cancelled()
+                # Already handled before the job was interrupted
+                if job.is_done(data.get('handle')):
+                    continue
+            if app.config['SHOPIFY_JSON_DETAILS']:
+                pool.spawn_n(fetch_details_and_emit, data)
+            else:
+                process_product(shopify_json.to_product(data, brand, adapter.constants), source_store, run, room)
+                if job:
+                    job.mark_done(data.get('handle'))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error reading products.json: {e}")
+        if run:
+            run.failed = True
+        socketio.emit('update', {'message': f'Failed to read the rest of the collection: {e}'}, to=room)
+    finally:
+        pool.waitall()
+    return True
+
+
+# Scrape one collection for a background job (see scrape_jobs), skipping products its checkpoint already has
+def run_scrape(job):
+    data = job.params
     url = data.get('url')
     brand = data.get('brand')
-# Append brand-specific path to the base URL
-    if brand.lower() == 'adidas':
-        url += '/collections/adidas'
-    elif brand.lower() == 'nike':
-        url += '/collections/nike'
-    elif brand.lower() == 'jordan':
-        url += '/collections/jordan'
-    
-    # Emit real-time updates via SocketIO
-    socketio.emit('update', {'message': f'Starting to scrape {brand} products...'})
-    socketio.sleep(1) # Simulate delay
-
-     # Fetch the main product collection page
-    session = requests_retry_session()
-    response = session.get(url, headers=headers, timeout=10)
-
-    if response.status_code != 200:
-        return jsonify({'error': 'Failed to fetch the page'}), 400
-
-    soup = BeautifulSoup(response.content, 'html.parser')
+    # The store's site adapter knows where a brand's collection is and how its pages are laid out
+    adapter = site_adapters.adapter_for(url)
+    # Sitemap discovery reads the whole store from its sitemap (any .xml URL is taken to be one) instead of a collection
+    sitemap_url = None
+    if data.get('discovery') == 'sitemap' or sitemap.is_sitemap(url):
+        sitemap_url = adapter.sitemap_url(url)
+    url = sitemap_url or adapter.collection_url(url, brand)
 
-    # Find all products on the collection page
-    products = []
-    for item in soup.select('a.collection-item'):
-        product_url = item['href']
-        product_name = item.text.strip()
-        products.append({
-            'name': product_name,
-            'link': product_url
-        })
+    # Emit real-time updates via SocketIO
+    room = job_room(job)
+    socketio.emit('update', {'message': f'Starting to scrape {brand} products...', 'job_id': job.id}, to=room)
+
+    # Only send new/changed/removed products unless the client asks for everything (e.g. its table is empty)
+    run = None
+    if app.config['INCREMENTAL_SCRAPE'] and not data.get('full'):
+        run = change_tracker.begin(url)
+        # A resumed job never sees the products it finished before the restart, so it can't tell what was removed
+        run.failed = job.resumed
+
+    # Try the storefront JSON endpoints first, they return whole pages of products per request
+    # (not for sitemap crawls, those are about fetching only the few products that changed)
+    source_store = urlparse(url).netloc
+    if not sitemap_url and app.config['SHOPIFY_JSON'] and scrape_collection_json(url, brand, run, job, adapter):
+        job.check_cancelled()
+        finish_scrape(run, source_store, room)
+        return
 
     # Scrape detailed information from each product page
-    scraped_products = []
-
-    for product in products:
-        product_detail_url = f"https://usgstore.com.au{product['link']}"
-        product_response = requests.get(product_detail_url)
-
-        if product_response.status_code == 200:
-            product_data = scrape_product(product_detail_url, brand)
-            if product_data:
-                # Add the product data to the list for the final return
-                scraped_products.append(product_data)
-                print(f"Emitting data for product: {product_data['Title']}")
-                print('------------------------------------------------------------------------------------------')
-                print(product)
-                print('------------------------------------------------------------------------------------------')
-                # Emit the scraped data for each product immediately
-                socketio.emit('update', {
-                    'message': f"Scraped product: {product_data['Title']}",
-                    'product': {
-                        'Image': product_data.get('Image', 'No image found'),
-                        'Title': product_data.get('Title', 'N/A'),
-                        'Brand': product_data.get('Brand', 'N/A'),
-                        'Color': product_data.get('Color', 'N/A'),
-                        'Gender': product_data.get('Gender', 'N/A'),
-                        'Material': product_data.get('Material', 'N/A'),
-                        'Age group': product_data.get('Age group', 'N/A'),
-                        'Size': product_data.get('Size', 'N/A'),
-                        'SKU': product_data.get('SKU', 'N/A'),
-                        'Barcode': product_data.get('Barcode', 'N/A'),
-                        'Weight': product_data.get('Weight', 'N/A'),
-                        'Product detail': product_data.get('Product detail', 'N/A'),
-                        'Quantity': product_data.get('Quantity', 'N/A'),
-                        'Variants': product_data.get('Variants', [])
-                    }
-                })
-                socketio.sleep(1)
-                # return jsonify({'product':product_data})
-            else:
-                # Emit a message indicating that scraping failed for this product
-                socketio.emit('update', {'message': f"Failed to scrape product: {product['name']}"})
-                socketio.sleep(1)
-        else:
+    def fetch_and_emit(product):
+        if job.cancelled:
+            return
+        product_detail_url = urljoin(url, product['link'])
+        try:
+            product_response = site_call(adapter, fetch_product_page, product_detail_url)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching {product_detail_url}: {e}")
+            product_response = None
+
+        if product_response is None or product_response.status_code != 200:
             # Emit a message indicating that fetching the product detail page failed
-            socketio.emit('update', {'message': f"Failed to fetch product detail page for: {product['name']}"})
-            socketio.sleep(1)
-
+            socketio.emit('update', {'message': f"Failed to fetch product detail page for: {product['name']}"}, to=room)
+            if run:
+                run.failed = True
+            job.mark_done(product['link'], failed=True)
+            return
+
+        # Parse the body we already downloaded instead of fetching the page a second time
+        product_data = scrape_product(product_response, brand, adapter)
+        if product_data:
+            process_product(product_data, source_store, run, room, product_detail_url)
+            job.mark_done(product['link'])
+        else:
+            # Emit a message indicating that scraping failed for this product
+            socketio.emit('update', {'message': f"Failed to scrape product: {product['name']}"}, to=room)
+            if run:
+                run.failed = True
+            job.mark_done(product['link'], failed=True)
+
+    # Fetch and parse product pages concurrently, the site's slots keep the store from being flooded.
+    # Links are fed in while the collection is still being paged, spawn_n blocks when the pool is full
+    pool = eventlet.GreenPool(site_concurrency(adapter))
+    if sitemap_url:
+        links = iter_sitemap_links(url, run, room, adapter)
+    else:
+        links = iter_collection_links(url, adapter=adapter)
+    try:
+        for product in links:
+            job.check_cancelled()
+            if not job.is_done(product['link']):
+                pool.spawn_n(fetch_and_emit, product)
+    except (requests.exceptions.RequestException, sitemap.SitemapError) as e:
+        print(f"Error reading collection pages: {e}")
+        socketio.emit('update', {'message': f'Failed to fetch the page: {e}'}, to=room)
+        if run:
+            run.failed = True
+    finally:
+        pool.waitall()
+    job.check_cancelled()
 
     # Emit a completion message after all products are processed
-    socketio.emit('update', {'message': 'All products have been processed.'})
-    socketio.sleep(1)
+    finish_scrape(run, source_store, room)
 
 
-    # # Return all scraped data as JSON at the end of the process
-    # return jsonify({'products': scraped_products})
+# Scrape output goes to the operator (or, without an operator id, the client) that started the job.
+# A client sid doesn't survive a restart, so a resumed job without an operator broadcasts instead
+def job_room(job):
+    room = job.params.get('room')
+    if job.resumed and not str(room).startswith('operator:'):
+        return None
+    return room
 
-# Route for uploading to Shopify
-@app.route('/upload', methods=['POST'])
-def upload():
-    global scraped_data
-    data = request.json
-    sku = data.get('sku')
 
-    # Emit real-time updates
-    socketio.emit('update', {'message': 'Uploading to Shopify...'})
+# Progress is throttled per job, status changes (queued, running, done, ...) go out right away
+def report_job(job):
+    status_changed = job.status != 'running' or job.done + job.failed == 0
+    progress_emitter.emit(job.id, job.to_dict(), job_room(job), force=status_changed)
 
-    # Shopify API credentials
-    api_key = '0854d249f8b53dae6a25e2bbb0c70d78'
-    password = 'd2f7f571e9bad37267ea887a62b15432'
-    store_url = 'your_store_url'
-    connect_to_shopify(api_key, password, store_url)
 
-    # Define shipping and return policy
-    shipping_info = {
-        'Shipping weight': '1 kg',
-        'Shipping policy': 'Standard shipping in 5-7 business days.',
-        'Returns and refunds policy': 'Returns accepted within 30 days.'
-    }
+# Scraped products are sent in batches of up to EMIT_BATCH_SIZE every EMIT_INTERVAL seconds, job progress at most every PROGRESS_INTERVAL
+app.config['EMIT_BATCH_SIZE'] = int(os.environ.get('EMIT_BATCH_SIZE', 50))
+app.config['EMIT_INTERVAL'] = float(os.environ.get('EMIT_INTERVAL', 0.2))
+app.config['PROGRESS_INTERVAL'] = float(os.environ.get('PROGRESS_INTERVAL', 0.5))
+product_emitter = BatchEmitter(socketio, 'update', app.config['EMIT_BATCH_SIZE'], app.config['EMIT_INTERVAL'])
+progress_emitter = ThrottledEmitter(socketio, 'job_progress', app.config['PROGRESS_INTERVAL'])
 
-    # Upload product to Shopify
-    upload_to_shopify(scraped_data, sku, shipping_info)
-    socketio.emit('update', {'message': 'Upload completed!'})
+# Scrapes run as background jobs, SCRAPE_JOB_WORKERS of them at a time; unfinished jobs resume on startup
+app.config['SCRAPE_JOB_WORKERS'] = int(os.environ.get('SCRAPE_JOB_WORKERS', 2))
+app.config['JOBS_DB'] = os.environ.get('JOBS_DB', app.config['PRODUCT_DB'])
+scrape_jobs = JobManager(app.config['JOBS_DB'], run_scrape, workers=app.config['SCRAPE_JOB_WORKERS'], on_update=report_job,
+                         worker_id=app.config['WORKER_ID'], before_checkpoint=lambda job: product_store.flush())
 
-    return jsonify({'status': 'success'})
+
+# Route for scraping and storing data
+@socketio.on('scrape')
+def scrape(data):
+    print("Received scraping request: ", data)  # Add print statement for debugging
+    room = operator_room(request.args.get('operator')) or request.sid
+    job = submit_scrape(data, room)
+    emit('job_queued', job.to_dict())
+    return job.id
+
+
+# discovery: 'collection' (default) scrapes the brand's collection, 'sitemap' the whole store
+def submit_scrape(data, room=None):
+    return scrape_jobs.submit({'url': data.get('url'), 'brand': data.get('brand'), 'full': bool(data.get('full')),
+                               'discovery': data.get('discovery') or 'collection', 'room': room})
+
+
+@socketio.on('cancel_scrape')
+def cancel_scrape(data):
+    job = scrape_jobs.cancel(data.get('job_id'))
+    emit('job_progress', job.to_dict() if job else {'job_id': data.get('job_id'), 'error': 'Job is not running'})
+
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in scrape_jobs.list()]})
+
+
+# Start a scrape without a browser, e.g. a daily sitemap refresh from cron:
+#   curl -X POST -H 'Content-Type: application/json' -d '{"url": "https://store.example", "discovery": "sitemap"}' .../jobs
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    if not data.get('url'):
+        return jsonify({'error': 'url is required'}), 400
+    job = submit_scrape(data, operator_room(data.get('operator')))
+    return jsonify(job.to_dict()), 202
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = scrape_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job is not running'}), 404
+    return jsonify(job.to_dict())
+
+# Backends are loaded on first use so a new worker serves right away. warm_up loads them in the background
+# once the server runs, so the first scrape or upload doesn't pay for them either (WARM_UP=0 to skip it)
+app.config['WARM_UP'] = os.environ.get('WARM_UP', '1') == '1'
+startup = {'ready': False, 'worker': app.config['WORKER_ID'], 'import_seconds': None, 'warm_up_seconds': None, 'backends': {}}
+
+def load_shopify_sdk():
+    import shopify  # noqa: F401
+
+def warm_up():
+    backends = [
+        ('http_client', http_client.warm_up),
+        ('fingerprints', change_tracker.load),
+        ('html_parser', load_parser),
+        ('parse_workers', parse_pool.start),
+        ('pillow', pillow),
+        ('image_proxy', image_proxy.load if image_proxy else None),
+        ('shopify_sdk', load_shopify_sdk),
+    ]
+    for name, load in backends:
+        if load is None:
+            continue
+        load_started = time.monotonic()
+        try:
+            load()
+            startup['backends'][name] = round(time.monotonic() - load_started, 3)
+        except Exception as e:
+            startup['backends'][name] = f'{type(e).__name__}: {e}'
+            print(f"Warm-up could not load {name}: {e}")
+        eventlet.sleep(0)  # Let requests that arrived meanwhile through
+    startup['ready'] = True
+    startup['warm_up_seconds'] = round(time.monotonic() - started_at, 3)
+    print(f"Worker {app.config['WORKER_ID']} ready after {startup['warm_up_seconds']}s")
+
+# Readiness for load balancers and autoscalers: 503 until warm-up has finished, 200 after
+@app.route('/ready')
+def readiness():
+    return jsonify(startup), 200 if startup['ready'] else 503
+
+startup['import_seconds'] = round(time.monotonic() - started_at, 3)
+if app.config['WARM_UP']:
+    eventlet.spawn(warm_up)  # Runs once the server starts serving
+else:
+    startup['ready'] = True
 
 # Run the app
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
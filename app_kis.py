@@ -14,7 +14,6 @@ import json
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
 socketio = SocketIO(app, cors_allowed_origins="*")
-time.sleep(4)
 
 # Global variable to store scraped data
 scraped_data = []
@@ -1,11 +1,10 @@
 from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
+import atexit
+import os
 import time
+from browser_pool import BrowserPool
 
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
@@ -14,40 +13,38 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Global variable to store scraped data
 scraped_data = {}
 
+# Headless Chrome instances are started once and reused for every URL (see browser_pool.py)
+# CHROMEDRIVER_PATH points at a chromedriver, by default Selenium finds one for the installed Chrome
+browser_pool = BrowserPool(int(os.environ.get('BROWSER_POOL_SIZE', 2)), os.environ.get('CHROMEDRIVER_PATH'))
+atexit.register(browser_pool.close)
+
 # Function to scrape product data using Selenium
+# Selenium is imported here rather than at the top so the server starts without loading it
 def scrape_product_selenium(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Run Chrome in headless mode
-    chrome_options.add_argument("--disable-gpu")
-    
-    # Provide path to ChromeDriver
-    service = Service(executable_path="C:\\chromedriver-win64\\chromedriver-win64\\chromedriver.exe")  # Set your ChromeDriver path here
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    from selenium.webdriver.common.by import By
 
     try:
-        driver.get(url)
-        driver.implicitly_wait(10)  # Wait for elements to load
-
-        product = {}
-
-        # Scraping product details
-        title_element = driver.find_element(By.TAG_NAME, 'h3')
-        product['Title'] = title_element.text if title_element else 'No title found'
-        product['Brand'] = 'Jordan'  # Static value for this site
-
-        color_element = driver.find_element(By.TAG_NAME, 'h4')
-        product['Color'] = color_element.text if color_element else 'No color found'
-        product['Gender'] = 'Unisex'
-        product['Material'] = 'Leather'
-        product['Age group'] = 'Adult'
-
-        # Scraping image src
-        slide_div = driver.find_element(By.CSS_SELECTOR, 'div[data-slick-index="0"] img')
-        if slide_div:
-            img_src = slide_div.get_attribute('src')
-            product['Image'] = "https:" + img_src if img_src.startswith("//") else img_src
-        else:
-            product['Image'] = "No image found"
+        with browser_pool.page(url, wait_for='h3') as driver:
+            product = {}
+
+            # Scraping product details
+            title_element = driver.find_element(By.TAG_NAME, 'h3')
+            product['Title'] = title_element.text if title_element else 'No title found'
+            product['Brand'] = 'Jordan'  # Static value for this site
+
+            color_element = driver.find_element(By.TAG_NAME, 'h4')
+            product['Color'] = color_element.text if color_element else 'No color found'
+            product['Gender'] = 'Unisex'
+            product['Material'] = 'Leather'
+            product['Age group'] = 'Adult'
+
+            # Scraping image src
+            slide_div = driver.find_element(By.CSS_SELECTOR, 'div[data-slick-index="0"] img')
+            if slide_div:
+                img_src = slide_div.get_attribute('src')
+                product['Image'] = "https:" + img_src if img_src.startswith("//") else img_src
+            else:
+                product['Image'] = "No image found"
 
         print(f"Scraped product: {product}")
         return product
@@ -56,9 +53,6 @@ def scrape_product_selenium(url):
         print(f"Error occurred: {e}")
         return None
 
-    finally:
-        driver.quit()
-
 # Route to serve frontend
 @app.route('/')
 def index():
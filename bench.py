@@ -0,0 +1,485 @@
+import argparse
+import contextlib
+import html
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offline scraper benchmarks built on the usgstore.com.au/*.txt snapshots.
+#
+#   python bench.py                          run every stage and save results to bench_results/
+#   python bench.py --compare bench_results/<file>.json   also print the change against an earlier run
+#   python bench.py --stage startup          run one stage only (repeatable)
+#
+# Stages:
+#   collection_links   - product link extraction from the collection snapshots
+#   sitemap            - the same links read from a Shopify style product sitemap instead
+#   scrape_product     - field extraction from product pages (FAST_PARSE on and off)
+#   http_pipeline      - fetch + parse of a whole collection from a local stand-in store over HTTP
+#   crawl_limiter      - product pages from a stand-in store that slows down under load and answers 429 above
+#                        STORE_CAPACITY concurrent requests, at fixed concurrencies and with the adaptive limiter
+#   startup            - time until a freshly started server answers /ready, and until it is warmed up
+#
+# The parsing stages report pages/sec, latency percentiles and peak memory. The startup stage fails the
+# run (exit status 1) when a worker takes longer than --startup-budget seconds to serve.
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usgstore.com.au')
+RESULTS_DIR = 'bench_results'
+STAGES = ('collection_links', 'sitemap', 'scrape_product', 'http_pipeline', 'crawl_limiter', 'startup')
+STARTUP_BUDGET = 1.0  # Seconds from process start until a new worker answers requests
+STARTUP_TIMEOUT = 30
+STORE_CAPACITY = 12  # Concurrent requests the stand-in store takes under /limited/ before it answers 429
+# Product pages the crawl_limiter stage fetches at least, whatever --rounds says. The adaptive limiter finds the
+# store's limit with one 429 and pauses for its Retry-After (1s), in a crawl of a few seconds that pause is all it measures
+CRAWL_PAGES = 2000
+
+# How an autoscaled worker runs the app: no debug reloader, which would start the process twice
+SERVER_SCRIPT = "import os, app; app.socketio.run(app.app, host='127.0.0.1', port=int(os.environ['PORT']))"
+
+
+def load_snapshot(name):
+    with open(os.path.join(SNAPSHOT_DIR, name), 'rb') as f:
+        return f.read()
+
+
+# Color and price every generated product page shows
+PRODUCT_COLOR = 'Core Black/Cloud White'
+PRODUCT_PRICE = '$180.00'
+
+
+# The snapshots are collection pages, product pages are built from the same page chrome (head, header, footer)
+# with the collection grid in <main> swapped for the h3/h4/price/thumbnail slider/OptionSelectors blocks
+# scrape_product reads. Left in, the grid's own headings would be what gets extracted.
+def make_product_page(chrome, product_id, title, variant_count=10):
+    variants = [{
+        'id': product_id * 100 + i,
+        'option1': 'Default',
+        'option2': f'US {7 + i * 0.5:g}',
+        'sku': f'SKU-{product_id}-{i}',
+        'barcode': f'{4060000000000 + product_id * 100 + i}',
+        'weight': 1000,
+        'inventory_quantity': i % 4,
+    } for i in range(variant_count)]
+    product = {'id': product_id, 'title': title, 'type': 'Mens', 'variants': variants}
+    slides = ''.join(
+        f'<div class="thumbnail-slide"><img src="//usgstore.com.au/cdn/shop/products/{product_id}_{i}.jpg"></div>'
+        for i in range(4)
+    )
+    block = (
+        '<div class="reg-sec product-sec"><div class="container">'
+        f'<h3>{html.escape(title)}</h3><h4>{PRODUCT_COLOR}</h4>'
+        f'<div class="product-price"><span class=money>{PRODUCT_PRICE}</span></div>'
+        f'<div class="product-thumbnail-slider">{slides}</div>'
+        '<script>\n'
+        "  new Shopify.OptionSelectors('productSelect', {\n"
+        f'    product: {json.dumps(product)},\n'
+        '    onVariantSelected: selectCallback\n'
+        '  });\n'
+        '</script>'
+        '</div></div>'
+    )
+    start = chrome.index(b'>', chrome.index(b'<main')) + 1
+    return chrome[:start] + block.encode() + chrome[chrome.index(b'</main>'):]
+
+
+# Fail the run when `page` doesn't come out with the fields make_product_page put on it, a page the
+# extractor misreads would still be timed
+def check_extraction(app, page, title, adapter=None):
+    product = app.scrape_product(page, 'adidas', adapter)
+    expected = {'Title': title, 'Price': PRODUCT_PRICE, 'Color': PRODUCT_COLOR}
+    extracted = {field: product.get(field) for field in expected}
+    if extracted != expected:
+        raise RuntimeError(f'Product page extracted as {extracted}, expected {expected}')
+
+
+def summarize(latencies, elapsed, peak):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+    return {
+        'pages': len(latencies),
+        'seconds': round(elapsed, 4),
+        'pages_per_sec': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+    }
+
+
+# Time fn(page) over every page, `rounds` times, then measure peak memory on a separate short pass
+# (tracemalloc slows allocation-heavy parsing down several times, so it stays out of the timed loop)
+def run_stage(fn, pages, rounds):
+    latencies = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # scrape_product prints every product
+        for _ in range(rounds):
+            for page in pages:
+                t = time.perf_counter()
+                fn(page)
+                latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, peak_memory(fn, pages[:10]))
+
+
+def peak_memory(fn, pages):
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for page in pages:
+            fn(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_collection_links(app, rounds):
+    results = {}
+    for name in ('adidas.txt', 'collection.txt'):
+        page = load_snapshot(name)
+        results[name] = run_stage(app.collection_links, [page], rounds)
+        results[name]['links'] = len(app.collection_links(page))
+    return results
+
+
+# A sitemap_products_1.xml listing the links of the collection snapshot, with lastmod and image like Shopify's
+def make_sitemap(links):
+    entries = ''.join(
+        f'<url><loc>https://usgstore.com.au{link["link"]}</loc><lastmod>2024-05-01T10:00:00+10:00</lastmod>'
+        f'<changefreq>daily</changefreq><image:image><image:loc>https://usgstore.com.au/cdn/shop/products/{i}.jpg</image:loc>'
+        f'<image:title>{link["name"] or i}</image:title></image:image></url>'
+        for i, link in enumerate(links)
+    )
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">'
+            f'{entries}</urlset>').replace('&', '&amp;').encode()
+
+
+def bench_sitemap(app, rounds):
+    import sitemap
+
+    links = app.collection_links(load_snapshot('collection.txt'))
+    document = make_sitemap(links)
+    result = run_stage(lambda page: sitemap.parse(io.BytesIO(page)), [document], rounds)
+    result['links'] = len(sitemap.parse(io.BytesIO(document)))
+    result['kb'] = round(len(document) / 1024, 1)
+    return result
+
+
+# (title, page) for every product of the collection snapshot
+def product_pages(app):
+    chrome = load_snapshot('adidas.txt')
+    titles = [link['name'] or f'Product {i + 1}' for i, link in enumerate(app.collection_links(chrome))]
+    return [(title, make_product_page(chrome, i + 1, title)) for i, title in enumerate(titles)]
+
+
+def bench_scrape_product(app, rounds):
+    titled = product_pages(app)
+    pages = [page for _, page in titled]
+    results = {}
+    fast_parse = app.app.config['FAST_PARSE']
+    # Time the parser itself, the process pool only adds IPC to a single page (http_pipeline covers it)
+    workers, app.parse_pool.workers = app.parse_pool.workers, 0
+    try:
+        for mode in (True, False):
+            app.app.config['FAST_PARSE'] = mode
+            key = f"fast_parse_{'on' if mode else 'off'}"
+            with contextlib.redirect_stdout(io.StringIO()):
+                check_extraction(app, titled[0][1], titled[0][0])
+            results[key] = run_stage(lambda page: app.scrape_product(page, 'adidas'), pages, rounds)
+    finally:
+        app.app.config['FAST_PARSE'] = fast_parse
+        app.parse_pool.workers = workers
+    return results
+
+
+# Fetch the collection and every product page from the stand-in store, concurrently like scrape does
+def bench_http_pipeline(app, port, concurrency):
+    import eventlet
+    import http_client
+    import site_adapters
+
+    # Measure real fetches, not the on-disk cache
+    http_client.disable_cache()
+    base = f'http://127.0.0.1:{port}'
+    fetch_latencies = []
+    parse_latencies = []
+    # The stand-in store serves USG's pages, its localhost URL alone would get them read with the generic fields
+    adapter = site_adapters.adapter_for()
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_extraction(app, http_client.get(f'{base}/products/extraction-check'), 'extraction-check', adapter)
+
+    def fetch_and_parse(link):
+        t = time.perf_counter()
+        response = http_client.get(base + link['link'])
+        fetch_latencies.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        app.scrape_product(response, 'adidas', adapter)
+        parse_latencies.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        links = app.collection_links(http_client.get(base + '/collections/adidas').content)
+        pool = eventlet.GreenPool(concurrency)
+        for link in links:
+            pool.spawn_n(fetch_and_parse, link)
+        pool.waitall()
+    elapsed = time.perf_counter() - started
+    # Whole process high-water mark (ru_maxrss is in KB on Linux)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    result = summarize(fetch_latencies, elapsed, peak)  # Pages/sec of the whole pipeline, with the fetch latencies
+    result['concurrency'] = concurrency
+    result['parse'] = summarize(parse_latencies, sum(parse_latencies), peak)
+    return result
+
+
+# Fetch every product page of the collection under /limited/ `rounds` times (and at least CRAWL_PAGES pages) through
+# a crawl_limiter.AdaptiveLimiter, once held at SCRAPE_CONCURRENCY, once at SCRAPE_MAX_CONCURRENCY and once adapting
+# between them the way app.site_limiter() sets it up
+def bench_crawl_limiter(app, port, rounds):
+    import eventlet
+    import http_client
+    from crawl_limiter import AdaptiveLimiter
+
+    http_client.disable_cache()
+    base = f'http://127.0.0.1:{port}/limited'
+    links = app.collection_links(load_snapshot('adidas.txt'))
+    links = links * max(rounds, -(-CRAWL_PAGES // len(links)))
+    low, high = app.app.config['SCRAPE_CONCURRENCY'], app.app.config['SCRAPE_MAX_CONCURRENCY']
+    minimum = min(app.app.config['SCRAPE_MIN_CONCURRENCY'], low)
+    results = {}
+    for name, limiter in (('fixed_low', AdaptiveLimiter(low, low, low)), ('fixed_high', AdaptiveLimiter(high, high, high)),
+                          ('adaptive', AdaptiveLimiter(low, minimum, high))):
+        latencies = []
+
+        def fetch(link):
+            t = time.perf_counter()
+            limiter.call(http_client.get, base + link['link'])
+            latencies.append(time.perf_counter() - t)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool = eventlet.GreenPool(high)
+            for link in links:
+                pool.spawn_n(fetch, link)
+            pool.waitall()
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, 0)
+        stats = limiter.stats()
+        results[name].update({key: stats[key] for key in ('throttled', 'retried', 'limit')})
+        del results[name]['peak_mb']
+    return results
+
+
+# Databases, caches and stores the app keeps, all under `data_dir`, so a benchmark neither resumes real
+# scrape jobs nor touches the data of the checkout it runs from (even with JOBS_DB ... set in the environment)
+def state_env(data_dir):
+    return {
+        'PRODUCT_DB': os.path.join(data_dir, 'products.db'),
+        'JOBS_DB': os.path.join(data_dir, 'products.db'),
+        'CATALOG_MIRROR_DB': os.path.join(data_dir, 'products.db'),
+        'FINGERPRINTS_PATH': os.path.join(data_dir, 'fingerprints.json'),
+        'HTTP_CACHE_DIR': os.path.join(data_dir, 'http_cache'),
+        'IMAGE_PROXY_DIR': os.path.join(data_dir, 'image_cache'),
+        'UPLOAD_FOLDER': os.path.join(data_dir, 'uploads'),
+    }
+
+
+# Start the server `rounds` times, each with fresh databases and caches, and time how long until /ready answers
+# at all (the worker serves) and with 200 (its backends are warmed up)
+def bench_startup(port, rounds):
+    serving = []
+    ready = []
+    for _ in range(rounds):
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = dict(os.environ, PORT=str(port), WORKER_ID='bench-startup', **state_env(data_dir))
+            started = time.perf_counter()
+            server = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                first_answer = None
+                while True:
+                    elapsed = time.perf_counter() - started
+                    if elapsed > STARTUP_TIMEOUT:
+                        raise RuntimeError(f'Server did not get ready within {STARTUP_TIMEOUT}s')
+                    try:
+                        urllib.request.urlopen(f'http://127.0.0.1:{port}/ready', timeout=1).read()
+                        ready.append(elapsed)
+                        serving.append(first_answer or elapsed)
+                        break
+                    except urllib.error.HTTPError:
+                        first_answer = first_answer or elapsed  # 503: serving, still warming up
+                    except OSError:
+                        pass  # Not listening yet
+                    time.sleep(0.005)
+            finally:
+                server.kill()
+                server.wait()
+
+    def ms(values, p):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+    return {
+        'runs': rounds,
+        'serving_p50_ms': ms(serving, 0.5),
+        'serving_max_ms': ms(serving, 1),
+        'ready_p50_ms': ms(ready, 0.5),
+        'ready_max_ms': ms(ready, 1),
+    }
+
+
+# Local stand-in for the source store: collection pages are the snapshot, product pages are generated
+# Under /limited/ every request in flight adds a tenth of the latency, and past STORE_CAPACITY it gets a 429
+def serve(port, latency_ms):
+    chrome = load_snapshot('adidas.txt')
+    pages = {}
+    limited = [0]  # Requests in flight under /limited/
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.startswith('/limited/'):
+                with lock:
+                    limited[0] += 1
+                    in_flight = limited[0]
+                try:
+                    if in_flight > STORE_CAPACITY:
+                        self.send_response(429)
+                        self.send_header('Retry-After', '1')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    time.sleep(latency_ms / 1000 * in_flight / 10)
+                    self.path = self.path[len('/limited'):]
+                    self.respond()
+                finally:
+                    with lock:
+                        limited[0] -= 1
+            else:
+                self.respond()
+
+        def respond(self):
+            path = self.path.split('?')[0]
+            if path.endswith('.json') or path.endswith('.js'):
+                body, status = b'Not found', 404  # Force the HTML path
+            elif '/products/' in path:
+                if path not in pages:
+                    pages[path] = make_product_page(chrome, len(pages) + 1, path.rsplit('/', 1)[-1])
+                body, status = pages[path], 200
+            else:
+                body, status = chrome, 200
+            time.sleep(latency_ms / 1000)
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    def walk(new, old, prefix=''):
+        for key, value in new.items():
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], f'{prefix}{key}.')
+            elif key in ('pages_per_sec', 'p50_ms', 'p99_ms', 'peak_mb', 'serving_p50_ms', 'ready_p50_ms') and old.get(key):
+                change = (value - old[key]) / old[key] * 100
+                print(f'{prefix}{key}: {old[key]} -> {value} ({change:+.1f}%)')
+
+    print(f'--- compared with {previous_path}')
+    walk(results['stages'], previous.get('stages', {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline scraper benchmarks')
+    parser.add_argument('--rounds', type=int, default=5, help='repetitions of the offline stages')
+    parser.add_argument('--port', type=int, default=8799, help='port for the local stand-in store')
+    parser.add_argument('--latency', type=float, default=20, help='simulated store latency in ms')
+    parser.add_argument('--concurrency', type=int, default=None, help='fetch concurrency (default SCRAPE_CONCURRENCY)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--stage', action='append', choices=STAGES, help='stage to run, repeatable (default: all)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET, help='seconds a new worker may take to serve')
+    parser.add_argument('--output', default=RESULTS_DIR, help='directory results are saved to')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.latency)
+        return
+
+    data_dir = tempfile.TemporaryDirectory(prefix='bench-')
+    os.environ.update(state_env(data_dir.name))
+    server = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(args.port), '--latency', str(args.latency)])
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        concurrency = args.concurrency or app.app.config['SCRAPE_CONCURRENCY']
+        time.sleep(0.5)  # Give the stand-in store a moment to bind
+
+        stages = args.stage or STAGES
+        results = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip(),
+            'parser': app.HTML_PARSER,
+            'parse_workers': app.parse_pool.workers,
+            'stages': {},
+        }
+        if 'collection_links' in stages:
+            results['stages']['collection_links'] = bench_collection_links(app, args.rounds)
+        if 'sitemap' in stages:
+            results['stages']['sitemap'] = bench_sitemap(app, args.rounds)
+        if 'scrape_product' in stages:
+            results['stages']['scrape_product'] = bench_scrape_product(app, args.rounds)
+        if 'http_pipeline' in stages:
+            results['stages']['http_pipeline'] = bench_http_pipeline(app, args.port, concurrency)
+        if 'crawl_limiter' in stages:
+            results['stages']['crawl_limiter'] = bench_crawl_limiter(app, args.port, args.rounds)
+        if 'startup' in stages:
+            results['stages']['startup'] = bench_startup(args.port + 1, args.rounds)
+    finally:
+        server.kill()
+        data_dir.cleanup()
+
+    print(json.dumps(results, indent=2))
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Saved results to {path}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+    startup = results['stages'].get('startup')
+    if startup and startup['serving_p50_ms'] > args.startup_budget * 1000:
+        print(f"Startup over budget: a worker took {startup['serving_p50_ms']}ms to serve (budget {args.startup_budget * 1000:.0f}ms)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import contextlib
+import time
+
+from eventlet.queue import LightQueue
+
+# Headless Chrome for product pages that only fill in their data with JavaScript.
+# Starting Chrome takes seconds, so up to `size` browsers are kept running and each one reuses its tab
+# for page after page; a render then costs one navigation. Images, fonts and stylesheets are blocked,
+# the scraper only reads the DOM. A browser is replaced after `max_pages` pages (Chrome grows over time)
+# or when it stops responding. Selenium talks to chromedriver over HTTP, so under eventlet a render only
+# blocks the green thread that asked for it.
+
+# URL patterns Chrome doesn't fetch at all (DevTools Network.setBlockedURLs)
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css',
+]
+
+
+class BrowserUnavailable(Exception):
+    pass
+
+
+class BrowserPool:
+    # driver_path=None lets Selenium find (or download) a chromedriver matching the installed Chrome
+    # When Chrome can't be started at all, renders fail fast for `retry_after` seconds instead of retrying every page
+    def __init__(self, size=2, driver_path=None, page_timeout=20, max_pages=200, block_resources=True, retry_after=300):
+        self.size = size
+        self.driver_path = driver_path
+        self.page_timeout = page_timeout
+        self.max_pages = max_pages
+        self.block_resources = block_resources
+        self.retry_after = retry_after
+        self.idle = LightQueue()
+        self.running = 0  # Browsers started or starting, idle or in use
+        self.pages = {}  # driver -> pages it has rendered
+        self.unavailable_until = 0
+        self.launched = 0
+        self.rendered = 0
+        self.failed = 0
+        self.launch_seconds = 0.0
+
+    def _launch(self):
+        # Imported here so servers that never need a browser don't load Selenium
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-dev-shm-usage')  # /dev/shm is tiny in containers
+        options.add_argument('--disable-extensions')
+        options.page_load_strategy = 'eager'  # Scripts have run at DOMContentLoaded, don't wait for the rest
+        if self.block_resources:
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+        service = Service(executable_path=self.driver_path) if self.driver_path else Service()
+        launch_started = time.monotonic()
+        driver = webdriver.Chrome(service=service, options=options)
+        driver.set_page_load_timeout(self.page_timeout)
+        if self.block_resources:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+        self.launch_seconds += time.monotonic() - launch_started
+        self.launched += 1
+        return driver
+
+    def _checkout(self):
+        if self.idle.qsize() == 0 and self.running < self.size:
+            return self._start()
+        driver = self.idle.get()  # Every browser is busy, wait for one
+        if driver is None:
+            return self._start()  # One was retired while we waited, its slot is ours
+        return driver
+
+    def _start(self):
+        if time.monotonic() < self.unavailable_until:
+            self._wake_waiter()
+            raise BrowserUnavailable('Headless browser unavailable, see the earlier launch error')
+        self.running += 1
+        try:
+            driver = self._launch()
+        except Exception as e:
+            self.running -= 1
+            self.unavailable_until = time.monotonic() + self.retry_after
+            print(f"Could not start a headless browser: {e}")
+            self._wake_waiter()
+            raise BrowserUnavailable(str(e))
+        self.pages[driver] = 0
+        return driver
+
+    # Hand a free browser slot to a render waiting in _checkout, if there is one
+    def _wake_waiter(self):
+        if self.idle.getting():
+            self.idle.put(None)
+
+    def _checkin(self, driver, broken=False):
+        if broken or self.pages[driver] >= self.max_pages:
+            self._quit(driver)
+            self._wake_waiter()  # It starts the replacement
+        else:
+            self.idle.put(driver)
+
+    def _quit(self, driver):
+        self.pages.pop(driver, None)
+        self.running -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass  # Already gone
+
+    # Borrow a browser whose tab shows `url`, optionally once `wait_for` (a CSS selector) is in the DOM
+    #   with pool.page(url, wait_for='h3') as driver: ...
+    @contextlib.contextmanager
+    def page(self, url, wait_for=None):
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self._checkout()
+        try:
+            driver.get(url)
+            self.pages[driver] += 1
+            if wait_for:
+                WebDriverWait(driver, self.page_timeout).until(
+                    expected_conditions.presence_of_element_located((By.CSS_SELECTOR, wait_for)))
+        except TimeoutException:
+            self.failed += 1
+            self._checkin(driver)  # The page was slow, the browser is fine
+            raise
+        except WebDriverException:
+            self.failed += 1
+            self._checkin(driver, broken=True)  # Crashed or lost its session, start a new one next time
+            raise
+        except BaseException:
+            self.failed += 1
+            self._checkin(driver, broken=True)  # Anything else (chromedriver gone, the render timed out) leaves it in an unknown state
+            raise
+        try:
+            yield driver
+            self.rendered += 1
+        finally:
+            self._checkin(driver)
+
+    # The rendered HTML of `url`, for the same parser the static pages go through
+    def render(self, url, wait_for=None):
+        with self.page(url, wait_for) as driver:
+            return driver.page_source
+
+    # Quit the idle browsers, e.g. at exit (Chrome outlives a killed parent otherwise)
+    def close(self):
+        while self.idle.qsize():
+            self._quit(self.idle.get())
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'running': self.running,
+            'idle': self.idle.qsize(),
+            'launched': self.launched,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'mean_launch_seconds': round(self.launch_seconds / self.launched, 2) if self.launched else None,
+            'available': time.monotonic() >= self.unavailable_until,
+        }
@@ -0,0 +1,201 @@
+import re
+import sqlite3
+import threading
+import time
+
+# Local copy of the destination Shopify store's catalog, indexed by SKU, barcode and handle.
+# It is refreshed in bulk (one bulkOperationRunQuery for the whole store) and kept current as we
+# upload, so deciding whether a scraped product needs to be created, updated or skipped never
+# costs a remote lookup.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS mirror_products (
+    id TEXT PRIMARY KEY,
+    handle TEXT,
+    title TEXT,
+    vendor TEXT,
+    body_html TEXT,
+    refreshed_at REAL
+);
+CREATE TABLE IF NOT EXISTS mirror_variants (
+    id TEXT PRIMARY KEY,
+    product_id TEXT NOT NULL,
+    sku TEXT,
+    barcode TEXT,
+    weight_grams REAL
+);
+CREATE INDEX IF NOT EXISTS mirror_products_handle ON mirror_products (handle);
+CREATE INDEX IF NOT EXISTS mirror_variants_sku ON mirror_variants (sku);
+CREATE INDEX IF NOT EXISTS mirror_variants_barcode ON mirror_variants (barcode);
+CREATE INDEX IF NOT EXISTS mirror_variants_product ON mirror_variants (product_id);
+'''
+
+CATALOG_QUERY = '''
+{
+  products {
+    edges {
+      node {
+        id handle title vendor descriptionHtml
+        variants {
+          edges {
+            node { id sku barcode inventoryItem { measurement { weight { value unit } } } }
+          }
+        }
+      }
+    }
+  }
+}
+'''
+
+GRAMS_PER_UNIT = {'GRAMS': 1, 'KILOGRAMS': 1000, 'OUNCES': 28.3495, 'POUNDS': 453.592}
+
+
+def handleize(title):
+    return re.sub(r'[^a-z0-9]+', '-', (title or '').lower()).strip('-')
+
+
+def _clean(value):
+    if value is None or 'not found' in str(value) or value == 'N/A':
+        return None
+    return str(value)
+
+
+def _grams(value):
+    try:
+        return round(float(value), 1)
+    except (TypeError, ValueError):
+        return None
+
+
+# The fields we send to Shopify, in the same shape for scraped and mirrored products
+def normalize(product, sku=None):
+    variants = product.get('Variants') or [{
+        'SKU': sku if sku and sku != 'N/A' else product.get('SKU'),
+        'Barcode': product.get('Barcode') or product.get('GTIN/UPC/barcode'),
+        'Weight': product.get('Weight'),
+    }]
+    return {
+        'title': product.get('Title'),
+        'body_html': _clean(product.get('Product detail')) or '',
+        'vendor': product.get('Brand'),
+        'variants': {
+            _clean(v.get('SKU')): {'barcode': _clean(v.get('Barcode')), 'weight_grams': _grams(v.get('Weight'))}
+            for v in variants if _clean(v.get('SKU'))
+        },
+    }
+
+
+class CatalogMirror:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.refreshed_at = None
+        self.counters = {'create': 0, 'update': 0, 'skip': 0}
+
+    # Replace the mirror with the store's whole catalog, using a bulk query (client is a ShopifyBulkClient)
+    def refresh(self, client, progress=None):
+        operation = client.wait(client.run_query(CATALOG_QUERY), progress=progress)
+        lines = client.results(operation.get('url'))
+        products, variants = [], []
+        for line in lines:
+            if '__parentId' in line:
+                weight = ((line.get('inventoryItem') or {}).get('measurement') or {}).get('weight') or {}
+                grams = weight.get('value') * GRAMS_PER_UNIT.get(weight.get('unit'), 1) if weight.get('value') is not None else None
+                variants.append((line['id'], line['__parentId'], line.get('sku') or None, line.get('barcode') or None, _grams(grams)))
+            else:
+                products.append((line['id'], line.get('handle'), line.get('title'), line.get('vendor'), line.get('descriptionHtml') or '', time.time()))
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM mirror_variants')
+            self.connection.execute('DELETE FROM mirror_products')
+            self.connection.executemany('INSERT INTO mirror_products VALUES (?, ?, ?, ?, ?, ?)', products)
+            self.connection.executemany('INSERT INTO mirror_variants VALUES (?, ?, ?, ?, ?)', variants)
+        self.refreshed_at = time.time()
+        return len(products)
+
+    def _find_product_id(self, normalized):
+        for sku in normalized['variants']:
+            row = self.connection.execute('SELECT product_id FROM mirror_variants WHERE sku = ?', (sku,)).fetchone()
+            if row:
+                return row['product_id']
+        for variant in normalized['variants'].values():
+            if variant['barcode']:
+                row = self.connection.execute('SELECT product_id FROM mirror_variants WHERE barcode = ?', (variant['barcode'],)).fetchone()
+                if row:
+                    return row['product_id']
+        row = self.connection.execute('SELECT id FROM mirror_products WHERE handle = ?', (handleize(normalized['title']),)).fetchone()
+        return row['id'] if row else None
+
+    def _load(self, product_id):
+        product = self.connection.execute('SELECT * FROM mirror_products WHERE id = ?', (product_id,)).fetchone()
+        variants = self.connection.execute('SELECT * FROM mirror_variants WHERE product_id = ?', (product_id,)).fetchall()
+        return {
+            'title': product['title'],
+            'body_html': product['body_html'],
+            'vendor': product['vendor'],
+            'variants': {v['sku']: {'barcode': v['barcode'], 'weight_grams': v['weight_grams'], 'id': v['id']} for v in variants if v['sku']},
+        }
+
+    # Decide what to do with a scraped product without asking Shopify.
+    # Returns (action, existing product id, changes) with action 'create', 'update' or 'skip';
+    # changes holds only the top level fields and variants (by SKU) that differ from the store.
+    def plan(self, product, sku=None):
+        normalized = normalize(product, sku)
+        with self.lock:
+            product_id = self._find_product_id(normalized)
+            if product_id is None:
+                self.counters['create'] += 1
+                return 'create', None, normalized
+            existing = self._load(product_id)
+
+        changes = {field: normalized[field] for field in ('title', 'body_html', 'vendor') if normalized[field] != existing[field]}
+        changed_variants = {}
+        for variant_sku, fields in normalized['variants'].items():
+            current = existing['variants'].get(variant_sku)
+            if current is None:
+                changed_variants[variant_sku] = dict(fields, id=None)
+                continue
+            diff = {k: v for k, v in fields.items() if v is not None and v != current[k]}
+            if diff:
+                # A placeholder id (see record) isn't Shopify's, the variant is then only known by its SKU
+                changed_variants[variant_sku] = dict(diff, id=current['id'] if current['id'].startswith('gid://') else None)
+        if changed_variants:
+            changes['variants'] = changed_variants
+            # Every existing variant id, so a full variant list sent with the update keeps them instead of recreating them
+            changes['variant_ids'] = {s: v['id'] for s, v in existing['variants'].items() if v['id'].startswith('gid://')}
+
+        action = 'update' if changes else 'skip'
+        self.counters[action] += 1
+        return action, product_id, changes
+
+    # Keep the mirror current after an upload so the next plan() sees it without a refresh
+    def record(self, product_id, product, sku=None, variant_ids=None, handle=None):
+        normalized = normalize(product, sku)
+        variant_ids = variant_ids or {}
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO mirror_products (id, handle, title, vendor, body_html, refreshed_at) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET title = excluded.title, vendor = excluded.vendor, body_html = excluded.body_html, '
+                'handle = COALESCE(excluded.handle, mirror_products.handle)',
+                (product_id, handle, normalized['title'], normalized['vendor'], normalized['body_html'], time.time()),
+            )
+            for variant_sku, fields in normalized['variants'].items():
+                existing = self.connection.execute(
+                    'SELECT id FROM mirror_variants WHERE product_id = ? AND sku = ?', (product_id, variant_sku)).fetchone()
+                # Placeholder id (not a gid) until the next refresh brings the real one
+                variant_id = variant_ids.get(variant_sku) or (existing['id'] if existing else f'pending:{product_id}/{variant_sku}')
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO mirror_variants (id, product_id, sku, barcode, weight_grams) VALUES (?, ?, ?, ?, ?)',
+                    (variant_id, product_id, variant_sku, fields['barcode'], fields['weight_grams']),
+                )
+
+    def stats(self):
+        count = self.connection.execute('SELECT COUNT(*) FROM mirror_products').fetchone()[0]
+        return dict(self.counters, products=count, refreshed_at=self.refreshed_at)
+
+
+def numeric_id(gid):
+    return str(gid).rsplit('/', 1)[-1]
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import time
+
+# Remembers a content fingerprint for every product we've scraped so a re-scrape only has to
+# send what is new, changed or gone. Fingerprints are kept per scope (the collection or sitemap URL)
+# in a JSON file and written back when a scrape finishes, together with when each scope's last
+# complete scrape started (sitemap crawls only fetch products modified after that).
+
+# Variant fields compared for the variant level diff
+VARIANT_FIELDS = ('SKU', 'Barcode', 'Quantity')
+
+
+def product_key(product):
+    for field in ('id', 'Handle', 'Title'):
+        value = product.get(field)
+        if value and value != 'ID not found':
+            return str(value)
+    return None
+
+
+def variant_key(variant):
+    return str(variant.get('ID') or variant.get('SKU'))
+
+
+def fingerprint(product):
+    content = {
+        'title': product.get('Title'),
+        'image': product.get('Image'),
+        'variants': sorted(
+            [variant_key(v), v.get('Size'), v.get('SKU'), v.get('Barcode'), v.get('Quantity')]
+            for v in product.get('Variants', [])
+        ),
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Variant level changes between two {variant_id: {field: value}} maps
+def variant_diff(old, new):
+    diff = []
+    for key in new:
+        if key not in old:
+            diff.append({'ID': key, 'change': 'added', 'fields': new[key]})
+            continue
+        fields = {f: [old[key].get(f), new[key].get(f)] for f in VARIANT_FIELDS if old[key].get(f) != new[key].get(f)}
+        if fields:
+            diff.append({'ID': key, 'change': 'changed', 'fields': fields})
+    for key in old:
+        if key not in new:
+            diff.append({'ID': key, 'change': 'removed', 'fields': old[key]})
+    return diff
+
+
+class ChangeTracker:
+    def __init__(self, path):
+        self.path = path
+        self.scopes = None  # Read on first use, the file grows with every product ever scraped
+        self.crawled = {}  # scope -> start time of its last scrape that saw every product
+
+    def load(self):
+        if self.scopes is not None:
+            return
+        self.scopes = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except ValueError:
+                print(f'Ignoring unreadable fingerprint file {self.path}')
+                return
+            # Files written before crawl times were kept hold the scopes only
+            if 'scopes' in data and 'crawled' in data:
+                self.scopes, self.crawled = data['scopes'], data['crawled']
+            else:
+                self.scopes = data
+
+    def begin(self, scope):
+        self.load()
+        return ScrapeRun(self, scope)
+
+    def save(self):
+        self.load()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'scopes': self.scopes, 'crawled': self.crawled}, f)
+        os.replace(tmp, self.path)
+
+
+# One scrape of one scope, collects what was seen so removals can be found at the end
+class ScrapeRun:
+    def __init__(self, tracker, scope):
+        self.tracker = tracker
+        self.scope = scope
+        self.previous = tracker.scopes.get(scope, {})
+        self.current = {}
+        self.failed = False  # Set when some products couldn't be read, removals are unknown then
+        self.started_at = time.time()
+        self.since = tracker.crawled.get(scope)  # When the last complete scrape of this scope started
+        self.by_link = None  # Product page URL -> keys in previous, built by the first keep()
+
+    # Returns ('new' | 'changed' | 'unchanged', variant diff)
+    # `link` is the product's page, remembered so a later crawl can keep() the product without fetching it
+    def check(self, product, link=None):
+        key = product_key(product)
+        if key is None:
+            return 'new', []
+        entry = {
+            'fingerprint': fingerprint(product),
+            'variants': {variant_key(v): {f: v.get(f) for f in VARIANT_FIELDS} for v in product.get('Variants', [])},
+        }
+        if link:
+            entry['link'] = link
+        self.current[key] = entry
+        old = self.previous.get(key)
+        if old is None:
+            return 'new', []
+        if old['fingerprint'] == entry['fingerprint']:
+            return 'unchanged', []
+        return 'changed', variant_diff(old['variants'], entry['variants'])
+
+    # Carry the product at `link` over from the previous scrape unchanged, as if it had been checked again
+    # Returns False when the previous scrape didn't see it, it has to be fetched then
+    def keep(self, link):
+        if self.by_link is None:
+            self.by_link = {}
+            for key, entry in self.previous.items():
+                if entry.get('link'):
+                    self.by_link.setdefault(entry['link'], []).append(key)
+        keys = self.by_link.get(link)
+        if not keys:
+            return False
+        for key in keys:
+            self.current[key] = self.previous[key]
+        return True
+
+    # Save the new fingerprints and return the keys of products that disappeared
+    def finish(self):
+        if self.failed:
+            # Keep products we couldn't confirm either way
+            merged = dict(self.previous)
+            merged.update(self.current)
+            self.tracker.scopes[self.scope] = merged
+            removed = []
+        else:
+            self.tracker.scopes[self.scope] = self.current
+            self.tracker.crawled[self.scope] = self.started_at
+            removed = [key for key in self.previous if key not in self.current]
+        self.tracker.save()
+        return removed
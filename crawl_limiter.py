@@ -0,0 +1,202 @@
+import email.utils
+import time
+from collections import deque
+
+import eventlet
+import requests
+from eventlet.event import Event
+
+from upload_scheduler import LeakyBucket
+
+# Per-site concurrency that adapts to how the source store is coping (AIMD, like TCP congestion control).
+# While responses come back fine and fast, every `limit` of them add one request slot (additive increase).
+# A 429, a 5xx, a connection error or latency well above the unloaded one halves the slots (multiplicative decrease),
+# and only for requests sent after the previous decrease, so a burst of failures (or slow responses) from
+# requests already in flight counts once. After a decrease the limit grows back to just under where the
+# store pushed back and stays there for PROBE_INTERVAL before it probes past it again; every probe past a
+# hard limit costs a Retry-After pause for the whole site.
+# Retry-After (seconds or an HTTP date) pauses every request to the site, not just the one that got it.
+# Throttled, 5xx and failed requests are retried here, after the pause, rather than inside urllib3,
+# where they would hold a slot and the limiter would never hear about them.
+
+THROTTLED = (429, 503)  # Statuses that mean "slow down"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_PAUSE = 5.0  # Seconds a 429/503 without Retry-After pauses the site
+MAX_PAUSE = 300.0  # Longer Retry-After values are cut to this, one header shouldn't stall a scrape for hours
+BACKOFF = 1.0  # Seconds before retrying a 5xx or failed request, doubled for every further attempt
+DECREASE = 0.5  # Share of the slots kept after a decrease
+LATENCY_FACTOR = 3.0  # Recent latency this many times the unloaded latency counts as a spike
+# ... and at least this many seconds above it, smaller differences are noise (a bigger page, a busy event loop)
+LATENCY_MARGIN = 0.1
+LATENCY_WEIGHT = 0.3  # EWMA weight of each response in the recent latency
+# The unloaded latency is the fastest response of the last one or two windows of this many seconds, so it
+# follows a store that got slower for good but isn't dragged up by the load we put on it
+BASE_WINDOW = 60.0
+PROBE_INTERVAL = 60.0  # Seconds the limit stays under the level of the last decrease
+
+
+# Seconds a Retry-After header value asks for, None when it is missing or unreadable
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_PAUSE)
+
+
+class AdaptiveLimiter:
+    # `rate` (requests per second) adds a fixed rate limit on top of the adaptive concurrency
+    def __init__(self, initial=8, minimum=1, maximum=32, rate=None, retries=3):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.bucket = LeakyBucket(capacity=self.maximum, leak_rate=rate, headroom=0) if rate else None
+        self.retries = retries
+        self.in_flight = 0
+        self.waiters = deque()
+        self.paused_until = 0.0
+        self.latency = None  # Seconds, EWMA of recent responses
+        self.base_latency = None  # Seconds, fastest recent response, what the store manages unloaded
+        self.window_min = None
+        self.window_started = time.monotonic()
+        self.last_decrease = 0.0
+        self.ceiling = None  # Limit at the last decrease
+        self.counters = {'requests': 0, 'throttled': 0, 'errors': 0, 'slow': 0, 'retried': 0,
+                         'increases': 0, 'decreases': 0}
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                eventlet.sleep(self.paused_until - now)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                break
+            event = Event()
+            self.waiters.append(event)
+            event.wait()
+        if self.bucket:
+            self.bucket.acquire()
+
+    # Wake as many waiting requests as there are free slots, they re-check the limit and any pause themselves
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while self.waiters and free > 0:
+            self.waiters.popleft().send()
+            free -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Record how a request went and free its slot
+    # status: HTTP status (None if the request failed without a response), latency: seconds it took
+    def release(self, status=None, latency=None, retry_after=None, failed=False, started=None):
+        saturated = self.in_flight >= int(self.limit) or bool(self.waiters)
+        self.in_flight -= 1
+        self.counters['requests'] += 1
+        if status in THROTTLED or (retry_after is not None and status and status >= 400):
+            self.counters['throttled'] += 1
+            self.pause(DEFAULT_PAUSE if retry_after is None else retry_after)
+            self._decrease(started)
+        elif failed or (status and status >= 500):
+            self.counters['errors'] += 1
+            self._decrease(started)
+        elif latency is not None:
+            self._observe(latency)
+            if self.latency > max(self.base_latency * LATENCY_FACTOR, self.base_latency + LATENCY_MARGIN):
+                self.counters['slow'] += 1
+                self._decrease(started)
+            elif saturated:
+                # Only grow while the slots are actually used, an idle site would otherwise creep up to the maximum
+                self._increase()
+        self._wake()
+
+    def _observe(self, latency):
+        self.latency = latency if self.latency is None else self.latency + (latency - self.latency) * LATENCY_WEIGHT
+        now = time.monotonic()
+        if now - self.window_started >= BASE_WINDOW:
+            self.base_latency = self.window_min  # The previous window's minimum, until this one has a lower one
+            self.window_min = None
+            self.window_started = now
+        if self.window_min is None or latency < self.window_min:
+            self.window_min = latency
+        self.base_latency = min(self.base_latency or latency, self.window_min)
+
+    def _increase(self):
+        maximum = self.maximum
+        if self.ceiling is not None and time.monotonic() - self.last_decrease < PROBE_INTERVAL:
+            maximum = min(maximum, max(self.minimum, self.ceiling - 1))
+        if self.limit < maximum:
+            self.limit = min(maximum, self.limit + 1 / self.limit)
+            self.counters['increases'] += 1
+
+    def _decrease(self, started=None):
+        now = time.monotonic()
+        if started is not None and started < self.last_decrease:
+            return  # Sent at the old limit, what it says has been acted on
+        if now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.ceiling = self.limit
+        if self.limit > self.minimum:
+            self.limit = max(self.minimum, self.limit * DECREASE)
+            self.counters['decreases'] += 1
+
+    # Call fn(*args, **kwargs), one HTTP request to the site, in one of its slots, retrying throttled (after the
+    # pause), 5xx and failed attempts. fn returns a requests.Response or raises (e.g. raise_for_status()).
+    # Fresh HTTP cache hits say nothing about the site and don't count towards the latency.
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except requests.exceptions.RequestException as e:
+                response = e.response
+                self._release_for(response, started, failed=response is None)
+                if attempt >= self.retries or not self._retryable(response):
+                    raise
+            except BaseException:
+                self.release()  # Not the site's doing (e.g. a body that isn't JSON)
+                raise
+            else:
+                response = result if isinstance(result, requests.Response) else None
+                self._release_for(response, started)
+                if attempt >= self.retries or response is None or response.status_code not in RETRY_STATUSES:
+                    return result
+            attempt += 1
+            self.counters['retried'] += 1
+            if response is None or response.status_code not in THROTTLED:
+                eventlet.sleep(BACKOFF * 2 ** (attempt - 1))  # Throttled requests wait out the pause in acquire()
+
+    def _release_for(self, response, started, failed=False):
+        latency = time.monotonic() - started
+        if response is None:
+            # Failed, or fn returned parsed data
+            self.release(latency=None if failed else latency, failed=failed, started=started)
+        elif getattr(response, 'from_cache', False):
+            self.release(response.status_code)
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.release(response.status_code, latency, retry_after, started=started)
+
+    def _retryable(self, response):
+        return response is None or response.status_code in RETRY_STATUSES
+
+    def stats(self):
+        return dict(
+            self.counters,
+            limit=round(self.limit, 2),
+            in_flight=self.in_flight,
+            waiting=len(self.waiters),
+            paused_for=round(max(0.0, self.paused_until - time.monotonic()), 1),
+            latency_ms=round(self.latency * 1000, 1) if self.latency is not None else None,
+            base_latency_ms=round(self.base_latency * 1000, 1) if self.base_latency is not None else None,
+        )
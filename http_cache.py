@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import re
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# On-disk cache for pages fetched from the source stores.
+# Each entry is two files named after the sha256 of the canonical URL:
+#   <hash>.body  - the decoded response body
+#   <hash>.json  - url, status, validators (ETag / Last-Modified), a few headers and when it was stored
+# Fresh entries (younger than the route TTL) are served without touching the network, older ones are
+# revalidated with If-None-Match / If-Modified-Since so an unchanged page only costs a 304.
+
+# Seconds an entry is served without revalidating, first matching path pattern wins
+ROUTE_TTLS = [
+    (re.compile(r'/products\.json$'), 60),
+    (re.compile(r'/products/[^/]+\.js$'), 60),
+    (re.compile(r'/products/'), 60),
+    (re.compile(r'/collections/'), 60),
+]
+DEFAULT_TTL = 0
+
+# Response headers worth keeping with the body
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+
+# Lowercase scheme/host, sorted query string, no fragment, so the same page always maps to one entry
+def canonical_url(url, params=None):
+    if params:
+        url = requests.Request('GET', url, params=params).prepare().url
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
+
+
+def route_ttl(url):
+    path = urlsplit(url).path
+    for pattern, ttl in ROUTE_TTLS:
+        if pattern.search(path):
+            return ttl
+    return DEFAULT_TTL
+
+
+# Size bound for a directory of cache entries, each made of the files <key>.<ext> for `extensions`
+# The first extension is the file whose mtime says when the entry was last used, which keeps LRU order across restarts
+class DiskLru:
+    def __init__(self, directory, max_bytes, extensions):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extensions = extensions
+        self.entries = {}  # key -> [last_used, size]
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    # Count a file of `key` found on disk when the cache is loaded
+    def found(self, key, stat):
+        entry = self.entries.setdefault(key, [0, 0])
+        entry[0] = max(entry[0], stat.st_mtime)
+        entry[1] += stat.st_size
+        self.total_bytes += stat.st_size
+
+    def add(self, key, size):
+        self.entries[key] = [time.time(), size]
+        self.total_bytes += size
+
+    # Count `size` more bytes written for an entry that is already cached
+    def grow(self, key, size):
+        if key in self.entries:
+            self.entries[key][1] += size
+            self.total_bytes += size
+
+    def touch(self, key):
+        now = time.time()
+        self.entries[key][0] = now
+        try:
+            os.utime(self._path(key, self.extensions[0]), (now, now))
+        except OSError:
+            pass
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry[1]
+        for ext in self.extensions:
+            try:
+                os.remove(self._path(key, ext))
+            except OSError:
+                pass
+
+    # Drop least recently used entries (other than those in `busy`) until the cache fits in max_bytes,
+    # returns how many were dropped
+    def evict(self, busy=()):
+        evicted = 0
+        if self.total_bytes <= self.max_bytes:
+            return evicted
+        for key, _ in sorted(self.entries.items(), key=lambda item: item[1][0]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in busy:
+                continue
+            self.remove(key)
+            evicted += 1
+        return evicted
+
+
+class HttpCache:
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+        self.lru = DiskLru(directory, max_bytes, ('body', 'json'))  # Rebuilt from disk on first use
+        self.loaded = False
+        os.makedirs(directory, exist_ok=True)
+
+    # Scanning a large cache takes a while, so it happens on first use rather than at startup
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        for name in os.listdir(self.directory):
+            if not name.endswith('.body'):
+                continue
+            self.lru.found(name[:-5], os.stat(os.path.join(self.directory, name)))
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def lookup(self, url):
+        self.load()
+        key = hashlib.sha256(url.encode()).hexdigest()
+        if key not in self.lru:
+            return None
+        try:
+            with open(self._path(key, 'json')) as f:
+                meta = json.load(f)
+            with open(self._path(key, 'body'), 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            self.lru.remove(key)
+            return None
+        self.lru.touch(key)
+        return meta, body
+
+    def store(self, url, response):
+        # Respect stores that ask not to be cached
+        if 'no-store' in response.headers.get('Cache-Control', ''):
+            return
+        self.load()
+        key = hashlib.sha256(url.encode()).hexdigest()
+        meta = {
+            'url': url,
+            'status': response.status_code,
+            'headers': {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+            'encoding': response.encoding,
+            'stored_at': time.time(),
+        }
+        body = response.content
+        self.lru.remove(key)
+        with open(self._path(key, 'body'), 'wb') as f:
+            f.write(body)
+        with open(self._path(key, 'json'), 'w') as f:
+            json.dump(meta, f)
+        self.lru.add(key, len(body))
+        self.counters['stored'] += 1
+        self.counters['evicted'] += self.lru.evict()
+
+    # Mark an entry as just revalidated, resets its TTL
+    def refresh(self, url, meta):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        meta['stored_at'] = time.time()
+        with open(self._path(key, 'json'), 'w') as f:
+            json.dump(meta, f)
+
+    def stats(self):
+        self.load()
+        requests_seen = self.counters['hits'] + self.counters['misses'] + self.counters['revalidated']
+        served = self.counters['hits'] + self.counters['revalidated']
+        return dict(
+            self.counters,
+            entries=len(self.lru),
+            size_mb=round(self.lru.total_bytes / 1024 / 1024, 2),
+            max_mb=round(self.max_bytes / 1024 / 1024, 2),
+            hit_ratio=round(served / requests_seen, 3) if requests_seen else None,
+        )
+
+
+# Build a requests.Response from a cache entry so callers can't tell the difference
+def cached_response(url, meta, body):
+    response = requests.Response()
+    response.status_code = meta['status']
+    response._content = body
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.encoding = meta.get('encoding')
+    response.url = url
+    response.from_cache = True
+    return response
+
+
+# GET through the cache: fresh hit -> no request, stale -> conditional request, otherwise a normal fetch
+def cached_get(session, cache, url, **kwargs):
+    url = canonical_url(url, kwargs.pop('params', None))
+    entry = cache.lookup(url)
+    if entry:
+        meta, body = entry
+        if time.time() - meta['stored_at'] < route_ttl(url):
+            cache.counters['hits'] += 1
+            return cached_response(url, meta, body)
+
+        conditional = dict(kwargs.pop('headers', None) or {})
+        if 'ETag' in meta['headers']:
+            conditional['If-None-Match'] = meta['headers']['ETag']
+        if 'Last-Modified' in meta['headers']:
+            conditional['If-Modified-Since'] = meta['headers']['Last-Modified']
+        response = session.get(url, headers=conditional, **kwargs)
+        if response.status_code == 304:
+            cache.counters['revalidated'] += 1
+            cache.refresh(url, meta)
+            return cached_response(url, meta, body)
+    else:
+        response = session.get(url, **kwargs)
+
+    cache.counters['misses'] += 1
+    if response.status_code == 200:
+        cache.store(url, response)
+    return response
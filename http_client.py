@@ -0,0 +1,109 @@
+import os
+import requests
+import http_cache
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# Shared HTTP client used for every outbound request made by the scraper.
+# One requests.Session per process keeps connections (and TLS sessions) alive
+# between product pages instead of doing a new handshake for every fetch.
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+# urllib3 only decodes brotli when the brotli package is installed
+try:
+    import brotli  # noqa: F401
+    headers['Accept-Encoding'] += ', br'
+except ImportError:
+    pass
+
+# Keep-alive connections kept per host, should match the scrape concurrency
+POOL_SIZE = int(os.environ.get('SCRAPE_CONCURRENCY', 8))
+# Number of different hosts we keep a connection pool for
+POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 20))
+# Default timeout (seconds) for every request
+TIMEOUT = 10
+
+_session = None
+_cache = None  # http_cache.HttpCache, set by enable_cache()
+
+
+# Configure retries and timeout
+def requests_retry_session(
+    retries=3,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 504),
+    session=None,
+    pool_size=POOL_SIZE,
+    respect_retry_after_header=True,
+):
+    session = session or requests.Session()
+    retry = Retry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        respect_retry_after_header=respect_retry_after_header,
+    )
+    # pool_block makes extra green threads wait for a free connection instead of opening throwaway ones
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=POOL_HOSTS, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(headers)
+    return session
+
+
+# Set the pool size, called at startup with the app's scrape concurrency
+# The session itself is built on first request (loading the CA bundle is a noticeable part of startup)
+def configure(pool_size=None):
+    global _session, POOL_SIZE
+    if pool_size:
+        POOL_SIZE = pool_size
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+# Only dropped connections (e.g. a keep-alive the store closed) are retried here. Status codes, 429 and
+# Retry-After come back to the caller: the scraper's per-site limiter (crawl_limiter) slows the whole site
+# down and retries, where a fixed urllib3 backoff would stall one request while the rest kept going
+def get_session():
+    global _session
+    if _session is None:
+        _session = requests_retry_session(retries=2, backoff_factor=0.3, status_forcelist=(), pool_size=POOL_SIZE,
+                                          respect_retry_after_header=False)
+    return _session
+
+
+# Serve GETs through an on-disk cache with conditional revalidation
+def enable_cache(directory, max_bytes):
+    global _cache
+    _cache = http_cache.HttpCache(directory, max_bytes)
+    return _cache
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+def cache_stats():
+    return _cache.stats() if _cache else None
+
+
+# Build the session and index the cache ahead of the first request
+def warm_up():
+    get_session()
+    if _cache:
+        _cache.load()
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    if _cache:
+        return http_cache.cached_get(get_session(), _cache, url, **kwargs)
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from collections import deque
+
+import eventlet
+from eventlet import tpool
+
+import http_client
+from http_cache import DiskLru, canonical_url
+from image_store import pillow, sniff_extension
+
+# Local cache for the product images of the source stores.
+# Scraped products keep their remote image URL (Shopify needs it to import the image), the table shows
+# them through /image-proxy/<key> instead so the source CDN is hit once per image rather than once per
+# viewer. Each image is a few files named after the sha256 of its canonical URL:
+#   <key>.json   - url, validators (ETag / Last-Modified), image type and when it was fetched
+#   <key>.img    - the original as downloaded
+#   <key>.w<N>   - resized to N pixels wide, made on first request
+# Only URLs the scraper registered have a key, so the endpoint can't be used to fetch arbitrary URLs.
+# Bodies and variants are evicted least recently used first; the small .json files stay so a key keeps working.
+
+TTL = 24 * 3600  # Seconds an image is served before it is revalidated against the origin
+WIDTHS = (96, 200, 400, 800)  # Variant widths, a requested width is rounded up to one of these
+MAX_WAITING = 1000  # Prefetches queued beyond this are dropped, they will be fetched on first view
+
+
+class ImageProxyError(Exception):
+    pass
+
+
+def image_key(url):
+    return hashlib.sha256(canonical_url(url).encode()).hexdigest()
+
+
+class ImageProxy:
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, concurrency=4, ttl=TTL, widths=WIDTHS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.widths = widths
+        self.meta = {}  # key -> metadata of every registered image
+        # Sizes count the body and its variants, rebuilt from disk on first use
+        self.lru = DiskLru(directory, max_bytes, ('img',) + tuple(f'w{width}' for width in widths))
+        self.fetching = {}  # key -> green thread downloading or revalidating it
+        self.resizing = {}  # (key, width) -> green thread making that variant
+        self.waiting = deque()
+        self.pool = eventlet.GreenPool(concurrency)
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'fetched': 0, 'prefetched': 0,
+                         'failed': 0, 'resized': 0, 'evicted': 0, 'dropped': 0}
+        self.loaded = False
+        os.makedirs(directory, exist_ok=True)
+
+    # Reads every .json file, so it happens on first use rather than at startup
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        for name in os.listdir(self.directory):
+            key, _, ext = name.partition('.')
+            path = os.path.join(self.directory, name)
+            if ext == 'json':
+                try:
+                    with open(path) as f:
+                        self.meta[key] = json.load(f)
+                except (OSError, ValueError):
+                    os.remove(path)
+            elif ext == 'img' or (ext.startswith('w') and not ext.endswith('.tmp')):
+                self.lru.found(key, os.stat(path))
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def _write_meta(self, key):
+        with open(self._path(key, 'json'), 'w') as f:
+            json.dump(self.meta[key], f)
+
+    # Make a remote image servable, returns its key (None for anything that isn't an http(s) URL)
+    def register(self, url):
+        if not url or not url.startswith(('http://', 'https://')):
+            return None
+        self.load()
+        key = image_key(url)
+        if key not in self.meta:
+            self.meta[key] = {'url': canonical_url(url), 'stored_at': 0}
+            self._write_meta(key)
+        return key
+
+    # Fetch an image in the background as it is scraped, at most `concurrency` downloads run at once
+    def prefetch(self, url):
+        key = self.register(url)
+        if key is None or key in self.lru or key in self.fetching:
+            return key
+        if len(self.waiting) >= MAX_WAITING:
+            self.counters['dropped'] += 1
+            return key
+        self.waiting.append(key)
+        while self.waiting and self.pool.free():
+            self._spawn_fetch(self.waiting.popleft(), prefetch=True)
+        return key
+
+    def _spawn_fetch(self, key, prefetch=False):
+        if key not in self.fetching:
+            self.fetching[key] = self.pool.spawn(self._fetch, key, prefetch)
+            # Linked after the pool's own callback, so the download's slot is free again when _done runs
+            self.fetching[key].link(self._done, key)
+        return self.fetching[key]
+
+    def _done(self, thread, key):
+        self.fetching.pop(key, None)
+        # Keep the pool busy with whatever the scraper queued meanwhile
+        while self.waiting and self.pool.free():
+            waiting = self.waiting.popleft()
+            if waiting not in self.lru:
+                self._spawn_fetch(waiting, prefetch=True)
+
+    def _fetch(self, key, prefetch=False):
+        try:
+            return self._download(key, prefetch)
+        except Exception as e:
+            self.counters['failed'] += 1
+            print(f"Image proxy could not fetch {self.meta[key]['url']}: {e}")
+            return False
+
+    # Download (or conditionally revalidate) one image, returns True when a body is cached
+    def _download(self, key, prefetch=False):
+        meta = self.meta[key]
+        conditional = {}
+        if key in self.lru:
+            if meta.get('etag'):
+                conditional['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                conditional['If-Modified-Since'] = meta['last_modified']
+        # Straight through the shared session, the page cache in http_client is for HTML and JSON
+        response = http_client.get_session().get(meta['url'], headers=conditional, timeout=http_client.TIMEOUT)
+        if response.status_code == 304 and key in self.lru:
+            self.counters['revalidated'] += 1
+            meta['stored_at'] = time.time()
+            self._write_meta(key)
+            return True
+        if response.status_code != 200:
+            raise ImageProxyError(f'HTTP {response.status_code}')
+        body = response.content
+        if sniff_extension(body[:16]) is None:
+            raise ImageProxyError('Not a JPEG, PNG, GIF or WebP image')
+
+        # A changed image replaces the old body and every variant made from it
+        self.lru.remove(key)
+        temp_path = self._path(key, 'img.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+        os.replace(temp_path, self._path(key, 'img'))
+        meta.update({
+            'stored_at': time.time(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'extension': sniff_extension(body[:16]),
+        })
+        self._write_meta(key)
+        self.lru.add(key, len(body))
+        self.counters['prefetched' if prefetch else 'fetched'] += 1
+        self.counters['evicted'] += self.lru.evict(busy=self.fetching)
+        return True
+
+    # Path of the image for `key` resized to `width` (None: the original), fetching it first if needed
+    # Returns None when the key is unknown or the origin doesn't have the image
+    def path(self, key, width=None):
+        if not self.known(key):
+            return None
+        if key in self.lru:
+            self.counters['hits'] += 1
+            if time.time() - self.meta[key]['stored_at'] >= self.ttl:
+                self._spawn_fetch(key)  # Serve what we have, the next request gets the revalidated image
+        else:
+            self.counters['misses'] += 1
+            if not self._spawn_fetch(key).wait() or key not in self.lru:
+                return None
+        self.lru.touch(key)
+        width = self.variant_width(width)
+        if width is None or pillow() is None:
+            return self._path(key, 'img')
+        return self._variant(key, width)
+
+    # Round a requested width up to one we keep variants for, None when the original is at least as small
+    def variant_width(self, width):
+        if not width:
+            return None
+        for allowed in self.widths:
+            if width <= allowed:
+                return allowed
+        return None
+
+    def _variant(self, key, width):
+        ext = f'w{width}'
+        if not os.path.exists(self._path(key, ext)):
+            if (key, width) not in self.resizing:
+                self.resizing[(key, width)] = eventlet.spawn(self._resize_variant, key, width)
+            if not self.resizing[(key, width)].wait():
+                return self._path(key, 'img')
+        return self._path(key, ext)
+
+    def _resize_variant(self, key, width):
+        try:
+            # Off the event loop, like ImageStore's thumbnails
+            size = tpool.execute(_resize, self._path(key, 'img'), self._path(key, f'w{width}'), width)
+        except Exception as e:
+            print(f"Image proxy could not resize {self.meta[key]['url']}: {e}")
+            return False
+        finally:
+            self.resizing.pop((key, width), None)
+        self.lru.grow(key, size)
+        self.counters['resized'] += 1
+        self.counters['evicted'] += self.lru.evict(busy=self.fetching)
+        return True
+
+    def known(self, key):
+        self.load()
+        return key in self.meta
+
+    def mimetype(self, key):
+        return mimetypes.guess_type('image' + self.meta[key].get('extension', ''))[0]
+
+    def url(self, key):
+        return self.meta[key]['url']
+
+    def max_age(self, key):
+        return max(0, int(self.meta[key]['stored_at'] + self.ttl - time.time()))
+
+    def stats(self):
+        self.load()
+        return dict(
+            self.counters,
+            registered=len(self.meta),
+            cached=len(self.lru),
+            fetching=len(self.fetching),
+            waiting=len(self.waiting),
+            size_mb=round(self.lru.total_bytes / 1024 / 1024, 2),
+            max_mb=round(self.max_bytes / 1024 / 1024, 2),
+            resizing=pillow() is not None,
+        )
+
+
+# Write `source` scaled down to `width` pixels wide (height keeps the aspect ratio), returns the new file's size
+def _resize(source, destination, width):
+    with pillow().open(source) as image:
+        image_format = image.format
+        image.thumbnail((width, image.height))  # Only ever shrinks, and keeps the aspect ratio
+        temp_path = destination + '.tmp'
+        image.save(temp_path, format=image_format)
+    os.replace(temp_path, destination)
+    return os.path.getsize(destination)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import eventlet
+from eventlet import tpool
+
+# Content-addressed store for uploaded images.
+# An upload is hashed (SHA-256) while it is streamed to a temporary file and then moved to
+# <directory>/<first two hex chars>/<digest><ext>, so the same image uploaded twice is stored once
+# and a name can never be overwritten with different content. Thumbnails are made in the background
+# under <directory>/thumbs/ and, like the originals, never change once written.
+
+# Pillow makes the thumbnails; without it the original is served in their place
+# Imported on first use (it is a noticeable part of startup), None when it isn't installed
+_pillow = None
+
+
+def pillow():
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image
+            _pillow = Image
+        except ImportError:
+            _pillow = False
+    return _pillow or None
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (96, 96)
+
+# Leading bytes of the image formats we accept, and the extension they are stored under
+SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+
+NAME_PATTERN = re.compile(r'^[0-9a-f]{64}\.(jpg|png|gif|webp)$')
+
+
+class ImageStoreError(Exception):
+    pass
+
+
+def sniff_extension(head):
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+class ImageStore:
+    def __init__(self, directory, thumbnail_size=THUMBNAIL_SIZE):
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+        self.pending = {}  # name -> green thread making its thumbnail
+        self.stored = 0
+        self.deduplicated = 0
+        self.thumbnails = 0
+        os.makedirs(os.path.join(directory, 'thumbs'), exist_ok=True)
+
+    # Only names the store itself handed out, anything else (e.g. '../') is not a stored image
+    def exists(self, name):
+        return bool(NAME_PATTERN.match(name)) and os.path.exists(self.path(name))
+
+    def path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def thumbnail_path(self, name):
+        return os.path.join(self.directory, 'thumbs', name)
+
+    # Stream `stream` (a file-like object) into the store, returns (name, deduplicated)
+    def save(self, stream):
+        digest = hashlib.sha256()
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.upload-')
+        try:
+            with os.fdopen(descriptor, 'wb') as temp:
+                head = b''
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    temp.write(chunk)
+            extension = sniff_extension(head)
+            if extension is None:
+                raise ImageStoreError('Not a JPEG, PNG, GIF or WebP image')
+
+            name = digest.hexdigest() + extension
+            path = self.path(name)
+            if os.path.exists(path):
+                self.deduplicated += 1
+                return name, True
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(temp_path, 0o644)  # mkstemp creates it private to us
+            os.replace(temp_path, path)
+            self.stored += 1
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.make_thumbnail(name)
+        return name, False
+
+    # Resize in a real thread (Pillow releases the GIL) so the event loop keeps serving meanwhile
+    def make_thumbnail(self, name):
+        if pillow() is None or name in self.pending or os.path.exists(self.thumbnail_path(name)):
+            return
+        self.pending[name] = eventlet.spawn(self._thumbnail, name)
+
+    def _thumbnail(self, name):
+        try:
+            tpool.execute(self._resize, self.path(name), self.thumbnail_path(name))
+            self.thumbnails += 1
+        except Exception as e:
+            print(f"Thumbnail failed for {name}: {e}")
+        finally:
+            self.pending.pop(name, None)
+
+    def _resize(self, source, destination):
+        Image = pillow()
+        with Image.open(source) as image:
+            image.thumbnail(self.thumbnail_size)
+            if destination.endswith('.jpg') and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            # Write next to the destination and rename, a half written thumbnail is never served
+            temp_path = destination + '.tmp'
+            image.save(temp_path, format=Image.registered_extensions()[os.path.splitext(destination)[1]])
+            os.replace(temp_path, destination)
+
+    def has_thumbnail(self, name):
+        return os.path.exists(self.thumbnail_path(name))
+
+    def stats(self):
+        return {'stored': self.stored, 'deduplicated': self.deduplicated, 'thumbnails': self.thumbnails,
+                'pending_thumbnails': len(self.pending), 'thumbnailing': pillow() is not None}
@@ -0,0 +1,199 @@
+import json
+import os
+import pickle
+import queue
+import re
+import subprocess
+import sys
+import time
+
+import site_adapters
+
+# Product page parsing, kept free of Flask/Socket.IO state so it can run in worker processes.
+# The server is a single eventlet thread: while BeautifulSoup builds a tree nothing else runs,
+# socket heartbeats included. ParsePool hands the raw page to a process per core and the green
+# thread that fetched it just waits for the (small) product dict to come back.
+# bs4 is only imported by whatever parses, so the server starts without loading it. Where each field is
+# on the page comes from the site's adapter (see site_adapters.py).
+
+# Use lxml when it is installed, it builds trees several times faster than html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+# Import bs4 and compile the default site's extraction plan ahead of the first page
+def load_parser():
+    site_adapters.adapter_for().plan()
+
+
+# Return the body of the inline <script> containing `marker`, without parsing the rest of the page
+def find_inline_script(content, marker):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    position = content.find(marker)
+    if position == -1:
+        return None
+    start = content.rfind('<script', 0, position)
+    start = content.find('>', start) + 1
+    end = content.find('</script>', position)
+    return content[start:end if end != -1 else len(content)]
+
+
+# Extract the product dict from a product page of `adapter`'s site (default: USG Store), returns (product, parse seconds)
+def parse_product_page(content, brand, fast_parse=True, adapter=None):
+    from bs4 import BeautifulSoup
+
+    adapter = adapter or site_adapters.adapter_for()
+    plan = adapter.plan()
+    product = {}
+    variants = []  # To store variants/sub-products
+
+    parse_started = time.perf_counter()
+    if fast_parse:
+        # Only build the elements the site's fields are in, the inline product script is cut out of the raw text
+        soup = BeautifulSoup(content, HTML_PARSER, parse_only=plan.strainer)
+        script_content = find_inline_script(content, plan.script_marker) if plan.script_marker else None
+    else:
+        soup = BeautifulSoup(content, 'html.parser')
+        script_tag = soup.find('script', text=re.compile(re.escape(plan.script_marker))) if plan.script_marker else None
+        script_content = script_tag.string if script_tag else None
+
+    # Scraping product details (title, color, image ... wherever the site keeps them)
+    plan.extract(soup, product)
+    product['Brand'] = brand
+    product.update(adapter.constants)
+
+    # Check if there is embedded JavaScript containing product data
+    if script_content:
+        # Use regex to find specific product fields like 'SKU', 'Size', etc.
+        size_match = re.search(r'"Size":"(.*?)"', script_content)
+        sku_match = re.search(r'"sku":"(.*?)"', script_content)
+        barcode_match = re.search(r'"barcode":"(.*?)"', script_content)
+        weight_match = re.search(r'"weight":(\d+)', script_content)
+        quantity_match = re.search(r'"inventory_quantity":(\d+)', script_content)
+        id_match = re.search(r'"id":(\d+)', script_content)
+        gender_match = re.search(r'"type":"(.*?)"', script_content)
+
+        # Extract and store the found values
+        product['Size'] = size_match.group(1) if size_match else 'Size not found'
+        product['SKU'] = sku_match.group(1) if sku_match else 'SKU not found'
+        product['Barcode'] = barcode_match.group(1) if barcode_match else 'Barcode not found'
+        product['Weight'] = weight_match.group(1) if weight_match else 'Weight not found'
+        product['Quantity'] = quantity_match.group(1) if quantity_match else 'Quantity not found'
+        product['id'] = id_match.group(1) if id_match else 'ID not found'
+        product['Gender'] = gender_match.group(1) if gender_match else 'gender not found'
+
+        # Add variants logic
+        product_data_match = re.search(r'product:\s*(\{.*\})', script_content)
+        if product_data_match:
+            product_data_json = product_data_match.group(1)
+            product_data = json.loads(product_data_json)
+
+            # Add the original product details
+            product['id'] = product_data.get('id', 'ID not found')
+
+            # Loop through each variant to extract its specific details
+            for variant in product_data['variants']:
+                variant_data = {
+
+                    'Size': variant.get('option2', 'Size not found'),
+                    'ID': variant.get('id', 'ID not found'),
+                    'SKU': variant.get('sku', 'SKU not found'),
+                    'Barcode': variant.get('barcode', 'Barcode not found'),
+                    'Quantity': variant.get('inventory_quantity', 'Quantity not found'),
+                    'Available': variant.get('available'),
+                    'Weight': variant.get('weight', 'Weight not found')
+
+                }
+                variants.append(variant_data)
+
+    else:
+        print('No JavaScript object found containing product details')
+
+    # Add variants to the main product dictionary
+    product['Variants'] = variants
+
+    return product, time.perf_counter() - parse_started
+
+
+class ParseError(Exception):
+    pass
+
+
+# Worker loop: read (content, brand, fast_parse, adapter) pickles from stdin, write (ok, result) pickles back
+def serve():
+    # Keep the original stdout for results and send the parser's prints to stderr
+    results = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    load_parser()  # Load bs4 before the first page arrives, parsing is all this process does
+    while True:
+        try:
+            content, brand, fast_parse, adapter = pickle.load(sys.stdin.buffer)
+        except EOFError:
+            return  # The server went away
+        try:
+            result = (True, parse_product_page(content, brand, fast_parse, adapter))
+        except Exception as e:
+            result = (False, f'{type(e).__name__}: {e}')
+        pickle.dump(result, results)
+        results.flush()
+
+
+class ParsePool:
+    # workers=0 parses in the calling process (useful for debugging and profiling)
+    # Workers are plain `python product_page.py` processes talking over pipes rather than a multiprocessing
+    # pool: forked children would share eventlet's hub with the server, spawned ones would re-import app.py
+    def __init__(self, workers=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.idle = None
+        self.submitted = 0
+        self.in_flight = 0
+        self.restarted = 0
+
+    def _start_worker(self):
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    # Started on first use (or by start()) so importing the server doesn't start processes it may never need
+    def start(self):
+        if self.idle is None:
+            self.idle = queue.Queue()
+            for _ in range(self.workers):
+                self.idle.put(self._start_worker())
+
+    def _checkout(self):
+        self.start()
+        return self.idle.get()
+
+    # Same result as parse_product_page; under eventlet only the calling green thread waits on the pipe
+    def parse(self, content, brand, fast_parse=True, adapter=None):
+        if not self.workers:
+            return parse_product_page(content, brand, fast_parse, adapter)
+        self.submitted += 1
+        self.in_flight += 1
+        worker = self._checkout()
+        try:
+            pickle.dump((content, brand, fast_parse, adapter), worker.stdin)
+            worker.stdin.flush()
+            ok, result = pickle.load(worker.stdout)
+        except (EOFError, OSError, pickle.UnpicklingError) as e:
+            # The worker died mid page, replace it so the pool keeps its size
+            worker.kill()
+            worker = self._start_worker()
+            self.restarted += 1
+            raise ParseError(f'Parse worker exited: {e}')
+        finally:
+            self.in_flight -= 1
+            self.idle.put(worker)
+        if not ok:
+            raise ParseError(result)
+        return result
+
+    def stats(self):
+        return {'workers': self.workers, 'submitted': self.submitted, 'in_flight': self.in_flight, 'restarted': self.restarted}
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,251 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+
+from change_tracker import product_key
+
+# SQLite store for scraped products and their variants.
+# The scrape pipeline queues products with add() and they are written in batches, API handlers
+# read through their own connections; WAL mode lets those reads run while a batch is being written.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    source_store TEXT NOT NULL,
+    id TEXT NOT NULL,
+    brand TEXT,
+    title TEXT,
+    handle TEXT,
+    sku TEXT,
+    barcode TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source_store, id)
+);
+CREATE TABLE IF NOT EXISTS variants (
+    source_store TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    sku TEXT,
+    barcode TEXT,
+    size TEXT,
+    quantity INTEGER,
+    available INTEGER,
+    PRIMARY KEY (source_store, product_id, id)
+);
+CREATE INDEX IF NOT EXISTS products_brand ON products (brand COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS products_source_store ON products (source_store);
+CREATE INDEX IF NOT EXISTS products_sku ON products (sku);
+CREATE INDEX IF NOT EXISTS products_barcode ON products (barcode);
+CREATE INDEX IF NOT EXISTS variants_sku ON variants (sku);
+CREATE INDEX IF NOT EXISTS variants_barcode ON variants (barcode);
+CREATE INDEX IF NOT EXISTS variants_product ON variants (source_store, product_id, quantity);
+CREATE INDEX IF NOT EXISTS products_page_updated ON products (updated_at, source_store, id);
+CREATE INDEX IF NOT EXISTS products_page_title ON products (COALESCE(title, ''), source_store, id);
+CREATE INDEX IF NOT EXISTS products_page_brand ON products (COALESCE(brand, ''), source_store, id);
+'''
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = {
+    'available': 'ALTER TABLE variants ADD COLUMN available INTEGER',
+}
+
+# Sort orders for page(), each backed by one of the products_page_* indexes
+SORT_KEYS = {
+    'updated': 'updated_at',
+    'title': "COALESCE(title, '')",
+    'brand': "COALESCE(brand, '')",
+}
+
+
+# Opaque cursor for page(): the sort key, store and id of the last row already returned
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != 3:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _available(value):
+    return None if value is None else int(bool(value))
+
+
+def _quantity(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProductStore:
+    def __init__(self, path, batch_size=50):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+        # Green threads share one OS thread, so the connection is guarded by the lock instead of sqlite's thread check
+        self.writer = self._connect()
+        self.writer.executescript(SCHEMA)
+        columns = {row[1] for row in self.writer.execute('PRAGMA table_info(variants)')}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self.writer.execute(statement)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    # Queue a scraped product, written once batch_size products are waiting (or on flush())
+    def add(self, product, source_store):
+        self.pending.append((product, source_store))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            now = time.time()
+            with self.writer:
+                for product, source_store in batch:
+                    key = product_key(product)
+                    if key is None:
+                        continue
+                    self.writer.execute(
+                        'INSERT INTO products (source_store, id, brand, title, handle, sku, barcode, data, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                        'ON CONFLICT (source_store, id) DO UPDATE SET brand = excluded.brand, title = excluded.title, '
+                        'handle = excluded.handle, sku = excluded.sku, barcode = excluded.barcode, '
+                        'data = excluded.data, updated_at = excluded.updated_at',
+                        (source_store, key, product.get('Brand'), product.get('Title'), product.get('Handle'),
+                         product.get('SKU'), product.get('Barcode'), json.dumps(product, default=str), now),
+                    )
+                    self.writer.execute('DELETE FROM variants WHERE source_store = ? AND product_id = ?', (source_store, key))
+                    self.writer.executemany(
+                        'INSERT OR REPLACE INTO variants (source_store, product_id, id, sku, barcode, size, quantity, available) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        [(source_store, key, str(v.get('ID') or v.get('SKU')), v.get('SKU'), v.get('Barcode'),
+                          v.get('Size'), _quantity(v.get('Quantity')), _available(v.get('Available')))
+                         for v in product.get('Variants', [])],
+                    )
+
+    def remove(self, source_store, product_ids):
+        with self.lock, self.writer:
+            for product_id in product_ids:
+                self.writer.execute('DELETE FROM products WHERE source_store = ? AND id = ?', (source_store, product_id))
+                self.writer.execute('DELETE FROM variants WHERE source_store = ? AND product_id = ?', (source_store, product_id))
+
+    # Reads use a short lived connection so they never wait on the writer lock
+    def _query(self, sql, params=()):
+        connection = self._connect()
+        try:
+            return [json.loads(row['data']) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+    def get(self, product_id, source_store=None):
+        if source_store:
+            rows = self._query('SELECT data FROM products WHERE source_store = ? AND id = ?', (source_store, str(product_id)))
+        else:
+            rows = self._query('SELECT data FROM products WHERE id = ?', (str(product_id),))
+        return rows[0] if rows else None
+
+    def find_by_sku(self, sku):
+        return self._query(
+            'SELECT data FROM products WHERE sku = ? UNION '
+            'SELECT p.data FROM products p JOIN variants v ON v.source_store = p.source_store AND v.product_id = p.id '
+            'WHERE v.sku = ?', (sku, sku))
+
+    def find_by_barcode(self, barcode):
+        return self._query(
+            'SELECT data FROM products WHERE barcode = ? UNION '
+            'SELECT p.data FROM products p JOIN variants v ON v.source_store = p.source_store AND v.product_id = p.id '
+            'WHERE v.barcode = ?', (barcode, barcode))
+
+    def find(self, brand=None, source_store=None, limit=100, offset=0):
+        clauses, params = [], []
+        if brand:
+            clauses.append('brand = ? COLLATE NOCASE')
+            params.append(brand)
+        if source_store:
+            clauses.append('source_store = ?')
+            params.append(source_store)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return self._query(f'SELECT data FROM products {where} ORDER BY updated_at DESC LIMIT ? OFFSET ?',
+                           params + [limit, offset])
+
+    # Keyset pagination for the product table: rows come without their variants (variant_count tells how many),
+    # pass the returned cursor back to get the next page. Returns (products, next cursor or None)
+    def page(self, brand=None, source_store=None, in_stock=False, sort='updated', descending=True, cursor=None, limit=100):
+        key = SORT_KEYS.get(sort)
+        if key is None:
+            raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(SORT_KEYS)}")
+        clauses, params = self._filters(brand, source_store, in_stock)
+        if cursor:
+            clauses.append(f"({key}, source_store, id) {'<' if descending else '>'} (?, ?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        direction = 'DESC' if descending else 'ASC'
+        sql = (f'SELECT {key} AS sort_key, source_store, id, data, '
+               '(SELECT COUNT(*) FROM variants v WHERE v.source_store = p.source_store AND v.product_id = p.id) AS variant_count '
+               f'FROM products p {where} ORDER BY {key} {direction}, source_store {direction}, id {direction} LIMIT ?')
+        connection = self._connect()
+        try:
+            rows = connection.execute(sql, params + [limit + 1]).fetchall()
+        finally:
+            connection.close()
+        products = []
+        for row in rows[:limit]:
+            product = json.loads(row['data'])
+            product.pop('Variants', None)
+            product['store'] = row['source_store']
+            product['variant_count'] = row['variant_count']
+            products.append(product)
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last['sort_key'], last['source_store'], last['id']])
+        return products, next_cursor
+
+    # Number of products matching the same filters as page()
+    def count_matching(self, brand=None, source_store=None, in_stock=False):
+        clauses, params = self._filters(brand, source_store, in_stock)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        connection = self._connect()
+        try:
+            return connection.execute(f'SELECT COUNT(*) FROM products p {where}', params).fetchone()[0]
+        finally:
+            connection.close()
+
+    def _filters(self, brand, source_store, in_stock):
+        clauses, params = [], []
+        if brand:
+            clauses.append('brand = ? COLLATE NOCASE')
+            params.append(brand)
+        if source_store:
+            clauses.append('source_store = ?')
+            params.append(source_store)
+        if in_stock:
+            # Stores that don't publish stock counts still say whether a variant can be bought
+            clauses.append('EXISTS (SELECT 1 FROM variants v WHERE v.source_store = p.source_store '
+                           'AND v.product_id = p.id AND (v.quantity > 0 OR (v.quantity IS NULL AND v.available = 1)))')
+        return clauses, params
+
+    def count(self):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        finally:
+            connection.close()
@@ -0,0 +1,249 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import eventlet
+from eventlet.queue import Queue
+
+# Background scrape jobs.
+# A scrape request becomes a job with an id that sits in a queue until one of the workers picks it up,
+# so a browser disconnect doesn't stop it and several operators' scrapes run side by side.
+# Every finished product URL is checkpointed in SQLite; after a restart unfinished jobs are queued
+# again and skip what their checkpoint says is already done.
+# Several server workers can share the database: each runs the jobs it was given and resumes only its
+# own (by worker id), while lookups and cancellation work from any worker.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scrape_jobs (
+    id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL,
+    worker TEXT,
+    cancel_requested INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS scrape_checkpoints (
+    job_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (job_id, key)
+);
+'''
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = {
+    'worker': 'ALTER TABLE scrape_jobs ADD COLUMN worker TEXT',
+    'cancel_requested': 'ALTER TABLE scrape_jobs ADD COLUMN cancel_requested INTEGER DEFAULT 0',
+}
+
+JOB_COLUMNS = 'id, params, status, done, failed, error, created_at'
+
+CHECKPOINT_BATCH = 25
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ScrapeJob:
+    def __init__(self, manager, job_id, params, status='queued', done=0, failed=0, created_at=None, resumed=False):
+        self.manager = manager
+        self.id = job_id
+        self.params = params
+        self.status = status
+        self.done = done
+        self.failed = failed
+        self.error = None
+        self.created_at = created_at or time.time()
+        self.resumed = resumed  # Picked up again after a restart
+        self.cancelled = False
+        self.completed_keys = set()
+        self.pending_keys = []
+
+    def is_done(self, key):
+        return key in self.completed_keys
+
+    # Record a finished product URL (or handle); checkpoints are written in small batches
+    def mark_done(self, key, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+            self.completed_keys.add(key)
+            self.pending_keys.append(key)
+        if len(self.pending_keys) >= CHECKPOINT_BATCH:
+            self.manager.checkpoint(self)
+        self.manager.report(self)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'done': self.done,
+            'failed': self.failed,
+            'error': self.error,
+            'params': self.params,
+            'created_at': self.created_at,
+            'resumed': self.resumed,
+        }
+
+
+class JobManager:
+    # runner(job) does the scrape; on_update(job) is called on every progress change
+    # worker_id names this server process among the ones sharing the database
+    # before_checkpoint(job) runs before finished keys are checkpointed, to save whatever they produced
+    # (a key checkpointed before its product is written would be skipped on resume and never written)
+    def __init__(self, path, runner, workers=2, on_update=None, worker_id='default', before_checkpoint=None):
+        self.runner = runner
+        self.on_update = on_update
+        self.before_checkpoint = before_checkpoint
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(scrape_jobs)')}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self.connection.execute(statement)
+        self.jobs = {}
+        self.queue = Queue()
+        self._resume()
+        self.workers = [eventlet.spawn(self._work) for _ in range(workers)]
+
+    # A job as stored, for jobs another worker runs (or that finished before this worker started)
+    def _from_row(self, row, resumed=False):
+        job_id, params, status, done, failed, error, created_at = row
+        job = ScrapeJob(self, job_id, json.loads(params), status, done, failed, created_at, resumed=resumed)
+        job.error = error
+        return job
+
+    # Queue again every job of this worker that was queued or running when the server stopped
+    def _resume(self):
+        rows = self.connection.execute(
+            f"SELECT {JOB_COLUMNS} FROM scrape_jobs WHERE status IN ('queued', 'running') "
+            "AND (worker = ? OR worker IS NULL) ORDER BY created_at", (self.worker_id,)
+        ).fetchall()
+        for row in rows:
+            job = self._from_row(row, resumed=True)
+            job.status = 'queued'
+            job_id = job.id
+            job.completed_keys = {key for (key,) in self.connection.execute(
+                'SELECT key FROM scrape_checkpoints WHERE job_id = ?', (job_id,))}
+            self.jobs[job_id] = job
+            self.queue.put(job)
+            print(f"Resuming scrape job {job_id}, {len(job.completed_keys)} products already done")
+
+    def submit(self, params):
+        job = ScrapeJob(self, uuid.uuid4().hex, params)
+        self.jobs[job.id] = job
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO scrape_jobs (id, params, status, created_at, updated_at, worker) VALUES (?, ?, ?, ?, ?, ?)',
+                (job.id, json.dumps(params), job.status, job.created_at, job.created_at, self.worker_id),
+            )
+        self.queue.put(job)
+        self.report(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return self._request_cancel(job_id)
+        if job.status not in ('queued', 'running'):
+            return None
+        job.cancelled = True
+        if job.status == 'queued':
+            self._set_status(job, 'cancelled')
+        return job
+
+    # The job runs on another worker: flag it, that worker stops at its next checkpoint
+    def _request_cancel(self, job_id):
+        with self.lock, self.connection:
+            updated = self.connection.execute(
+                "UPDATE scrape_jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,)).rowcount
+        return self.get(job_id) if updated else None
+
+    def _cancel_requested(self, job):
+        with self.lock:
+            row = self.connection.execute('SELECT cancel_requested FROM scrape_jobs WHERE id = ?', (job.id,)).fetchone()
+        return bool(row and row[0])
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            with self.lock:
+                row = self.connection.execute(f'SELECT {JOB_COLUMNS} FROM scrape_jobs WHERE id = ?', (job_id,)).fetchone()
+            job = self._from_row(row) if row else None
+        return job
+
+    # Jobs of every worker, this worker's from memory since they are more current than the database
+    def list(self, limit=100):
+        with self.lock:
+            rows = self.connection.execute(
+                f'SELECT {JOB_COLUMNS} FROM scrape_jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        return [self.jobs.get(row[0]) or self._from_row(row) for row in rows]
+
+    def checkpoint(self, job):
+        if self.before_checkpoint:
+            self.before_checkpoint(job)
+        keys, job.pending_keys = job.pending_keys, []
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO scrape_checkpoints (job_id, key) VALUES (?, ?)',
+                                        [(job.id, key) for key in keys])
+            self.connection.execute('UPDATE scrape_jobs SET done = ?, failed = ?, updated_at = ? WHERE id = ?',
+                                    (job.done, job.failed, time.time(), job.id))
+        if self._cancel_requested(job):
+            job.cancelled = True
+
+    def report(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+    def _set_status(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE scrape_jobs SET status = ?, error = ?, done = ?, failed = ?, updated_at = ? WHERE id = ?',
+                                    (status, error, job.done, job.failed, time.time(), job.id))
+            # Finished jobs don't need their checkpoint any more
+            if status in ('done', 'cancelled'):
+                self.connection.execute('DELETE FROM scrape_checkpoints WHERE job_id = ?', (job.id,))
+        self.report(job)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job.cancelled or self._cancel_requested(job):
+                job.cancelled = True
+                self._set_status(job, 'cancelled')
+                continue
+            self._set_status(job, 'running')
+            try:
+                self.runner(job)
+                job.check_cancelled()
+            except JobCancelled:
+                self.checkpoint(job)
+                self._set_status(job, 'cancelled')
+            except Exception as e:
+                print(f"Scrape job {job.id} failed: {e}")
+                self.checkpoint(job)
+                self._set_status(job, 'failed', str(e))
+            else:
+                self.checkpoint(job)
+                self._set_status(job, 'done')
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return dict(counts, queue_depth=self.queue.qsize(), worker=self.worker_id)
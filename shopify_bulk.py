@@ -0,0 +1,286 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import requests
+
+import upload_scheduler
+from change_tracker import product_key
+
+# Bulk upload of scraped products through Shopify's GraphQL bulk operations.
+#
+# A batch of products is written to a JSONL staging file (one productSet input per line, all
+# variants and metafields included), uploaded to Shopify's staged upload target, and run as one
+# bulkOperationRunMutation. We then poll the operation and map its result file back to the source
+# products by line number. A whole catalog costs a handful of requests instead of several per product.
+
+API_VERSION = '2024-10'
+STAGING_DIR = 'bulk_staging'
+
+PRODUCT_SET_MUTATION = '''
+mutation call($input: ProductSetInput!) {
+  productSet(synchronous: true, input: $input) {
+    product { id handle variants(first: 250) { nodes { id sku } } }
+    userErrors { field message }
+  }
+}
+'''
+
+STAGED_UPLOAD_MUTATION = '''
+mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}
+'''
+
+RUN_MUTATION = '''
+mutation bulkOperationRunMutation($mutation: String!, $stagedUploadPath: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+'''
+
+RUN_QUERY = '''
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+'''
+
+POLL_QUERY = '''
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+'''
+
+
+class ShopifyBulkError(Exception):
+    pass
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Scraped product dict -> ProductSetInput with every variant and the shipping/returns metafields
+def product_set_input(product, shipping_info, price='199.99', location_id=None):
+    variants = product.get('Variants') or [{
+        'Size': product.get('Size'),
+        'SKU': product.get('SKU'),
+        'Barcode': product.get('Barcode') or product.get('GTIN/UPC/barcode'),
+        'Weight': product.get('Weight'),
+        'Quantity': product.get('Quantity'),
+    }]
+    sizes = []
+    variant_inputs = []
+    for variant in variants:
+        size = str(variant.get('Size') or 'Default')
+        if size in sizes:
+            continue  # Shopify rejects two variants with the same option value
+        sizes.append(size)
+        variant_input = {
+            'optionValues': [{'optionName': 'Size', 'name': size}],
+            'price': price,
+            'inventoryItem': {'sku': variant.get('SKU'), 'tracked': True},
+        }
+        if variant.get('Barcode') and 'not found' not in str(variant['Barcode']):
+            variant_input['barcode'] = str(variant['Barcode'])
+        weight = _number(variant.get('Weight'))
+        if weight is not None:
+            variant_input['inventoryItem']['measurement'] = {'weight': {'value': weight, 'unit': 'GRAMS'}}
+        quantity = _number(variant.get('Quantity'))
+        if location_id and quantity is not None:
+            variant_input['inventoryQuantities'] = [{'locationId': location_id, 'name': 'available', 'quantity': int(quantity)}]
+        variant_inputs.append(variant_input)
+
+    return {
+        'title': product.get('Title'),
+        'descriptionHtml': product.get('Product detail') if product.get('Product detail') != 'N/A' else '',
+        'vendor': product.get('Brand'),
+        'productType': 'Shoes',
+        'productOptions': [{'name': 'Size', 'values': [{'name': size} for size in sizes]}],
+        'variants': variant_inputs,
+        'metafields': [
+            {'namespace': 'shipping', 'key': 'shipping_weight', 'type': 'single_line_text_field', 'value': shipping_info['Shipping weight']},
+            {'namespace': 'shipping', 'key': 'shipping_policy', 'type': 'single_line_text_field', 'value': shipping_info['Shipping policy']},
+            {'namespace': 'returns', 'key': 'returns_policy', 'type': 'single_line_text_field', 'value': shipping_info['Returns and refunds policy']},
+        ],
+    }
+
+
+# Input for a product that already exists in the store: its id plus only what changed.
+# productSet replaces the whole variant list when one is given, so changed variants mean sending all of them.
+def update_input(product, shipping_info, product_id, changes, **input_options):
+    if 'variants' in changes:
+        product_input = dict(product_set_input(product, shipping_info, **input_options), id=product_id)
+        for variant_input in product_input['variants']:
+            variant_id = changes.get('variant_ids', {}).get(variant_input['inventoryItem']['sku'])
+            if variant_id:
+                variant_input['id'] = variant_id
+        return product_input
+    fields = {'title': 'title', 'body_html': 'descriptionHtml', 'vendor': 'vendor'}
+    return dict({fields[field]: value for field, value in changes.items() if field in fields}, id=product_id)
+
+
+# Write one {"input": ...} line per product into `directory` (default STAGING_DIR), returns the staging file path
+# plans holds an optional catalog_mirror plan (action, product id, changes) per product
+def write_staging_file(products, shipping_info, directory=None, plans=None, **input_options):
+    directory = directory or STAGING_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"bulk-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl")
+    with open(path, 'w') as f:
+        for index, product in enumerate(products):
+            action, product_id, changes = plans[index] if plans else ('create', None, None)
+            if action == 'update':
+                product_input = update_input(product, shipping_info, product_id, changes, **input_options)
+            else:
+                product_input = product_set_input(product, shipping_info, **input_options)
+            f.write(json.dumps({'input': product_input}) + '\n')
+    return path
+
+
+class ShopifyBulkClient:
+    # admin_url is https://<store>.myshopify.com, or a local mock endpoint
+    # bucket is an upload_scheduler.LeakyBucket kept in sync with the GraphQL cost feedback
+    def __init__(self, admin_url, access_token, api_version=API_VERSION, session=None, bucket=None):
+        self.endpoint = f"{admin_url.rstrip('/')}/admin/api/{api_version}/graphql.json"
+        self.session = session or requests.Session()
+        self.headers = {'X-Shopify-Access-Token': access_token, 'Content-Type': 'application/json'}
+        self.bucket = bucket
+
+    def graphql(self, query, variables=None, cost=10, max_attempts=5):
+        for attempt in range(max_attempts):
+            if self.bucket:
+                self.bucket.acquire(cost)
+            response = self.session.post(self.endpoint, json={'query': query, 'variables': variables or {}}, headers=self.headers, timeout=30)
+            wait = upload_scheduler.retry_after(response)
+            if wait is not None:
+                self._throttled(wait)
+                continue
+            response.raise_for_status()
+            body = response.json()
+            if self.bucket:
+                self.bucket.update_from_graphql(body)
+            errors = body.get('errors') or []
+            if any((error.get('extensions') or {}).get('code') == 'THROTTLED' for error in errors):
+                self._throttled(cost / (self.bucket.leak_rate if self.bucket else 50))
+                continue
+            if errors:
+                raise ShopifyBulkError(errors)
+            return body['data']
+        raise ShopifyBulkError(f'Still throttled after {max_attempts} attempts')
+
+    def _throttled(self, seconds):
+        print(f"Shopify throttled the request, retrying in {seconds:.1f}s")
+        if self.bucket:
+            self.bucket.pause(seconds)
+        else:
+            time.sleep(seconds)
+
+    # Upload the staging file to Shopify's staged upload target, returns the path for the bulk mutation
+    def stage(self, path):
+        data = self.graphql(STAGED_UPLOAD_MUTATION, {'input': [{
+            'resource': 'BULK_MUTATION_VARIABLES',
+            'filename': os.path.basename(path),
+            'mimeType': 'text/jsonl',
+            'httpMethod': 'POST',
+        }]})['stagedUploadsCreate']
+        if data['userErrors']:
+            raise ShopifyBulkError(data['userErrors'])
+        target = data['stagedTargets'][0]
+        parameters = {p['name']: p['value'] for p in target['parameters']}
+        with open(path, 'rb') as f:
+            response = self.session.post(target['url'], data=parameters, files={'file': f}, timeout=120)
+        response.raise_for_status()
+        return parameters['key']
+
+    def run(self, staged_upload_path, mutation=PRODUCT_SET_MUTATION):
+        data = self.graphql(RUN_MUTATION, {'mutation': mutation, 'stagedUploadPath': staged_upload_path})['bulkOperationRunMutation']
+        if data['userErrors']:
+            raise ShopifyBulkError(data['userErrors'])
+        return data['bulkOperation']['id']
+
+    def run_query(self, query):
+        data = self.graphql(RUN_QUERY, {'query': query})['bulkOperationRunQuery']
+        if data['userErrors']:
+            raise ShopifyBulkError(data['userErrors'])
+        return data['bulkOperation']['id']
+
+    # Poll until the operation finishes, returns the final BulkOperation
+    def wait(self, operation_id, poll_interval=2, timeout=3600, progress=None):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            operation = self.graphql(POLL_QUERY, {'id': operation_id})['node']
+            if progress:
+                progress(operation)
+            if operation['status'] not in ('CREATED', 'RUNNING'):
+                return operation
+            time.sleep(poll_interval)
+        raise ShopifyBulkError(f'Bulk operation {operation_id} did not finish within {timeout}s')
+
+    def results(self, url):
+        if not url:
+            return []
+        response = self.session.get(url, timeout=120)
+        response.raise_for_status()
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+# Upload a batch of products as one bulk operation and map every result line back to its source product.
+# With a catalog mirror, products already in the store are updated (changed fields only) or skipped
+# instead of being created again, and the mirror is updated from the results.
+def bulk_upload(client, products, shipping_info, progress=None, poll_interval=2, mirror=None, **input_options):
+    results = [{'source': product_key(p), 'title': p.get('Title'), 'status': 'unknown', 'errors': []} for p in products]
+    plans = [mirror.plan(p) for p in products] if mirror else [('create', None, None)] * len(products)
+
+    # Only products that need a create or an update go into the staging file
+    pending = []
+    for index, plan in enumerate(plans):
+        if plan[0] == 'skip':
+            results[index].update(status='skipped', product_id=plan[1])
+        else:
+            pending.append(index)
+    if not pending:
+        return {'operation': None, 'results': results}
+
+    path = write_staging_file([products[i] for i in pending], shipping_info, plans=[plans[i] for i in pending], **input_options)
+    try:
+        operation_id = client.run(client.stage(path))
+    finally:
+        os.remove(path)  # Shopify has its own copy once it is staged, and a failed upload is written again next time
+    operation = client.wait(operation_id, poll_interval=poll_interval, progress=progress)
+
+    for line in client.results(operation.get('url') or operation.get('partialDataUrl')):
+        line_number = line.get('__lineNumber')
+        if line_number is None or line_number >= len(pending):
+            continue
+        index = pending[line_number]
+        payload = (line.get('data') or {}).get('productSet') or {}
+        result = results[index]
+        if payload.get('userErrors'):
+            result['status'] = 'failed'
+            result['errors'] = payload['userErrors']
+        elif payload.get('product'):
+            shopify_product = payload['product']
+            result['status'] = 'updated' if plans[index][0] == 'update' else 'uploaded'
+            result['product_id'] = shopify_product['id']
+            result['handle'] = shopify_product.get('handle')
+            if mirror:
+                variant_ids = {v['sku']: v['id'] for v in (shopify_product.get('variants') or {}).get('nodes', []) if v.get('sku')}
+                mirror.record(shopify_product['id'], products[index], variant_ids=variant_ids, handle=shopify_product.get('handle'))
+        if line.get('errors'):
+            result['status'] = 'failed'
+            result['errors'] += line['errors']
+    return {'operation': operation, 'results': results}
@@ -0,0 +1,100 @@
+from urllib.parse import urlparse
+import http_client
+
+# Shopify storefronts expose their catalog as JSON:
+#   /collections/<handle>/products.json?limit=250&page=N  -> up to 250 products (with variants) per request
+#   /products/<handle>.js                                 -> one product, variants include barcode
+# Neither gives stock counts (inventory_quantity) any more, only whether each variant can be bought (`available`).
+# Reading these is far cheaper than downloading and parsing every product page.
+
+PAGE_LIMIT = 250  # Max page size Shopify allows on products.json
+
+
+# Yield raw product dicts from a collection, following ?page=N until a page comes back empty
+# Pages are requested through call(http_client.get, ...) when given, e.g. the site's limiter
+def collection_products(collection_url, limit=PAGE_LIMIT, call=None):
+    call = call or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+    page = 1
+    while True:
+        response = call(http_client.get, f"{collection_url.rstrip('/')}/products.json", params={'limit': limit, 'page': page})
+        response.raise_for_status()
+        products = response.json().get('products', [])
+        if not products:
+            return
+        for product in products:
+            yield product
+        if len(products) < limit:
+            return
+        page += 1
+
+
+# Fetch the full product object for one handle from /products/<handle>.js
+def product_js(store_url, handle):
+    parsed = urlparse(store_url)
+    response = http_client.get(f"{parsed.scheme}://{parsed.netloc}/products/{handle}.js")
+    response.raise_for_status()
+    return response.json()
+
+
+# Index of the option called `name` (e.g. 'Size'), falls back to `default` like the HTML scraper did
+def option_index(data, names, default=None):
+    for position, option in enumerate(data.get('options') or []):
+        option_name = option.get('name') if isinstance(option, dict) else option
+        if option_name and option_name.strip().lower() in names:
+            return position + 1
+    return default
+
+
+# Convert a Shopify product JSON object into the same dict scrape_product() returns
+# `constants` are the fixed field values of the store's site adapter (Material, Age group ...)
+def to_product(data, brand, constants=None):
+    product = {}
+    variants = []
+
+    product['Title'] = data.get('title', 'Title not found')
+    product['Brand'] = brand
+    product.update(constants or {})
+    product['id'] = data.get('id', 'ID not found')
+    product['Gender'] = data.get('product_type') or data.get('type') or 'gender not found'
+    product['Handle'] = data.get('handle')
+    product['Product detail'] = data.get('body_html') or data.get('description') or 'N/A'
+
+    size_option = option_index(data, ('size', 'us size', 'shoe size'), default=2)
+    color_option = option_index(data, ('color', 'colour'))
+
+    for variant in data.get('variants', []):
+        available = variant.get('available')
+        # Sold out is a quantity of 0, a count for variants that are available is only known to older stores
+        quantity = variant.get('inventory_quantity', 0 if available is False else 'Quantity not found')
+        variants.append({
+            'Size': variant.get(f'option{size_option}') or 'Size not found',
+            'ID': variant.get('id', 'ID not found'),
+            'SKU': variant.get('sku') or 'SKU not found',
+            'Barcode': variant.get('barcode') or 'Barcode not found',
+            'Quantity': quantity,
+            'Available': available,
+            'Weight': variant.get('grams', variant.get('weight', 'Weight not found'))
+        })
+    product['Variants'] = variants
+
+    # Top level fields mirror the first variant, same as the HTML scraper
+    if variants:
+        first = variants[0]
+        product['Size'] = first['Size']
+        product['SKU'] = first['SKU']
+        product['Barcode'] = first['Barcode']
+        product['Weight'] = str(first['Weight'])
+        product['Quantity'] = str(first['Quantity'])
+        product['Available'] = any(variant['Available'] for variant in variants)
+        if color_option:
+            product['Color'] = data['variants'][0].get(f'option{color_option}')
+
+    # products.json gives image objects, .js gives plain URLs; take the second image like the HTML scraper
+    images = [image['src'] if isinstance(image, dict) else image for image in data.get('images', [])]
+    if images:
+        img_src = images[1] if len(images) >= 2 else images[0]
+        if img_src.startswith('//'):
+            img_src = 'https:' + img_src
+        product['Image'] = img_src
+
+    return product
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+# Per-site scraping settings: where a brand's collection lives, how to find product links on it, which
+# elements of a product page hold which field, and how hard the site may be crawled.
+#
+# An adapter is declarative (plain dicts, so sites can be added from a JSON file, see load()) and is
+# compiled once into an ExtractionPlan: soupsieve selectors, the SoupStrainer that builds only the elements
+# the fields live in, and the script marker. Plans are cached by the adapter's content, so parse worker
+# processes compile each site once no matter how many pages they get.
+#
+# Field spec: {'selector': CSS, 'attr': attribute to read (default: the element's text),
+#              'index': which match to use (default 0), 'required': fail the page when it is missing}
+
+# Product links and pagination of a typical Shopify collection page
+SHOPIFY_COLLECTION_LINKS = 'a[href*="/products/"]'
+NEXT_PAGE = 'link[rel=next], a[rel=next], .pagination .next a, a.pagination__next'
+
+# What every adapter gets unless it says otherwise
+DEFAULTS = {
+    'base_url': None,
+    'hosts': [],
+    'collection_path': '/collections/{brand}',
+    'sitemap': '/sitemap.xml',  # Where a whole-store crawl finds the products, None if the site has no sitemap
+    'collection_links': SHOPIFY_COLLECTION_LINKS,
+    'next_page': NEXT_PAGE,
+    'fields': {
+        'Title': {'selector': 'meta[property="og:title"]', 'attr': 'content', 'required': True},
+        'Image': {'selector': 'meta[property="og:image"]', 'attr': 'content'},
+    },
+    # Fixed values for fields the pages don't carry
+    'constants': {'Material': 'Leather', 'Age group': 'Adult'},
+    # Inline script holding the product JSON (SKU, barcode, variants ...), None to skip it
+    'script_marker': 'new Shopify.OptionSelectors',
+    'concurrency': None,  # Product pages fetched at once, None: the app's SCRAPE_CONCURRENCY
+    'rate': None,  # Requests per second, None: no limit beyond the concurrency
+}
+
+# Sites the app knows out of the box. USG's theme is read directly; the other retailers get the generic
+# fields, their Shopify JSON endpoints (where they have them) are used before any page is parsed.
+SITES = [
+    {
+        'name': 'USGStore',
+        'base_url': 'https://usgstore.com.au',
+        'collection_links': 'a.collection-item',
+        'fields': {
+            'Title': {'selector': 'h3', 'required': True},
+            'Color': {'selector': 'h4', 'required': True},
+            'Price': {'selector': 'span.money'},  # The theme's money format, the product's price comes first
+            'Image': {'selector': 'div.product-thumbnail-slider div.thumbnail-slide img', 'attr': 'src', 'index': 1},
+        },
+    },
+    {'name': 'Above The Clouds', 'base_url': 'https://www.abovethecloudsstore.com'},
+    {'name': 'Clique', 'base_url': 'https://cliquelyf.com'},
+    {'name': 'Concrete Jungle', 'base_url': 'https://junglestore.com.au'},
+    {'name': 'Finesse', 'base_url': 'https://www.finessestore.com'},
+    {'name': 'Hemley Store', 'base_url': 'https://hemley.com.au'},
+    {'name': 'Highs and Lows', 'base_url': 'https://www.highsandlows.net.au'},
+    {'name': 'Laced', 'base_url': 'https://laced.com.au'},
+    {'name': 'Mi-Life', 'base_url': 'https://milife.com.au'},
+    {'name': 'Prime', 'base_url': 'https://primeonline.com.au'},
+    {'name': 'Sneaker Lounge', 'base_url': 'https://sneakerlounge.au'},
+    {'name': 'Supply Store', 'base_url': 'https://www.supplystore.com.au'},
+    {'name': 'Trainers', 'base_url': 'https://trainers-store.com.au'},
+    {'name': 'Up There', 'base_url': 'https://uptherestore.com'},
+]
+
+# Pages given without a URL (tests, benchmarks, older callers) are read as this site
+DEFAULT_SITE = 'USGStore'
+
+# Leading compound of a selector: tag name, then .classes / #id
+LEADING_COMPOUND = re.compile(r'^([a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)')
+
+
+class SiteAdapter:
+    def __init__(self, name, **spec):
+        unknown = set(spec) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown site adapter settings for {name}: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.spec = dict(DEFAULTS, **spec)
+        self.base_url = self.spec['base_url']
+        self.hosts = [host.lower() for host in self.spec['hosts']]
+        if self.base_url:
+            self.hosts.append(_host(self.base_url))
+        self.constants = self.spec['constants']
+        self.concurrency = self.spec['concurrency']
+        self.rate = self.spec['rate']
+        # What a headless browser waits for before a JS rendered page is read
+        self.wait_for = (self.spec['fields'].get('Title') or {}).get('selector')
+        # Identifies the extraction settings, cached plans are looked up by it
+        self.key = hashlib.sha1(json.dumps(
+            [self.spec[k] for k in ('collection_links', 'next_page', 'fields', 'script_marker')], sort_keys=True).encode()).hexdigest()
+
+    # Collection URL for `brand`: a bare store URL gets the collection path appended, anything else is used as given
+    def collection_url(self, url, brand):
+        parts = urlsplit(url)
+        if not brand or not self.spec['collection_path'] or parts.path not in ('', '/'):
+            return url
+        path = self.spec['collection_path'].format(brand=slug(brand))
+        return urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+
+    # The store's sitemap, a URL that already is one is used as given
+    def sitemap_url(self, url):
+        parts = urlsplit(url)
+        if parts.path.endswith(('.xml', '.xml.gz')):
+            return url
+        if not self.spec['sitemap']:
+            return None
+        return urlunsplit((parts.scheme, parts.netloc, self.spec['sitemap'], '', ''))
+
+    def plan(self):
+        if self.key not in _plans:
+            _plans[self.key] = ExtractionPlan(self.spec)
+        return _plans[self.key]
+
+    def to_dict(self):
+        return {'name': self.name, 'base_url': self.base_url, 'hosts': self.hosts,
+                'concurrency': self.concurrency, 'rate': self.rate}
+
+
+_plans = {}  # SiteAdapter.key -> ExtractionPlan
+
+
+class ExtractionPlan:
+    def __init__(self, spec):
+        # bs4/soupsieve are imported by whatever parses, the server may never need them
+        import soupsieve
+        from bs4 import SoupStrainer
+
+        self.fields = []
+        roots = []
+        for name, field in spec['fields'].items():
+            self.fields.append((name, soupsieve.compile(field['selector']), field.get('attr'),
+                                field.get('index', 0), field.get('required', False)))
+            roots.extend(_leading_compounds(field['selector']))
+        self.collection_links = soupsieve.compile(spec['collection_links'])
+        self.next_page = soupsieve.compile(spec['next_page'])
+        self.script_marker = spec['script_marker']
+        # Only build the subtrees the fields are in; a selector we can't narrow down means parsing everything
+        self.roots = None if None in roots else roots
+        self.strainer = SoupStrainer(self._keep) if self.roots else None
+
+    def _keep(self, name, attrs):
+        for tag, classes, element_id in self.roots:
+            if tag and tag != name:
+                continue
+            if element_id and attrs.get('id') != element_id:
+                continue
+            if classes:
+                present = attrs.get('class') or ''
+                present = present.split() if isinstance(present, str) else present
+                if not all(c in present for c in classes):
+                    continue
+            return True
+        return False
+
+    # Fill `product` with the selector fields found in `soup`
+    def extract(self, soup, product):
+        for name, selector, attr, index, required in self.fields:
+            matches = selector.select(soup, limit=index + 1)
+            value = None
+            if len(matches) > index:
+                element = matches[index]
+                value = element.get(attr) if attr else element.get_text(strip=True)
+            if not value:
+                if required:
+                    raise ValueError(f'{name} not found on the page')
+                print(f'{name} not found on the page')
+                continue
+            # Protocol relative URLs (//cdn...) get https: so they work outside the page
+            if value.startswith('//'):
+                value = 'https:' + value
+            product[name] = value
+
+
+# Every comma separated alternative's first compound as (tag, classes, id), None when it can't be narrowed down
+def _leading_compounds(selector):
+    compounds = []
+    for alternative in selector.split(','):
+        match = LEADING_COMPOUND.match(alternative.strip())
+        tag, rest = match.group(1), match.group(2)
+        if not tag and not rest:
+            compounds.append(None)
+            continue
+        classes = [part[1:] for part in re.findall(r'[.#][\w-]+', rest) if part[0] == '.']
+        ids = [part[1:] for part in re.findall(r'[.#][\w-]+', rest) if part[0] == '#']
+        compounds.append((tag.lower() if tag else None, classes, ids[0] if ids else None))
+    return compounds
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def _host(url):
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+registry = {}  # name -> SiteAdapter
+
+
+def register(adapter):
+    registry[adapter.name] = adapter
+    return adapter
+
+
+def get(name):
+    return registry.get(name)
+
+
+# The adapter for a store URL; hosts without one get the defaults, under the host's name so each has its own limits
+def adapter_for(url=None):
+    if not url:
+        return registry[DEFAULT_SITE]
+    host = _host(url)
+    for adapter in registry.values():
+        if host in adapter.hosts:
+            return adapter
+    if host not in _generic:
+        _generic[host] = SiteAdapter(host)
+    return _generic[host]
+
+
+_generic = {}  # host -> adapter with the default settings
+
+
+# Add (or replace, by name) adapters from a JSON file: a list of {"name": ..., <settings>} objects
+def load(path):
+    with open(path) as f:
+        specs = json.load(f)
+    return [register(SiteAdapter(**spec)) for spec in specs]
+
+
+for _site in SITES:
+    register(SiteAdapter(**_site))
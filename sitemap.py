@@ -0,0 +1,119 @@
+import gzip
+import posixpath
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+from xml.etree.ElementTree import ParseError
+
+import http_client
+
+# Product discovery from a store's XML sitemaps.
+# Shopify lists every product in sitemap_products_<n>.xml (linked from /sitemap.xml) together with when it
+# was last modified, so a crawl can skip the collection pages and fetch only the products that changed
+# since the previous one. Each file is parsed while it downloads and every <url> element is dropped as
+# soon as it is read; what is kept is the (url, lastmod, title) of the products, a fraction of the XML.
+# A file is read to the end before its products are handed out, so the connection isn't held open
+# while the scraper works through them.
+
+# defusedxml refuses entity expansion tricks, without it the standard parser (a recent expat limits them too)
+try:
+    from defusedxml.ElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+MAX_DEPTH = 2  # Sitemap indexes nested deeper than this are not followed
+PRODUCT_PATH = '/products/'
+# Seconds taken off the previous crawl's start before comparing lastmod, the store's clock isn't ours
+CLOCK_SLACK = 600
+
+
+class SitemapError(ValueError):
+    pass
+
+
+def is_sitemap(url):
+    return urlsplit(url or '').path.endswith(('.xml', '.xml.gz'))
+
+
+# W3C datetime (2024-05-01, 2024-05-01T10:00:00Z, 2024-05-01T10:00:00+10:00 ...) as a Unix timestamp, None if unreadable
+def parse_lastmod(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+
+# Entries of one sitemap file (`source` is a file object) as (kind, loc, lastmod, title) tuples,
+# kind being 'sitemap' in an index and 'url' in a url set
+def parse(source):
+    entries = []
+    root = None
+    try:
+        for event, element in iterparse(source, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event != 'end' or _local(element.tag) not in ('url', 'sitemap'):
+                continue
+            loc = lastmod = title = None
+            for child in element:
+                name = _local(child.tag)
+                if name == 'loc':
+                    loc = (child.text or '').strip()
+                elif name == 'lastmod':
+                    lastmod = parse_lastmod(child.text)
+            # Shopify puts the product's name in its image entry (<image:image><image:title>)
+            for child in element.iter():
+                if _local(child.tag) == 'title' and child.text:
+                    title = child.text.strip()
+                    break
+            if loc:
+                entries.append((_local(element.tag), loc, lastmod, title))
+            root.clear()  # Drop the elements read so far, the tree never holds more than one entry
+    except ParseError as e:
+        raise SitemapError(f'Unreadable sitemap: {e}')
+    return entries
+
+
+def read(url):
+    response = http_client.get_session().get(url, stream=True, timeout=http_client.TIMEOUT)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True  # Undo Content-Encoding as the body streams in
+        source = response.raw
+        if urlsplit(url).path.endswith('.gz'):
+            source = gzip.GzipFile(fileobj=source)
+        return parse(source)
+    finally:
+        response.close()
+
+
+# Child sitemaps worth reading: the product ones if the index names them, and only those next to the index
+# (a multi-language store's index also links /fr/sitemap_products_1.xml ..., the same products again)
+def _product_sitemaps(index_url, sitemaps):
+    directory = posixpath.dirname(urlsplit(index_url).path)
+    local = [loc for loc in sitemaps if posixpath.dirname(urlsplit(urljoin(index_url, loc)).path) == directory] or sitemaps
+    return [loc for loc in local if 'product' in urlsplit(loc).path.lower()] or local
+
+
+# Yield (url, lastmod, title) for every product the sitemap at `url` lists, following sitemap indexes
+# Each file is read through call(read, file_url) when given, e.g. the site's limiter so its limits cover sitemaps too
+def products(url, call=None, depth=0):
+    entries = call(read, url) if call else read(url)
+    sitemaps = [loc for kind, loc, _, _ in entries if kind == 'sitemap']
+    if depth < MAX_DEPTH:
+        for loc in _product_sitemaps(url, sitemaps):
+            yield from products(urljoin(url, loc), call, depth + 1)
+    for kind, loc, lastmod, title in entries:
+        if kind == 'url' and PRODUCT_PATH in urlsplit(loc).path:
+            yield loc, lastmod, title
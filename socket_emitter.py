@@ -0,0 +1,101 @@
+import time
+
+import eventlet
+
+# Socket.IO output for scrapes.
+# Products are coalesced into one `update` per batch (every `interval` seconds or `max_batch` products,
+# whichever comes first) instead of one message each, and progress events are throttled per key so a
+# fast crawl doesn't flood the browser. Both send to a room (the requesting client's sid) or broadcast
+# when room is None.
+
+PLACEHOLDERS = ('', 'N/A')
+
+
+def is_placeholder(value):
+    return value is None or (isinstance(value, str) and (value in PLACEHOLDERS or value.endswith(' not found')))
+
+
+# Drop fields that only hold a placeholder ('N/A', 'SKU not found', ...), the frontend fills those in itself
+def compact(data, fields=None):
+    return {key: value for key, value in data.items() if (fields is None or key in fields) and not is_placeholder(value)}
+
+
+class BatchEmitter:
+    def __init__(self, socketio, event='update', max_batch=50, interval=0.2):
+        self.socketio = socketio
+        self.event = event
+        self.max_batch = max_batch
+        self.interval = interval
+        self.buffers = {}  # room -> items waiting to be sent
+        self.timers = {}
+        self.batches = 0
+        self.items = 0
+
+    def add(self, item, room=None):
+        buffer = self.buffers.setdefault(room, [])
+        buffer.append(item)
+        if len(buffer) >= self.max_batch:
+            self.flush(room)
+        elif room not in self.timers:
+            self.timers[room] = eventlet.spawn_after(self.interval, self.flush, room)
+
+    # Send whatever is waiting for `room` now, e.g. before a message that has to arrive after the products
+    def flush(self, room=None):
+        timer = self.timers.pop(room, None)
+        if timer:
+            timer.cancel()  # No effect when the timer is what called us
+        items = self.buffers.pop(room, None)
+        if not items:
+            return
+        self.batches += 1
+        self.items += len(items)
+        self.socketio.emit(self.event, {
+            'message': f"Scraped {len(items)} products, latest: {items[-1].get('Title')}",
+            'products': items,
+        }, to=room)
+
+    def stats(self):
+        return {'batches': self.batches, 'items': self.items,
+                'pending': sum(len(items) for items in self.buffers.values())}
+
+
+class ThrottledEmitter:
+    # Sends at most one event per key every `interval` seconds; the latest data wins and is sent when the interval ends
+    def __init__(self, socketio, event, interval=0.5):
+        self.socketio = socketio
+        self.event = event
+        self.interval = interval
+        self.latest = {}
+        self.sent_at = {}
+        self.timers = {}
+        self.sent = 0
+        self.dropped = 0
+
+    # force=True sends right away (e.g. a status change the client shouldn't miss)
+    def emit(self, key, data, room=None, force=False):
+        if key in self.latest:
+            self.dropped += 1  # Superseded before it was sent
+        self.latest[key] = (data, room)
+        if force:
+            self._send(key)
+        elif key not in self.timers:
+            wait = self.sent_at.get(key, 0) + self.interval - time.monotonic()
+            if wait <= 0:
+                self._send(key)
+            else:
+                self.timers[key] = eventlet.spawn_after(wait, self._send, key)
+
+    def _send(self, key):
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        latest = self.latest.pop(key, None)
+        if latest is None:
+            return
+        data, room = latest
+        self.sent_at[key] = time.monotonic()
+        self.sent += 1
+        self.socketio.emit(self.event, data, to=room)
+
+    def stats(self):
+        return {'sent': self.sent, 'dropped': self.dropped}
@@ -0,0 +1,157 @@
+import pickle
+import socket
+import struct
+import sys
+from urllib.parse import urlparse
+
+import eventlet
+from eventlet.queue import Queue
+from eventlet.semaphore import Semaphore
+from socketio import PubSubManager
+
+# Message queue backends that let several Socket.IO worker processes share emits, rooms and broadcasts.
+#
+# Production deployments use one of the brokers Flask-SocketIO already knows (redis://, kafka://,
+# zmq+tcp://, or any kombu URL such as amqp://). Two small backends are added for tests and single
+# machine setups without a broker:
+#   memory://          every server in this process shares one in-process queue
+#   local://host:port  workers on this machine share a tiny fan-out broker (python socket_queue.py host:port)
+
+HEADER = struct.Struct('!I')
+SUBSCRIBE, PUBLISH_ONLY = b'S', b'P'
+
+
+# Keyword arguments for SocketIO(...) that select the backend for `url` (no url: a single process, no queue)
+def socketio_options(url, channel='flask-socketio'):
+    if not url:
+        return {}
+    if url.startswith('memory://'):
+        return {'client_manager': MemoryManager(url, channel=channel)}
+    if url.startswith('local://'):
+        return {'client_manager': LocalSocketManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+
+class MemoryManager(PubSubManager):
+    name = 'memory'
+    inboxes = {}  # channel -> inbox of every subscribed server in this process
+
+    def __init__(self, url='memory://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.inbox = Queue()
+        if not write_only:
+            MemoryManager.inboxes.setdefault(channel, []).append(self.inbox)
+
+    def _publish(self, data):
+        # Pickled like on a real broker, so no server shares a mutable payload with another
+        message = pickle.dumps(data)
+        for inbox in MemoryManager.inboxes.get(self.channel, []):
+            inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield self.inbox.get()
+
+
+def _read_frame(connection):
+    header = _read_exactly(connection, HEADER.size)
+    return _read_exactly(connection, HEADER.unpack(header)[0])
+
+
+def _read_exactly(connection, size):
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        data += chunk
+    return data
+
+
+def _frame(payload):
+    return HEADER.pack(len(payload)) + payload
+
+
+class LocalSocketManager(PubSubManager):
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:5555', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 5555)
+        self.connection = None
+        self.lock = Semaphore()
+
+    # One connection is used for publishing and listening; the first byte tells the broker whether we read from it
+    def _connection(self):
+        with self.lock:
+            if self.connection is None:
+                self.connection = socket.create_connection(self.address)
+                self.connection.sendall(PUBLISH_ONLY if self.write_only else SUBSCRIBE)
+            return self.connection
+
+    def _reset(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def _publish(self, data):
+        frame = _frame(pickle.dumps({'channel': self.channel, 'data': data}))
+        try:
+            connection = self._connection()
+            with self.lock:
+                connection.sendall(frame)
+        except OSError as e:
+            print(f"Socket.IO queue broker unreachable, event dropped: {e}")
+            self._reset()
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self._connection()
+                while True:
+                    message = pickle.loads(_read_frame(connection))
+                    if message.get('channel') == self.channel:
+                        yield message['data']
+            except (OSError, ConnectionError) as e:
+                print(f"Lost the Socket.IO queue broker, reconnecting: {e}")
+                self._reset()
+                eventlet.sleep(1)
+
+
+class SocketBroker:
+    # Fan out every frame a worker sends to every subscribed worker (the sender skips its own events)
+    def __init__(self, address):
+        self.address = address
+        self.subscribers = {}  # connection -> write lock
+
+    def serve(self):
+        listener = eventlet.listen(self.address)
+        print(f"Socket.IO queue broker listening on {self.address[0]}:{self.address[1]}")
+        while True:
+            connection, _ = listener.accept()
+            eventlet.spawn_n(self._handle, connection)
+
+    def _handle(self, connection):
+        try:
+            if _read_exactly(connection, 1) == SUBSCRIBE:
+                self.subscribers[connection] = Semaphore()
+            while True:
+                frame = _frame(_read_frame(connection))
+                for subscriber, lock in list(self.subscribers.items()):
+                    try:
+                        with lock:
+                            subscriber.sendall(frame)
+                    except OSError:
+                        self.subscribers.pop(subscriber, None)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.pop(connection, None)
+            connection.close()
+
+
+if __name__ == '__main__':
+    host, _, port = (sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:5555').rpartition(':')
+    SocketBroker((host or '127.0.0.1', int(port))).serve()
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Importing app opens its databases and caches, keep them (and any jobs they would resume) out of the checkout
+state = tempfile.mkdtemp(prefix='scraper-tests-')
+os.environ.update(
+    PRODUCT_DB=os.path.join(state, 'products.db'),
+    JOBS_DB=os.path.join(state, 'products.db'),
+    CATALOG_MIRROR_DB=os.path.join(state, 'products.db'),
+    FINGERPRINTS_PATH=os.path.join(state, 'fingerprints.json'),
+    HTTP_CACHE_DIR=os.path.join(state, 'http_cache'),
+    IMAGE_PROXY_DIR=os.path.join(state, 'image_cache'),
+    UPLOAD_FOLDER=os.path.join(state, 'uploads'),
+)
+os.environ.setdefault('WARM_UP', '0')
+os.environ.setdefault('PARSE_WORKERS', '0')
+os.environ.setdefault('BROWSER_FALLBACK', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1 @@
+{"id":7318153527382,"title":"ADIDAS ADIMATIC","handle":"adidas-adimatic-5","description":"<p>The adidas Adimatic returns with its chunky skate silhouette.</p>","published_at":"2024-03-14T10:02:11+11:00","created_at":"2024-03-14T10:02:09+11:00","vendor":"ADIDAS","type":"Mens","tags":["adidas","Mens","Shoes"],"price":15999,"price_min":15999,"price_max":15999,"available":true,"price_varies":false,"compare_at_price":null,"compare_at_price_min":0,"compare_at_price_max":0,"compare_at_price_varies":false,"variants":[{"id":41577367470166,"title":"Green \/ US 8","option1":"Green","option2":"US 8","option3":null,"sku":"GY2093-8","requires_shipping":true,"taxable":true,"featured_image":null,"available":true,"name":"ADIDAS ADIMATIC - Green \/ US 8","public_title":"Green \/ US 8","options":["Green","US 8"],"price":15999,"weight":1200,"compare_at_price":null,"inventory_management":"shopify","barcode":"4066749830612","requires_selling_plan":false,"selling_plan_allocations":[]},{"id":41577367502934,"title":"Green \/ US 9","option1":"Green","option2":"US 9","option3":null,"sku":"GY2093-9","requires_shipping":true,"taxable":true,"featured_image":null,"available":false,"name":"ADIDAS ADIMATIC - Green \/ US 9","public_title":"Green \/ US 9","options":["Green","US 9"],"price":15999,"weight":1200,"compare_at_price":null,"inventory_management":"shopify","barcode":"4066749830629","requires_selling_plan":false,"selling_plan_allocations":[]}],"images":["\/\/cdn.shopify.com\/s\/files\/1\/0526\/8143\/3174\/files\/GY2093-1.jpg?v=1710370932","\/\/cdn.shopify.com\/s\/files\/1\/0526\/8143\/3174\/files\/GY2093-2.jpg?v=1710370932"],"featured_image":"\/\/cdn.shopify.com\/s\/files\/1\/0526\/8143\/3174\/files\/GY2093-1.jpg?v=1710370932","options":["Color","Size"],"url":"\/products\/adidas-adimatic-5"}
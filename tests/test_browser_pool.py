@@ -0,0 +1,54 @@
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from browser_pool import BrowserPool
+
+
+class FakeDriver:
+    def __init__(self, error=None):
+        self.error = error
+        self.page_source = '<html></html>'
+        self.quit_called = False
+
+    def get(self, url):
+        if self.error:
+            raise self.error
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakePool(BrowserPool):
+    def __init__(self, errors, **options):
+        super().__init__(**options)
+        self.errors = list(errors)
+        self.drivers = []
+
+    def _launch(self):
+        driver = FakeDriver(self.errors.pop(0) if self.errors else None)
+        self.drivers.append(driver)
+        return driver
+
+
+def test_unexpected_error_frees_the_slot():
+    pool = FakePool([ConnectionError('chromedriver went away')], size=1)
+
+    with pytest.raises(ConnectionError):
+        pool.render('https://store.example/products/runner')
+
+    assert pool.running == 0
+    assert pool.drivers[0].quit_called
+    # The slot is free again, the next render starts a new browser instead of waiting forever
+    assert pool.render('https://store.example/products/runner') == '<html></html>'
+    assert pool.stats()['failed'] == 1
+
+
+def test_timeout_keeps_the_browser():
+    pool = FakePool([TimeoutException('slow page')], size=1)
+
+    with pytest.raises(TimeoutException):
+        pool.render('https://store.example/products/runner')
+
+    assert pool.running == 1
+    assert pool.idle.qsize() == 1
+    assert not pool.drivers[0].quit_called
@@ -0,0 +1,46 @@
+import time
+
+import requests
+
+from crawl_limiter import AdaptiveLimiter
+
+
+def response(status, retry_after=None):
+    page = requests.Response()
+    page.status_code = status
+    if retry_after is not None:
+        page.headers['Retry-After'] = retry_after
+    return page
+
+
+def test_throttle_pauses_the_site():
+    limiter = AdaptiveLimiter(8, 1, 32)
+    limiter.acquire()
+    limiter.release(429, 0.01, retry_after=0.2)
+
+    started = time.monotonic()
+    limiter.acquire()
+
+    assert time.monotonic() - started >= 0.2
+
+
+def test_throttled_request_is_retried_after_the_pause():
+    limiter = AdaptiveLimiter(8, 1, 32)
+    replies = [response(200), response(429, '0.05')]  # Popped from the end
+
+    started = time.monotonic()
+    result = limiter.call(replies.pop)
+
+    assert result.status_code == 200
+    assert time.monotonic() - started >= 0.05
+    assert limiter.stats()['retried'] == 1
+
+
+def test_throttle_halves_the_limit_down_to_the_minimum():
+    halved, floored = AdaptiveLimiter(8, 1, 32), AdaptiveLimiter(8, 8, 32)
+    for limiter in (halved, floored):
+        limiter.acquire()
+        limiter.release(429, 0.01, retry_after=0)
+
+    assert halved.limit == 4
+    assert floored.limit == 8
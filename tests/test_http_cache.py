@@ -0,0 +1,44 @@
+import os
+
+from http_cache import DiskLru
+
+
+def write(directory, name, size):
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    lru = DiskLru(str(tmp_path), 250, ('body', 'json'))
+    for key in ('a', 'b', 'c'):
+        write(tmp_path, f'{key}.body', 100)
+        write(tmp_path, f'{key}.json', 10)
+        lru.add(key, 100)
+    lru.touch('a')
+
+    assert lru.evict() == 1
+
+    assert 'b' not in lru and 'a' in lru and 'c' in lru
+    assert lru.total_bytes == 200
+    assert sorted(os.listdir(tmp_path)) == ['a.body', 'a.json', 'c.body', 'c.json']
+
+
+def test_busy_entries_are_kept(tmp_path):
+    lru = DiskLru(str(tmp_path), 150, ('img',))
+    for key in ('a', 'b'):
+        lru.add(key, 100)
+
+    assert lru.evict(busy={'a'}) == 1
+
+    assert list(lru.entries) == ['a']
+
+
+def test_found_files_add_up_per_entry(tmp_path):
+    write(tmp_path, 'a.img', 100)
+    write(tmp_path, 'a.w96', 20)
+    lru = DiskLru(str(tmp_path), 1000, ('img', 'w96'))
+    for name in ('a.img', 'a.w96'):
+        lru.found('a', os.stat(os.path.join(tmp_path, name)))
+
+    assert lru.entries['a'][1] == 120
+    assert lru.total_bytes == 120
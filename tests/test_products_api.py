@@ -0,0 +1,32 @@
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('limit, expected', [('0', 1), ('-5', 1), ('50', 50), ('5000', 1000)])
+def test_limit_is_clamped(monkeypatch, limit, expected):
+    limits = []
+    monkeypatch.setattr(app.product_store, 'page', lambda **options: (limits.append(options['limit']), ([], None))[1])
+
+    response = app.app.test_client().get(f'/products?limit={limit}')
+
+    assert response.status_code == 200
+    assert limits == [expected]
+
+
+def test_non_integer_limit_is_rejected():
+    response = app.app.test_client().get('/products?limit=ten')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'limit must be an integer'}
+
+
+@pytest.mark.parametrize('limit', ['ten', None, [5]])
+def test_bulk_upload_rejects_a_non_integer_limit(monkeypatch, limit):
+    monkeypatch.setitem(app.app.config, 'SHOPIFY_ADMIN_URL', 'http://127.0.0.1:1')
+    monkeypatch.setitem(app.app.config, 'SHOPIFY_ACCESS_TOKEN', 'token')
+
+    response = app.app.test_client().post('/upload-bulk', json={'limit': limit})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'status': 'failed', 'message': 'limit must be an integer'}
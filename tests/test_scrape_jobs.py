@@ -0,0 +1,67 @@
+import eventlet
+from eventlet.event import Event
+
+import scrape_jobs
+from product_store import ProductStore
+from scrape_jobs import JobManager
+
+STORE = 'store.example'
+
+
+# The worker dies (a crash, a restart) after a checkpoint but before the product store wrote its batch
+def test_resume_after_crash_between_checkpoint_and_store_flush(tmp_path):
+    db = str(tmp_path / 'products.db')
+    store = ProductStore(db, batch_size=50)
+    finished = scrape_jobs.CHECKPOINT_BATCH + 5
+    reached = Event()
+
+    def runner(job):
+        for i in range(finished):
+            store.add({'id': f'product-{i}', 'Title': f'Product {i}'}, STORE)
+            job.mark_done(f'/products/product-{i}')
+        reached.send()
+        eventlet.sleep(3600)
+
+    manager = JobManager(db, runner, workers=1, before_checkpoint=lambda job: store.flush())
+    manager.submit({'url': f'https://{STORE}/collections/all'})
+    reached.wait()
+    for worker in manager.workers:
+        worker.kill()
+    # Whatever the store still held in memory is lost with the process
+
+    restarted = JobManager(db, lambda job: None, workers=0)
+    (job,) = restarted.jobs.values()
+    stored = ProductStore(db)
+
+    assert len(job.completed_keys) == scrape_jobs.CHECKPOINT_BATCH
+    # Every product the resumed job will skip is in the store
+    for key in job.completed_keys:
+        assert stored.get(key.rsplit('/', 1)[-1], STORE) is not None
+
+
+def test_cancel_and_failure_write_the_store(tmp_path):
+    db = str(tmp_path / 'products.db')
+    store = ProductStore(db, batch_size=50)
+    started = Event()
+
+    def runner(job):
+        store.add({'id': 'product-0', 'Title': 'Product 0'}, STORE)
+        job.mark_done('/products/product-0')
+        if job.params['fail']:
+            raise RuntimeError('store went away')
+        started.send()
+        while True:
+            job.check_cancelled()
+            eventlet.sleep(0.01)
+
+    manager = JobManager(db, runner, workers=1, before_checkpoint=lambda job: store.flush())
+    failed = manager.submit({'fail': True})
+    cancelled = manager.submit({'fail': False})
+    started.wait()
+    manager.cancel(cancelled.id)
+    while cancelled.status != 'cancelled':
+        eventlet.sleep(0.01)
+
+    assert failed.status == 'failed'
+    assert store.pending == []
+    assert ProductStore(db).get('product-0', STORE) is not None
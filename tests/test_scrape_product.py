@@ -0,0 +1,65 @@
+import requests
+
+import app
+from browser_pool import BrowserUnavailable
+
+
+class NoBrowser:
+    def render(self, url, wait_for=None):
+        raise BrowserUnavailable('chrome not installed')
+
+
+def response(url, body):
+    page = requests.Response()
+    page.status_code = 200
+    page.url = url
+    page._content = body.encode()
+    return page
+
+
+def test_keeps_static_product_when_browser_unavailable(monkeypatch):
+    monkeypatch.setattr(app, 'browser_pool', NoBrowser())
+    monkeypatch.setattr(app.parse_pool, 'parse', lambda content, brand, fast, adapter: ({'Title': 'Runner', 'Brand': brand}, 0.01))
+
+    product = app.scrape_product(response('https://store.example/products/runner', '<html></html>'), 'Acme')
+
+    assert product == {'Title': 'Runner', 'Brand': 'Acme'}
+
+
+def test_uses_rendered_product_when_static_page_has_no_data(monkeypatch):
+    class Browser:
+        def render(self, url, wait_for=None):
+            return '<html>rendered</html>'
+
+    def parse(content, brand, fast, adapter):
+        if content == '<html>rendered</html>':
+            return {'Title': 'Runner', 'SKU': 'RUN-8'}, 0.01
+        return {'Title': 'Runner'}, 0.01
+
+    monkeypatch.setattr(app, 'browser_pool', Browser())
+    monkeypatch.setattr(app.parse_pool, 'parse', parse)
+
+    product = app.scrape_product(response('https://store.example/products/runner', '<html></html>'), 'Acme')
+
+    assert product == {'Title': 'Runner', 'SKU': 'RUN-8'}
+
+
+def test_render_holds_a_site_slot(monkeypatch):
+    adapter = app.site_adapters.adapter_for('https://store.example/products/runner')
+    limiter = app.site_limiter(adapter)
+    in_flight = []
+
+    class Browser:
+        def render(self, url, wait_for=None):
+            in_flight.append(limiter.in_flight)
+            return '<html>rendered</html>'
+
+    monkeypatch.setattr(app, 'browser_pool', Browser())
+    monkeypatch.setattr(app.parse_pool, 'parse', lambda content, brand, fast, adapter: ({'Title': 'Runner', 'SKU': 'RUN-8'}, 0.01))
+    limit = limiter.limit
+
+    app.render_product_page('https://store.example/products/runner', 'Acme', adapter)
+
+    assert in_flight == [1]
+    assert limiter.in_flight == 0
+    assert limiter.limit == limit  # A slow render isn't taken for a struggling store
@@ -0,0 +1,190 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import shopify_bulk
+from catalog_mirror import CatalogMirror
+from shopify_bulk import ShopifyBulkClient, ShopifyBulkError
+
+SHIPPING = {'Shipping weight': '1 kg', 'Shipping policy': 'Flat rate', 'Returns and refunds policy': '30 days'}
+
+
+# Stand-in for the Admin GraphQL endpoint, the staged upload target and the result file.
+# GraphQL requests get the scripted replies in order: (status, headers, body).
+class MockShopify(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/staged-upload':
+            server.staged.append(body)
+            return self._reply(201, b'')
+        server.graphql.append(json.loads(body))
+        status, headers, reply = server.replies.pop(0)
+        self._reply(status, reply, headers)
+
+    def do_GET(self):
+        self._reply(200, self.server.result_file.encode())
+
+
+@pytest.fixture
+def shopify():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockShopify)
+    server.replies, server.graphql, server.staged, server.result_file = [], [], [], ''
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def data(payload):
+    return 200, {}, {'data': payload}
+
+
+def staged_target(server):
+    return data({'stagedUploadsCreate': {'userErrors': [], 'stagedTargets': [{
+        'url': server.url + '/staged-upload', 'resourceUrl': None,
+        'parameters': [{'name': 'key', 'value': 'tmp/bulk/products.jsonl'}, {'name': 'acl', 'value': 'private'}],
+    }]}})
+
+
+def operation(status, url=None):
+    return data({'node': {'id': 'gid://shopify/BulkOperation/1', 'status': status, 'errorCode': None,
+                          'objectCount': '3', 'url': url, 'partialDataUrl': None}})
+
+
+def started():
+    return data({'bulkOperationRunMutation': {'userErrors': [], 'bulkOperation': {'id': 'gid://shopify/BulkOperation/1', 'status': 'CREATED'}}})
+
+
+def throttled():
+    return 200, {}, {'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}]}
+
+
+def product(title, sku, size='8'):
+    return {'Title': title, 'Brand': 'Acme', 'Product detail': f'{title} shoe',
+            'Variants': [{'Size': size, 'SKU': sku, 'Barcode': f'{sku}-barcode', 'Weight': 300}]}
+
+
+def test_stage_run_wait(shopify, tmp_path):
+    staging = tmp_path / 'bulk.jsonl'
+    staging.write_text('{"input": {"title": "Runner"}}\n')
+    shopify.replies = [
+        (429, {'Retry-After': '0.05'}, {'errors': 'Exceeded 2 calls per second'}),
+        staged_target(shopify),
+        throttled(),
+        started(),
+        operation('CREATED'),
+        operation('RUNNING'),
+        operation('COMPLETED', shopify.url + '/results.jsonl'),
+    ]
+    client = ShopifyBulkClient(shopify.url, 'token')
+
+    key = client.stage(str(staging))
+    operation_id = client.run(key)
+    seen = []
+    finished = client.wait(operation_id, poll_interval=0, progress=lambda op: seen.append(op['status']))
+
+    assert key == 'tmp/bulk/products.jsonl'
+    assert b'{"input": {"title": "Runner"}}' in shopify.staged[0]
+    assert b'private' in shopify.staged[0]  # The target's form parameters go with the file
+    assert operation_id == 'gid://shopify/BulkOperation/1'
+    assert seen == ['CREATED', 'RUNNING', 'COMPLETED']
+    assert finished['url'] == shopify.url + '/results.jsonl'
+    # The 429 and the THROTTLED reply were each sent again
+    assert [r['query'].split('(')[0].split()[-1] for r in shopify.graphql] == [
+        'stagedUploadsCreate', 'stagedUploadsCreate', 'bulkOperationRunMutation', 'bulkOperationRunMutation',
+        'bulkOperation', 'bulkOperation', 'bulkOperation']
+    assert shopify.graphql[2]['variables']['stagedUploadPath'] == key
+
+
+def test_gives_up_when_throttled_too_often(shopify):
+    shopify.replies = [(429, {'Retry-After': '0'}, {})] * 3
+    client = ShopifyBulkClient(shopify.url, 'token')
+
+    with pytest.raises(ShopifyBulkError):
+        client.graphql(shopify_bulk.POLL_QUERY, {'id': 'gid://shopify/BulkOperation/1'}, max_attempts=3)
+
+
+def test_run_reports_user_errors(shopify):
+    shopify.replies = [data({'bulkOperationRunMutation': {
+        'userErrors': [{'field': None, 'message': 'A bulk mutation operation is already in progress'}], 'bulkOperation': None}})]
+    client = ShopifyBulkClient(shopify.url, 'token')
+
+    with pytest.raises(ShopifyBulkError):
+        client.run('tmp/bulk/products.jsonl')
+
+
+def test_bulk_upload_maps_results_by_line_number(shopify, tmp_path, monkeypatch):
+    monkeypatch.setattr(shopify_bulk, 'STAGING_DIR', str(tmp_path))
+    mirror = CatalogMirror(str(tmp_path / 'mirror.db'))
+    unchanged = product('Walker', 'WALK-8')
+    changed = product('Trail', 'TRAIL-8')
+    new = product('Runner', 'RUN-8')
+    rejected = product('Racer', 'RACE-8')
+    mirror.record('gid://shopify/Product/1', unchanged, variant_ids={'WALK-8': 'gid://shopify/ProductVariant/10'})
+    mirror.record('gid://shopify/Product/2', changed, variant_ids={'TRAIL-8': 'gid://shopify/ProductVariant/20'})
+    changed['Variants'][0]['Barcode'] = 'TRAIL-8-new'
+
+    # Staged in product order without the skipped one: Trail is line 0, Runner line 1, Racer line 2.
+    # Shopify doesn't promise any order in the result file.
+    shopify.result_file = '\n'.join(json.dumps(line) for line in [
+        {'data': {'productSet': {'product': None, 'userErrors': [{'field': ['input', 'title'], 'message': 'Title is taken'}]}},
+         '__lineNumber': 2},
+        {'data': {'productSet': {'product': {'id': 'gid://shopify/Product/3', 'handle': 'runner', 'variants': {
+            'nodes': [{'id': 'gid://shopify/ProductVariant/30', 'sku': 'RUN-8'}]}}, 'userErrors': []}},
+         '__lineNumber': 1},
+        {'data': {'productSet': {'product': {'id': 'gid://shopify/Product/2', 'handle': 'trail', 'variants': {
+            'nodes': [{'id': 'gid://shopify/ProductVariant/20', 'sku': 'TRAIL-8'}]}}, 'userErrors': []}},
+         '__lineNumber': 0},
+    ]) + '\n'
+    shopify.replies = [staged_target(shopify), started(), operation('COMPLETED', shopify.url + '/results.jsonl')]
+    client = ShopifyBulkClient(shopify.url, 'token')
+
+    upload = shopify_bulk.bulk_upload(client, [unchanged, changed, new, rejected], SHIPPING, poll_interval=0, mirror=mirror)
+
+    results = upload['results']
+    assert [r['status'] for r in results] == ['skipped', 'updated', 'uploaded', 'failed']
+    assert results[0]['product_id'] == 'gid://shopify/Product/1'
+    assert results[1]['product_id'] == 'gid://shopify/Product/2'
+    assert results[2]['product_id'] == 'gid://shopify/Product/3'
+    assert results[2]['handle'] == 'runner'
+    assert results[3]['errors'] == [{'field': ['input', 'title'], 'message': 'Title is taken'}]
+
+    staged = [json.loads(line)['input'] for line in shopify.staged[0].decode().splitlines() if line.startswith('{"input"')]
+    assert [line['title'] for line in staged] == ['Trail', 'Runner', 'Racer']
+    assert staged[0]['id'] == 'gid://shopify/Product/2'
+    assert staged[0]['variants'][0]['id'] == 'gid://shopify/ProductVariant/20'
+
+    # The mirror learnt the new product, so it is skipped next time
+    assert mirror.plan(new)[0] == 'skip'
+    assert mirror.plan(changed)[0] == 'skip'
+    assert list(tmp_path.glob('*.jsonl')) == []  # The staging file is gone once Shopify has it
+
+
+def test_bulk_upload_skips_everything_unchanged(shopify, tmp_path):
+    mirror = CatalogMirror(str(tmp_path / 'mirror.db'))
+    unchanged = product('Walker', 'WALK-8')
+    mirror.record('gid://shopify/Product/1', unchanged)
+    client = ShopifyBulkClient(shopify.url, 'token')
+
+    upload = shopify_bulk.bulk_upload(client, [unchanged], SHIPPING, mirror=mirror)
+
+    assert upload['operation'] is None
+    assert upload['results'][0]['status'] == 'skipped'
+    assert shopify.graphql == []
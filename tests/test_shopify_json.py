@@ -0,0 +1,50 @@
+import json
+import os
+
+from product_store import ProductStore
+from shopify_json import to_product
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+def test_listing_maps_availability_to_stock():
+    adimatic, samba = [to_product(data, 'adidas') for data in fixture('products.json')['products']]
+
+    assert adimatic['Title'] == 'ADIDAS ADIMATIC'
+    assert adimatic['Color'] == 'Green'
+    assert [v['Size'] for v in adimatic['Variants']] == ['US 8', 'US 9']
+    assert [v['Available'] for v in adimatic['Variants']] == [True, False]
+    # Sold out is known to be 0, an available variant's count isn't published
+    assert [v['Quantity'] for v in adimatic['Variants']] == ['Quantity not found', 0]
+    assert adimatic['Available'] is True
+    assert samba['Available'] is False
+    assert samba['Quantity'] == '0'
+    # products.json has no barcodes, that's what the .js details are fetched for
+    assert adimatic['Barcode'] == 'Barcode not found'
+    assert adimatic['Image'].endswith('GY2093-2.jpg?v=1710370932')
+
+
+def test_details_fill_in_barcodes():
+    product = to_product(fixture('adidas-adimatic-5.js'), 'adidas')
+
+    assert [v['Barcode'] for v in product['Variants']] == ['4066749830612', '4066749830629']
+    assert product['Barcode'] == '4066749830612'
+    assert [v['Available'] for v in product['Variants']] == [True, False]
+    assert product['Gender'] == 'Mens'
+    assert product['Image'] == 'https://cdn.shopify.com/s/files/1/0526/8143/3174/files/GY2093-2.jpg?v=1710370932'
+
+
+def test_in_stock_filter_uses_availability(tmp_path):
+    store = ProductStore(str(tmp_path / 'products.db'))
+    for data in fixture('products.json')['products']:
+        store.add(to_product(data, 'adidas'), 'usgstore.com.au')
+    store.flush()
+
+    in_stock, _ = store.page(in_stock=True)
+
+    assert [product['Title'] for product in in_stock] == ['ADIDAS ADIMATIC']
@@ -0,0 +1,114 @@
+import eventlet
+
+eventlet.monkey_patch()  # As app.py does, the managers' sockets have to be cooperative
+
+import logging
+import socket
+import time
+import uuid
+
+import pytest
+
+from socket_queue import LocalSocketManager, MemoryManager, SocketBroker
+
+
+class Server:
+    logger = logging.getLogger('socket_queue_test')
+
+    def start_background_task(self, target, *args, **kwargs):
+        return eventlet.spawn(target, *args, **kwargs)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        eventlet.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def start():
+    managers = []
+
+    # Attach `manager` to a server and record the emits it would send to its own clients
+    def start(manager):
+        manager.received = []
+        manager._handle_emit = lambda message: manager.received.append((message['event'], message['data']))
+        manager.set_server(Server())
+        manager.initialize()
+        managers.append(manager)
+        return manager
+
+    yield start
+    for manager in managers:
+        if getattr(manager, 'thread', None):
+            manager.thread.kill()
+        if isinstance(manager, LocalSocketManager):
+            manager._reset()
+
+
+@pytest.fixture
+def broker():
+    address = ('127.0.0.1', free_port())
+    thread = eventlet.spawn(SocketBroker(address).serve)
+    eventlet.sleep(0.05)
+    yield f'local://{address[0]}:{address[1]}'
+    thread.kill()
+
+
+def test_memory_emit_reaches_every_server(start):
+    channel = uuid.uuid4().hex
+    first, second = start(MemoryManager(channel=channel)), start(MemoryManager(channel=channel))
+
+    first.emit('update', {'message': 'Scraped 1 products'})
+
+    assert wait_for(lambda: second.received)
+    eventlet.sleep(0.05)
+    assert first.received == second.received == [('update', {'message': 'Scraped 1 products'})]
+
+
+def test_local_emit_reaches_every_worker(start, broker):
+    first, second = start(LocalSocketManager(broker)), start(LocalSocketManager(broker))
+    publisher = start(LocalSocketManager(broker, write_only=True))
+    assert wait_for(lambda: first.connection is not None and second.connection is not None)
+
+    first.emit('update', {'message': 'from the first worker'})
+    publisher.emit('status', {'status': 'done'})
+
+    assert wait_for(lambda: len(first.received) == 2 and len(second.received) == 2)
+    assert first.received == second.received == [('update', {'message': 'from the first worker'}),
+                                                  ('status', {'status': 'done'})]
+    assert publisher.received == [('status', {'status': 'done'})]  # Write only, it never listens
+
+
+def test_local_emit_without_a_broker_still_reaches_own_clients(start, capsys):
+    url = f'local://127.0.0.1:{free_port()}'
+    manager = start(LocalSocketManager(url, write_only=True))
+
+    manager.emit('update', {'message': 'nobody is listening'})
+
+    assert manager.received == [('update', {'message': 'nobody is listening'})]
+    assert manager.connection is None
+    assert 'event dropped' in capsys.readouterr().out
+
+
+def test_local_worker_reconnects_once_the_broker_is_up(start):
+    address = ('127.0.0.1', free_port())
+    url = f'local://{address[0]}:{address[1]}'
+    listener = start(LocalSocketManager(url))
+    eventlet.sleep(0.05)  # Its first connection attempt fails
+    broker = eventlet.spawn(SocketBroker(address).serve)
+    try:
+        assert wait_for(lambda: listener.connection is not None)
+        start(LocalSocketManager(url, write_only=True)).emit('update', {'message': 'back'})
+
+        assert wait_for(lambda: listener.received)
+        assert listener.received == [('update', {'message': 'back'})]
+    finally:
+        broker.kill()
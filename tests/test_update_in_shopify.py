@@ -0,0 +1,108 @@
+import itertools
+
+import pytest
+import shopify
+
+import app
+from catalog_mirror import CatalogMirror
+
+
+# Resources need a site to build their paths, nothing is sent: the store below stands in for Shopify
+@pytest.fixture(autouse=True)
+def session():
+    shopify.ShopifyResource.activate_session(shopify.Session('test-store.myshopify.com', '2024-01', 'token'))
+    yield
+    shopify.ShopifyResource.clear_session()
+
+
+# Variants of product 1 as Shopify has them, and every save the update makes
+@pytest.fixture
+def store(monkeypatch):
+    store = {'variants': {'RUN-8': 10}, 'saved': []}
+    ids = itertools.count(30)
+
+    def save(variant):
+        attributes = dict(variant.attributes, **variant._prefix_options)
+        if 'id' not in variant.attributes:
+            variant.id = next(ids)
+            store['variants'][variant.sku] = variant.id
+        store['saved'].append(attributes)
+
+    def find(cls, id_=None, **options):
+        return [shopify.Variant({'id': variant_id, 'sku': sku}) for sku, variant_id in store['variants'].items()]
+
+    monkeypatch.setattr(shopify.Product, 'save', lambda self: store['saved'].append(self.attributes.copy()))
+    monkeypatch.setattr(shopify.Variant, 'save', save)
+    monkeypatch.setattr(shopify.Variant, 'find', classmethod(find))
+    return store
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    mirror = CatalogMirror(str(tmp_path / 'mirror.db'))
+    monkeypatch.setattr(app, 'catalog_mirror', mirror)
+    return mirror
+
+
+def sync(mirror, product):
+    action, existing_id, changes = mirror.plan(product)
+    if action == 'update':
+        app.update_in_shopify(existing_id, changes, product, None)
+    return action
+
+
+def test_update_adds_new_size(mirror, store):
+    product = {'Title': 'Runner', 'Brand': 'Acme', 'Product detail': 'Shoe',
+               'Variants': [{'SKU': 'RUN-8', 'Barcode': '111', 'Weight': 300}]}
+    mirror.record('gid://shopify/Product/1', product, variant_ids={'RUN-8': 'gid://shopify/ProductVariant/10'})
+
+    product['Variants'].append({'SKU': 'RUN-9', 'Barcode': '222', 'Weight': 310})
+    action, existing_id, changes = mirror.plan(product)
+    assert action == 'update'
+    assert changes['variants']['RUN-9']['id'] is None
+
+    app.update_in_shopify(existing_id, changes, product, None)
+
+    assert store['saved'] == [{'product_id': '1', 'sku': 'RUN-9', 'option1': 'RUN-9', 'price': '199.99',
+                               'barcode': '222', 'weight': 310.0, 'weight_unit': 'g'}]
+    assert mirror.plan(product)[0] == 'skip'
+
+
+def test_new_size_is_not_created_again_on_the_next_sync(mirror, store):
+    product = {'Title': 'Runner', 'Brand': 'Acme', 'Variants': [{'SKU': 'RUN-8', 'Barcode': '111'}]}
+    mirror.record('gid://shopify/Product/1', product, variant_ids={'RUN-8': 'gid://shopify/ProductVariant/10'})
+
+    product['Variants'].append({'SKU': 'RUN-9', 'Barcode': '222'})
+    assert sync(mirror, product) == 'update'
+    product['Variants'][1]['Barcode'] = '333'
+    assert sync(mirror, product) == 'update'
+
+    created = [saved for saved in store['saved'] if 'id' not in saved]
+    assert len(created) == 1
+    assert store['saved'][-1] == {'id': '30', 'product_id': '1', 'barcode': '333'}
+
+
+def test_placeholder_id_is_looked_up_by_sku(mirror, store):
+    # Recorded without Shopify's variant id, e.g. by an older upload
+    product = {'Title': 'Runner', 'Brand': 'Acme', 'Variants': [{'SKU': 'RUN-8', 'Barcode': '111'}]}
+    mirror.record('gid://shopify/Product/1', product)
+
+    product['Variants'][0]['Barcode'] = '333'
+    action, existing_id, changes = mirror.plan(product)
+    assert changes['variants']['RUN-8']['id'] is None
+
+    app.update_in_shopify(existing_id, changes, product, None)
+
+    assert store['saved'] == [{'id': '10', 'product_id': '1', 'barcode': '333'}]
+    # The real id replaces the placeholder
+    assert mirror._load('gid://shopify/Product/1')['variants']['RUN-8']['id'] == 'gid://shopify/ProductVariant/10'
+
+
+def test_update_changes_existing_size(mirror, store):
+    product = {'Title': 'Runner', 'Brand': 'Acme', 'Variants': [{'SKU': 'RUN-8', 'Barcode': '111'}]}
+    mirror.record('gid://shopify/Product/1', product, variant_ids={'RUN-8': 'gid://shopify/ProductVariant/10'})
+
+    product['Variants'][0]['Barcode'] = '333'
+    sync(mirror, product)
+
+    assert store['saved'] == [{'id': '10', 'product_id': '1', 'barcode': '333'}]
@@ -0,0 +1,32 @@
+import app
+
+
+def test_upload_looks_up_stored_product(monkeypatch):
+    stored = {'Title': 'Runner', 'SKU': 'RUN-8'}
+    queued = []
+    monkeypatch.setattr(app, 'connect_to_shopify', lambda *args: None)
+    monkeypatch.setattr(app.upload_queue, 'submit', lambda *args: queued.append(args) or 1)
+    monkeypatch.setattr(app.product_store, 'get', lambda product_id, store=None: stored if product_id == '7' else None)
+
+    response = app.app.test_client().post('/upload', json={'product_id': '7', 'sku': 'RUN-8'})
+
+    assert response.status_code == 202
+    assert queued[0][:2] == (stored, 'RUN-8')
+
+
+def test_upload_of_unknown_product_is_not_found(monkeypatch):
+    monkeypatch.setattr(app.product_store, 'find_by_sku', lambda sku: [])
+
+    response = app.app.test_client().post('/upload', json={'sku': 'NOPE'})
+
+    assert response.status_code == 404
+
+
+def test_upload_status(monkeypatch):
+    monkeypatch.setattr(app.upload_queue, 'uploads', {'abc': {'status': 'failed', 'error': 'Title is taken', 'result': None}})
+    client = app.app.test_client()
+
+    response = client.get('/upload/abc')
+
+    assert response.get_json() == {'upload_id': 'abc', 'status': 'failed', 'error': 'Title is taken', 'product_id': None}
+    assert client.get('/upload/unknown').status_code == 404
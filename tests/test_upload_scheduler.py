@@ -0,0 +1,72 @@
+import eventlet
+
+from upload_scheduler import LeakyBucket, UploadScheduler
+
+
+class Throttled(Exception):
+    def __init__(self):
+        super().__init__('429 Too Many Requests')
+        self.response = type('Response', (), {'code': 429, 'headers': {'Retry-After': '0.01'}})()
+
+
+def wait_for(scheduler, upload_id):
+    while scheduler.status(upload_id)['status'] in ('queued', 'running'):
+        eventlet.sleep(0.01)
+    return scheduler.status(upload_id)
+
+
+def test_throttled_call_is_retried_alone():
+    calls = []
+    replies = {'metafield': [Throttled(), None]}
+
+    def upload(scheduler, title):
+        def create():
+            calls.append('create')
+            return 7
+
+        def add_metafield():
+            calls.append('metafield')
+            reply = replies['metafield'].pop(0)
+            if reply:
+                raise reply
+
+        product_id = scheduler.call(create)
+        scheduler.call(add_metafield)
+        return product_id
+
+    scheduler = UploadScheduler(lambda *args: upload(scheduler, *args), workers=1, bucket=LeakyBucket(leak_rate=100))
+    upload_id = scheduler.submit('Runner')
+
+    status = wait_for(scheduler, upload_id)
+
+    # The product was created once, only the throttled metafield call ran again
+    assert calls == ['create', 'metafield', 'metafield']
+    assert status == {'status': 'done', 'error': None, 'result': 7}
+    assert scheduler.stats()['throttled'] == 1
+
+
+def test_failed_upload_reports_its_error():
+    def upload(title):
+        raise ValueError('Title is taken')
+
+    scheduler = UploadScheduler(upload, workers=1)
+    upload_id = scheduler.submit('Runner')
+
+    assert wait_for(scheduler, upload_id)['status'] == 'failed'
+    assert scheduler.status(upload_id)['error'] == 'Title is taken'
+    assert scheduler.stats()['failed'] == 1
+
+
+def test_gives_up_after_max_attempts():
+    attempts = []
+
+    def always_throttled():
+        attempts.append(1)
+        raise Throttled()
+
+    scheduler = UploadScheduler(lambda: scheduler.call(always_throttled), workers=1, max_attempts=3,
+                                bucket=LeakyBucket(leak_rate=100))
+    upload_id = scheduler.submit()
+
+    assert wait_for(scheduler, upload_id)['status'] == 'failed'
+    assert len(attempts) == 3
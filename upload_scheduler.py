@@ -0,0 +1,184 @@
+import time
+import uuid
+from collections import deque
+
+import eventlet
+from eventlet.queue import Queue
+
+# Concurrent Shopify uploads paced by a leaky bucket that mirrors Shopify's own rate limiter.
+#
+# REST: every response carries X-Shopify-Shop-Api-Call-Limit ("used/size", leaks 2 calls/s on standard plans).
+# GraphQL: every response carries extensions.cost.throttleStatus (maximumAvailable, currentlyAvailable, restoreRate).
+# The bucket is resynced from that feedback after each call, workers wait for room before calling,
+# and a 429 pauses the whole bucket for Retry-After seconds before the call is retried.
+# An upload is several calls (create the product, then its metafields ...) and isn't idempotent: once the
+# first call went through the product exists. So only the throttled call is retried, never the whole upload.
+
+CALL_LIMIT_HEADER = 'X-Shopify-Shop-Api-Call-Limit'
+
+
+def _header(headers, name):
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+class LeakyBucket:
+    def __init__(self, capacity=40, leak_rate=2.0, headroom=2):
+        self.capacity = capacity
+        self.leak_rate = leak_rate  # Units drained per second
+        self.headroom = headroom  # Units kept free for requests we don't schedule (e.g. the UI)
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    # Wait (cooperatively) until `cost` fits in the bucket, then take it
+    def acquire(self, cost=1):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                eventlet.sleep(self.paused_until - now)
+                continue
+            self._leak()
+            if self.level + cost <= self.capacity - self.headroom:
+                self.level += cost
+                return
+            eventlet.sleep((self.level + cost - (self.capacity - self.headroom)) / self.leak_rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Resync from "used/size" (REST call limit header)
+    def update_from_call_limit(self, value):
+        try:
+            used, size = (int(part) for part in value.split('/'))
+        except (AttributeError, ValueError):
+            return
+        self._leak()
+        self.capacity = size
+        self.level = float(used)
+
+    # Resync from a GraphQL response body's extensions.cost.throttleStatus
+    def update_from_graphql(self, body):
+        status = ((body or {}).get('extensions') or {}).get('cost', {}).get('throttleStatus')
+        if not status:
+            return
+        self._leak()
+        self.capacity = status['maximumAvailable']
+        self.level = float(status['maximumAvailable'] - status['currentlyAvailable'])
+        self.leak_rate = float(status['restoreRate'])
+
+
+# Last REST response seen by the ShopifyAPI (pyactiveresource) connection
+def rest_call_limit():
+    import shopify
+    response = getattr(shopify.ShopifyResource.connection, 'response', None)
+    return _header(getattr(response, 'headers', None), CALL_LIMIT_HEADER)
+
+
+# Seconds to wait if `error` (an exception carrying a response, or a response) is a 429 from Shopify, otherwise None
+def retry_after(error, default=2.0):
+    response = getattr(error, 'response', error)
+    code = getattr(response, 'code', None) or getattr(response, 'status_code', None)
+    if code != 429:
+        return None
+    try:
+        return float(_header(getattr(response, 'headers', None), 'Retry-After'))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_TRACKED = 1000  # Finished uploads whose status stays available
+
+
+class UploadScheduler:
+    # upload_fn(*args) does one upload, making each of its API calls through call();
+    # after_call(bucket) runs after every call to resync the bucket
+    def __init__(self, upload_fn, workers=4, bucket=None, after_call=None, max_attempts=5, on_done=None):
+        self.upload_fn = upload_fn
+        self.bucket = bucket or LeakyBucket()
+        self.after_call = after_call
+        self.max_attempts = max_attempts
+        self.on_done = on_done  # on_done(args, result, error)
+        self.queue = Queue()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.finished_at = deque(maxlen=500)  # Completion times for the throughput window
+        self.uploads = {}  # upload id -> {'status': 'queued' | 'running' | 'done' | 'failed', 'error', 'result'}
+        self.finished = deque()  # Ids of finished uploads, oldest first
+        self.workers = [eventlet.spawn(self._work) for _ in range(workers)]
+
+    # Queue an upload, returns its id for status()
+    def submit(self, *args):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {'status': 'queued', 'error': None, 'result': None}
+        self.queue.put((upload_id, args))
+        return upload_id
+
+    def status(self, upload_id):
+        return self.uploads.get(upload_id)
+
+    # Make one API call of an upload once the bucket has room; a 429 pauses the bucket and retries this call only
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                wait = retry_after(e)
+                if wait is None or attempt == self.max_attempts - 1:
+                    raise
+                self.throttled += 1
+                print(f"Shopify throttled the call, retrying in {wait}s")
+                self.bucket.pause(wait)
+            finally:
+                if self.after_call:
+                    self.after_call(self.bucket)
+
+    def _work(self):
+        while True:
+            upload_id, args = self.queue.get()
+            upload = self.uploads[upload_id]
+            upload['status'] = 'running'
+            self.in_flight += 1
+            result, error = None, None
+            try:
+                result = self.upload_fn(*args)
+            except Exception as e:
+                error = e
+            self.in_flight -= 1
+            if error:
+                self.failed += 1
+                print(f"Upload failed: {error}")
+                upload.update(status='failed', error=str(error))
+            else:
+                self.completed += 1
+                self.finished_at.append(time.monotonic())
+                upload.update(status='done', result=result)
+            self.finished.append(upload_id)
+            while len(self.finished) > MAX_TRACKED:
+                self.uploads.pop(self.finished.popleft(), None)
+            if self.on_done:
+                self.on_done(args, result, error)
+
+    def stats(self, window=60):
+        now = time.monotonic()
+        recent = [t for t in self.finished_at if now - t <= window]
+        span = now - recent[0] if len(recent) > 1 else window
+        return {
+            'queue_depth': self.queue.qsize(),
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'throttled': self.throttled,
+            'uploads_per_sec': round(len(recent) / span, 2) if recent else 0.0,
+            'bucket': {'level': round(self.bucket.level, 1), 'capacity': self.bucket.capacity, 'leak_rate': self.bucket.leak_rate},
+        }